@@ -81,20 +81,12 @@ if __name__ == "__main__":
     me = result.update["id"]
     print(result.update)
 
-    # get chats
-    result = tg.get_chats(limit=100)
-    result.wait()
-    chats = result.update["chat_ids"]
-
-    # get each chat
+    # get all the chats
     print("Chat List")
     chat_map = {}
-    for chat_id in chats:
-        r = tg.get_chat(chat_id)
-        r.wait()
-        title = r.update["title"]
-        print(f"  {chat_id:20d}\t{title}")
-        chat_map[chat_id] = r.update
+    for chat in tg.load_all_chats():
+        print(f"  {chat['id']:20d}\t{chat['title']}")
+        chat_map[chat["id"]] = chat
 
     selected = int(input("Select a group to clear: ").strip())
     chat_info = chat_map[selected]
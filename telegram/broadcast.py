@@ -0,0 +1,248 @@
+"""Sending the same message to many chats."""
+
+from __future__ import annotations
+
+import heapq
+import json
+import logging
+import queue
+import time
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Future
+from pathlib import Path
+from typing import IO, TYPE_CHECKING, Any
+
+from telegram.utils import AsyncResult, get_retry_after
+
+if TYPE_CHECKING:
+    from telegram.client import Telegram
+
+logger = logging.getLogger(__name__)
+
+# how often the broadcast loop wakes up when nothing happens, in seconds
+_POLL_INTERVAL = 0.05
+
+
+class BroadcastReport:
+    """
+    The outcome of a broadcast.
+
+    Attributes:
+        sent: chat id -> id of the sent message
+        failed: chat id -> the tdlib error
+        skipped: how many chats have been skipped, because the checkpoint has them as sent already
+    """
+
+    __slots__ = ("failed", "sent", "skipped")
+
+    def __init__(self) -> None:
+        self.sent: dict[int, int] = {}
+        self.failed: dict[int, dict[str, Any]] = {}
+        self.skipped = 0
+
+    def __repr__(self) -> str:
+        return f"BroadcastReport(sent={len(self.sent)}, failed={len(self.failed)}, skipped={self.skipped})"
+
+
+class Broadcaster:
+    """
+    Sends the same content to many chats as fast as Telegram allows.
+
+    The ``sendMessage`` request is encoded to JSON once, only the chat id
+    differs from chat to chat. No more than `max_in_flight` messages are
+    being sent at the same time. A message counts as sent when tdlib reports
+    ``updateMessageSendSucceeded`` for it, and as failed on ``updateMessageSendFailed``
+    or an error, see ``AsyncResult.delivery_future``. Messages that fail with ``429 Too Many Requests`` are sent
+    again after the time Telegram asks to wait.
+
+    With `checkpoint_path`, every finished chat is appended to that file with its status,
+    and a broadcast started again with the same file skips the chats that have been
+    sent to, so an interrupted campaign can be resumed, and the failed chats are tried again::
+
+        broadcaster = Broadcaster(tg, "Hello!", checkpoint_path="campaign.txt")
+        report = broadcaster.run(chat_ids)
+
+    Args:
+        telegram: a logged in client
+        content: a text, or an ``InputMessageContent`` dict
+        max_in_flight: how many messages are being sent at the same time
+        checkpoint_path: the file with the finished chats
+        max_retries: how many times a message is sent again after ``429``
+        send_timeout: a message without an outcome after this many seconds counts as failed
+    """
+
+    def __init__(
+        self,
+        telegram: Telegram,
+        content: str | dict[str, Any],
+        max_in_flight: int = 100,
+        checkpoint_path: str | Path | None = None,
+        max_retries: int = 5,
+        send_timeout: float = 300.0,
+    ) -> None:
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+
+        if isinstance(content, str):
+            content = {
+                "@type": "inputMessageText",
+                "text": {"@type": "formattedText", "text": content, "entities": []},
+            }
+
+        self.telegram = telegram
+        self.content = content
+        self.max_in_flight = max_in_flight
+        self.checkpoint_path = Path(checkpoint_path) if checkpoint_path is not None else None
+        self.max_retries = max_retries
+        self.send_timeout = send_timeout
+
+        # everything but the chat id, which closes the object
+        self._payload_prefix = b'{"@type":"sendMessage","input_message_content":%s,"chat_id":' % json.dumps(
+            content, separators=(",", ":")
+        ).encode("utf-8")
+
+    def _encode(self, chat_id: int) -> bytes:
+        return b"%s%d}" % (self._payload_prefix, chat_id)
+
+    def run(self, chat_ids: Iterable[int]) -> BroadcastReport:
+        """Sends the content to every chat and blocks until each of them has an outcome"""
+        report = BroadcastReport()
+        done = self._read_checkpoint()
+
+        checkpoint = self.checkpoint_path.open("a", encoding="utf-8") if self.checkpoint_path else None
+
+        try:
+            _BroadcastRun(self, report, checkpoint).run(self._not_done(chat_ids, done, report))
+        finally:
+            if checkpoint is not None:
+                checkpoint.close()
+
+        logger.info("[Broadcaster] finished: %s", report)
+
+        return report
+
+    def _read_checkpoint(self) -> set[int]:
+        if self.checkpoint_path is None or not self.checkpoint_path.exists():
+            return set()
+
+        done = set()
+
+        with self.checkpoint_path.open(encoding="utf-8") as checkpoint:
+            for line in checkpoint:
+                chat_id, _, status = line.strip().partition(" ")
+                # the chats that have failed are sent to again
+                if status == "sent":
+                    done.add(int(chat_id))
+
+        return done
+
+    @staticmethod
+    def _not_done(chat_ids: Iterable[int], done: set[int], report: BroadcastReport) -> Iterator[int]:
+        for chat_id in chat_ids:
+            if chat_id in done:
+                report.skipped += 1
+            else:
+                yield chat_id
+
+
+class _BroadcastRun:
+    """The state of one `Broadcaster.run`, it is only used from the calling thread"""
+
+    def __init__(self, broadcaster: Broadcaster, report: BroadcastReport, checkpoint: IO[str] | None) -> None:
+        self.broadcaster = broadcaster
+        self.report = report
+        self.checkpoint = checkpoint
+        # the results of sendMessage waiting for their delivery -> chat id, attempt, sent at
+        self.sending: dict[AsyncResult, tuple[int, int, float]] = {}
+        # due time, chat id, attempt
+        self.retries: list[tuple[float, int, int]] = []
+
+    def run(self, chat_ids: Iterator[int]) -> None:
+        # resolved delivery futures, put by the listener thread
+        delivered: queue.SimpleQueue[AsyncResult] = queue.SimpleQueue()
+        exhausted = False
+
+        def on_delivered(result: AsyncResult) -> Callable[[Future], None]:
+            return lambda _: delivered.put(result)
+
+        while True:
+            self._expire()
+
+            now = time.monotonic()
+            while len(self.sending) < self.broadcaster.max_in_flight:
+                if self.retries and self.retries[0][0] <= now:
+                    _, chat_id, attempt = heapq.heappop(self.retries)
+                elif exhausted:
+                    break
+                else:
+                    next_chat_id = next(chat_ids, None)
+                    if next_chat_id is None:
+                        exhausted = True
+                        break
+                    chat_id, attempt = next_chat_id, 0
+
+                result = self.broadcaster.telegram._send_encoded(self.broadcaster._encode(chat_id), "sendMessage")
+                self.sending[result] = (chat_id, attempt, now)
+                result.delivery_future().add_done_callback(on_delivered(result))
+
+            if exhausted and not self.sending and not self.retries:
+                return
+
+            timeout = _POLL_INTERVAL
+            if self.retries and len(self.sending) < self.broadcaster.max_in_flight:
+                timeout = min(timeout, max(self.retries[0][0] - now, 0))
+
+            try:
+                result = delivered.get(timeout=timeout)
+            except queue.Empty:
+                continue
+
+            while True:
+                self._on_delivered(result)
+                try:
+                    result = delivered.get_nowait()
+                except queue.Empty:
+                    break
+
+    def _on_delivered(self, result: AsyncResult) -> None:
+        sending = self.sending.pop(result, None)
+
+        if sending is None:
+            # it has timed out already
+            return
+
+        chat_id, attempt, _ = sending
+
+        if result.delivery_error is not None:
+            self._fail(chat_id, attempt, result.delivery_error)
+            return
+
+        message: Any = result.delivered_message
+        self.report.sent[chat_id] = message["id"]
+        self._checkpoint(chat_id, "sent")
+
+    def _fail(self, chat_id: int, attempt: int, error: dict[str, Any]) -> None:
+        delay = get_retry_after(error)
+
+        if delay is not None and attempt < self.broadcaster.max_retries:
+            logger.info("[Broadcaster] flood wait for chat %s, sending again in %s seconds", chat_id, delay)
+            heapq.heappush(self.retries, (time.monotonic() + delay, chat_id, attempt + 1))
+            return
+
+        self.report.failed[chat_id] = error
+        self._checkpoint(chat_id, "failed")
+
+    def _expire(self) -> None:
+        deadline = time.monotonic() - self.broadcaster.send_timeout
+
+        for result, (chat_id, _, sent_at) in list(self.sending.items()):
+            if sent_at < deadline:
+                del self.sending[result]
+                self.broadcaster.telegram._forget_result(result)
+                self.report.failed[chat_id] = {"@type": "error", "code": 408, "message": "No outcome from tdlib"}
+                self._checkpoint(chat_id, "failed")
+
+    def _checkpoint(self, chat_id: int, status: str) -> None:
+        if self.checkpoint is not None:
+            self.checkpoint.write(f"{chat_id} {status}\n")
+            self.checkpoint.flush()
@@ -4,6 +4,8 @@ import base64
 import enum
 import getpass
 import hashlib
+import heapq
+import itertools
 import logging
 import queue
 import signal
@@ -11,26 +13,64 @@ import tempfile
 import threading
 import time
 import typing
-from collections import defaultdict
-from collections.abc import Callable
+from collections import defaultdict, deque
+from collections.abc import Callable, Collection, Iterable, Iterator, Sequence
 from pathlib import Path
 from types import FrameType
 from typing import (
+    TYPE_CHECKING,
     Any,
     Literal,
+    overload,
 )
 
 from telegram import VERSION
-from telegram.tdjson import ClientDestroyedError, TDJson
-from telegram.text import Element
-from telegram.utils import AsyncResult
-from telegram.worker import BaseWorker, SimpleWorker
+from telegram.filters import CATCH_ALL, UpdateFilter, matches_update_type
+from telegram.models import decode_object
+from telegram.tdjson import ClientDestroyedError, TDJson, TDLibLogForwarder, td_execute
+from telegram.utils import AsyncResult, DebugLogSampler, get_retry_after
+from telegram.worker import BaseWorker, HandlerLane, SimpleWorker, UpdateBatcher
+
+if TYPE_CHECKING:
+    from concurrent.futures import Future
+
+    # imported on first use, they load sqlite3 and concurrent.futures
+    from telegram.export import ExportFormat
+    from telegram.file_cache import FileCache
+    from telegram.files import DownloadManager, UploadManager
+    from telegram.search import MessageIndex
+
+    # telegram.text imports telegram-text, which is only needed to send markup
+    from telegram.text import Element
 
 logger = logging.getLogger(__name__)
 
 
 MESSAGE_HANDLER_TYPE: str = "updateNewMessage"
 
+# the outcomes of sent messages, see `AsyncResult.wait_delivered`
+_DELIVERY_UPDATES = frozenset(("updateMessageSendSucceeded", "updateMessageSendFailed"))
+
+# the updates that `load_all_chats` collects the chats from
+_CHAT_LIST_UPDATES = frozenset(("updateNewChat", "updateChatPosition"))
+
+# getChats returns all the loaded chats with this limit
+_ALL_CHATS_LIMIT = 2**31 - 1
+
+# how long a batched handler waits for more updates, if `max_delay` is not set
+DEFAULT_BATCH_MAX_DELAY: float = 1.0
+
+# a handler (or its batcher), its filter and its lane, if the handler has a dedicated one
+_Route = tuple[Callable, UpdateFilter | None, HandlerLane | None]
+
+# how long `login` waits for tdlib to report the first authorization state
+# before asking for it
+INITIAL_AUTHORIZATION_STATE_TIMEOUT: float = 1.0
+
+# how long `login` with `warm_start` waits for tdlib to open the database
+# before it continues with the usual login steps
+WARM_START_TIMEOUT: float = 30.0
+
 # how long `stop` waits for tdlib to report the CLOSED authorization state
 DEFAULT_CLOSE_TIMEOUT: float = 5.0
 
@@ -78,6 +118,14 @@ class Telegram:
         proxy_port: int = 0,
         proxy_type: dict[str, str] | None = None,
         use_secret_chats: bool = True,
+        compact_models: bool = False,
+        warm_start: bool = False,
+        defer_start: bool = False,
+        tdlib_log_file_path: str | Path | None = None,
+        tdlib_log_max_file_size: int | None = None,
+        tdlib_log_forwarder: TDLibLogForwarder | None = None,
+        debug_log_sample_rate: int = 1,
+        file_cache: FileCache | None = None,
     ) -> None:
         """
         Args:
@@ -94,6 +142,21 @@ class Telegram:
             application_version
             system_version
             system_language_code
+            compact_models - decode messages, chats, users and some updates into
+                the compact objects from `telegram.models` instead of dicts
+            warm_start - if files_directory has the database of a previous session,
+                `login` sends the tdlib parameters right away and waits for the
+                next authorization state reported by tdlib
+            defer_start - load libtdjson and start the threads on the first request
+                instead of here, which keeps short-lived scripts fast
+            tdlib_log_file_path - write the tdlib log to this file instead of stderr
+            tdlib_log_max_file_size - rotate the tdlib log file when it reaches this size in bytes
+            tdlib_log_forwarder - forward the tdlib log to the `telegram.tdjson` logger,
+                for example `TDLibLogForwarder(rate_limit=50, sample_rate=10)`
+            debug_log_sample_rate - log only one of every N frames at DEBUG,
+                for clients that receive thousands of updates per second
+            file_cache - a `telegram.file_cache.FileCache` shared with other clients,
+                `download_file` takes the files downloaded by them from it
         """
         self.api_id = api_id
         self.api_hash = api_hash
@@ -111,6 +174,14 @@ class Telegram:
         self.proxy_port = proxy_port
         self.proxy_type = proxy_type
         self.use_secret_chats = use_secret_chats
+        self.warm_start = warm_start
+        # seconds from the creation of the client until it has become READY
+        self.time_to_ready: float | None = None
+        self._started_at = time.monotonic()
+        # notified on every authorization state change, see `wait_for_state`
+        self._authorization_state_changed = threading.Condition()
+        # whether the listener has seen any updateAuthorizationState
+        self._authorization_state_tracked = False
         self.authorization_state = AuthorizationState.NONE
 
         if not self.bot_token and not self.phone:
@@ -135,17 +206,47 @@ class Telegram:
         self._stopped = threading.Event()
 
         # todo: move to worker
+        self._default_workers_queue_size = default_workers_queue_size
         self._workers_queue: queue.Queue = queue.Queue(maxsize=default_workers_queue_size)
 
         if not worker:
             worker = SimpleWorker
         self.worker: BaseWorker = worker(queue=self._workers_queue)
 
-        self._results: dict[str, AsyncResult] = {}
+        self._results: dict[str | int, AsyncResult] = {}
+        # (chat id, temporary message id) -> the result of the request that has sent the message
+        self._pending_sends: dict[tuple[int, int], AsyncResult] = {}
+        # called in the listener with every updateFile, see `telegram.files`
+        self._update_file_hooks: list[Callable[[dict[Any, Any]], None]] = []
+        # called in the listener with every updateNewChat and updateChatPosition, see `load_all_chats`
+        self._chat_hooks: list[Callable[[dict[Any, Any]], None]] = []
+        self._file_cache = file_cache
+        self._download_manager: DownloadManager | None = None
+        self._upload_manager: UploadManager | None = None
+        self._message_index: MessageIndex | None = None
+        # ids of the requests without an explicit one, unique per client
+        self._request_ids = itertools.count(1)
         self._update_handlers: defaultdict[str, list[Callable]] = defaultdict(list)
-
-        self._tdjson = TDJson(library_path=library_path, verbosity=tdlib_verbosity)
-        self._run()
+        self._handler_filters: dict[tuple[str, Callable], UpdateFilter] = {}
+        self._handler_lanes: dict[tuple[str, Callable], HandlerLane] = {}
+        self._handler_batchers: dict[tuple[str, Callable], UpdateBatcher] = {}
+        # update type -> handlers with their filters and lanes, built on the first update of each type
+        self._dispatch_table: dict[str, tuple[_Route, ...]] = {}
+
+        self._tdlib_verbosity = tdlib_verbosity
+        self._object_hook = decode_object if compact_models else None
+        self._tdlib_log_file_path = str(tdlib_log_file_path) if tdlib_log_file_path is not None else None
+        self._tdlib_log_max_file_size = tdlib_log_max_file_size
+        self._tdlib_log_forwarder = tdlib_log_forwarder
+        self._debug_log_sample_rate = debug_log_sample_rate
+        self._debug_log = DebugLogSampler(logger, debug_log_sample_rate)
+        self._started = False
+        # set by `stop` if the client is stopped before it has been started
+        self._start_cancelled = False
+        self._start_lock = threading.Lock()
+
+        if not defer_start:
+            self._start()
 
         if login:
             self.login()
@@ -164,6 +265,16 @@ class Telegram:
 
         logger.info("Stopping telegram client...")
 
+        with self._start_lock:
+            # the client may not have been started with `defer_start`
+            self._start_cancelled = not self._started
+
+        if self._start_cancelled:
+            # nothing has been sent to tdlib, there is no session to close
+            self._stopped.set()
+            self._stop_handlers()
+            return
+
         try:
             self._close(timeout=close_timeout)
         except Exception:
@@ -174,6 +285,7 @@ class Telegram:
 
         self._stopped.set()
         self.worker.stop()
+        self._stop_handlers()
 
         # wait for the tdjson listener to stop
         self._td_listener.join()
@@ -187,25 +299,95 @@ class Telegram:
 
         Blocking, but gives up after `timeout` seconds.
         """
-        self.call_method("close")
+        result = self.call_method("close")
 
-        deadline = time.monotonic() + timeout
+        if self.authorization_state == AuthorizationState.CLOSED:
+            return
 
-        while self.authorization_state != AuthorizationState.CLOSED:
-            time_left = deadline - time.monotonic()
+        if timeout > 0:
+            deadline = time.monotonic() + timeout
 
-            if time_left <= 0:
-                logger.warning(
-                    "tdlib has not reached the CLOSED state in %s seconds, last known state: %s",
-                    timeout,
-                    self.authorization_state,
-                )
+            try:
+                result.wait(timeout=timeout, raise_exc=True)
+                self.wait_for_state(AuthorizationState.CLOSED, timeout=max(deadline - time.monotonic(), 0))
                 return
+            except TimeoutError:
+                pass
+            except RuntimeError as e:
+                # tdlib has answered `close` with an error
+                logger.warning("tdlib could not close the session: %s", e)
+
+        logger.warning(
+            "tdlib has not reached the CLOSED state in %s seconds, last known state: %s",
+            timeout,
+            self.authorization_state,
+        )
 
-            result = self.get_authorization_state()
-            self.authorization_state = self._wait_authorization_result(result, timeout=time_left)
-            logger.info("Authorization state: %s", self.authorization_state)
-            time.sleep(0.5)
+    @property
+    def authorization_state(self) -> AuthorizationState:
+        """
+        The current authorization state.
+
+        The listener keeps it up to date from the ``updateAuthorizationState``
+        updates, including the ones nobody has asked for, for example when
+        the session is terminated from another device.
+        """
+        return self._authorization_state
+
+    @authorization_state.setter
+    def authorization_state(self, state: AuthorizationState) -> None:
+        with self._authorization_state_changed:
+            self._authorization_state = state
+            self._authorization_state_changed.notify_all()
+
+        if state == AuthorizationState.READY and self.time_to_ready is None:
+            self.time_to_ready = time.monotonic() - self._started_at
+            logger.info("The client is ready in %.3f seconds", self.time_to_ready)
+
+    def wait_for_state(
+        self,
+        state: AuthorizationState | Collection[AuthorizationState],
+        timeout: float | None = None,
+    ) -> AuthorizationState:
+        """
+        Blocks until the client reaches one of the given authorization states.
+
+        Args:
+            state: an authorization state or a collection of them
+            timeout: how long to wait, in seconds, forever if not set
+
+        Returns:
+            the state that has been reached
+
+        Raises:
+            TimeoutError if none of the states has been reached in time
+        """
+        states = {state} if isinstance(state, AuthorizationState) else set(state)
+
+        with self._authorization_state_changed:
+            reached = self._authorization_state_changed.wait_for(
+                lambda: self._authorization_state in states,
+                timeout=timeout,
+            )
+            if not reached:
+                raise TimeoutError(
+                    f"Authorization state {states} has not been reached, it is {self.authorization_state}"
+                )
+
+            return self._authorization_state
+
+    def _track_authorization_state(self, update: dict[Any, Any]) -> None:
+        try:
+            state = AuthorizationState(update["authorization_state"]["@type"])
+        except (KeyError, ValueError):
+            logger.warning("Unknown authorization state update: %s", update)
+            return
+
+        self._authorization_state_tracked = True
+
+        if state != self.authorization_state:
+            logger.info("Authorization state: %s", state)
+            self.authorization_state = state
 
     def parse_text_entities(self, text: str, parse_mode: Literal["HTML", "Markdown"]) -> AsyncResult:
         """
@@ -285,14 +467,15 @@ class Telegram:
             entities = []
 
         updated_text: str
-        if isinstance(text, Element):
-            result = self.parse_text_entities(text.to_html(), parse_mode="HTML")
-            result.wait(raise_exc=True)
-            if result.update is None:
-                raise RuntimeError(f"Failed to parse text entities: {result.error_info}")
-            update: dict = result.update
-            entities = update["entities"]
-            updated_text = update["text"]
+        if not isinstance(text, str):
+            formatted_text = self.execute(
+                "parseTextEntities",
+                {"text": text.to_html(), "parse_mode": {"@type": "textParseModeHTML"}},
+            )
+            if formatted_text is None:
+                raise RuntimeError("Failed to parse text entities")
+            entities = formatted_text["entities"]
+            updated_text = formatted_text["text"]
         else:
             updated_text = text
 
@@ -360,6 +543,97 @@ class Telegram:
 
         return self._send_data(data)
 
+    def import_contacts_bulk(
+        self,
+        contacts: Sequence[dict[str, str]],
+        chunk_size: int = 100,
+        max_in_flight: int = 4,
+        max_retries: int = 5,
+        timeout: float | None = None,
+    ) -> dict[str, Any]:
+        """
+        Imports a big address book with ``importContacts`` in chunks, see ``import_contacts``.
+
+        Up to `max_in_flight` chunks are being imported at the same time. A chunk that fails
+        with ``429 Too Many Requests`` is sent again after the time Telegram asks to wait.
+
+        Args:
+            contacts: the contacts, in the format of ``import_contacts``
+            chunk_size: how many contacts are sent in one request
+            max_in_flight: how many requests are sent at the same time
+            max_retries: how many times a chunk is sent again after ``429``
+            timeout: how long the whole import may take, in seconds
+
+        Returns:
+            the ``importedContacts`` object of all the contacts, ``user_ids`` and
+            ``importer_count`` are in the order of `contacts`
+
+        Raises:
+            RuntimeError: if tdlib returns another error, or ``429`` more than `max_retries` times
+            TimeoutError: if the import takes longer than `timeout`
+        """
+        if chunk_size < 1 or max_in_flight < 1:
+            raise ValueError("chunk_size and max_in_flight must be at least 1")
+
+        chunks = [contacts[start : start + chunk_size] for start in range(0, len(contacts), chunk_size)]
+        imported: list[dict[str, Any] | None] = [None] * len(chunks)
+        attempts = [0] * len(chunks)
+        # the chunks to send now, and the due time and index of the chunks waiting for a retry
+        to_send = deque(range(len(chunks)))
+        retries: list[tuple[float, int]] = []
+        # answered chunks, put by the listener thread
+        answered: queue.SimpleQueue[tuple[int, AsyncResult]] = queue.SimpleQueue()
+        in_flight = 0
+        remaining = len(chunks)
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        def on_answer(index: int, result: AsyncResult) -> Callable[[Future], None]:
+            return lambda _: answered.put((index, result))
+
+        while remaining:
+            now = time.monotonic()
+
+            while retries and retries[0][0] <= now:
+                to_send.append(heapq.heappop(retries)[1])
+
+            while to_send and in_flight < max_in_flight:
+                index = to_send.popleft()
+                result = self.import_contacts(list(chunks[index]))
+                result.delivery_future().add_done_callback(on_answer(index, result))
+                in_flight += 1
+
+            wake_up_at = [due for due in (retries[0][0] if retries else None, deadline) if due is not None]
+
+            try:
+                index, result = answered.get(timeout=max(min(wake_up_at) - now, 0) if wake_up_at else None)
+            except queue.Empty:
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise TimeoutError() from None
+                continue
+
+            in_flight -= 1
+
+            if result.error:
+                error: dict[str, Any] = result.error_info or {}
+                delay = get_retry_after(error)
+
+                if delay is None or attempts[index] >= max_retries:
+                    raise RuntimeError(f"Telegram error: {error}")
+
+                logger.info("[import_contacts_bulk] flood wait, sending chunk %s again in %s seconds", index, delay)
+                attempts[index] += 1
+                heapq.heappush(retries, (time.monotonic() + delay, index))
+                continue
+
+            imported[index] = result.update
+            remaining -= 1
+
+        return {
+            "@type": "importedContacts",
+            "user_ids": [user_id for chunk in imported for user_id in chunk["user_ids"]],  # type: ignore[index]
+            "importer_count": [count for chunk in imported for count in chunk["importer_count"]],  # type: ignore[index]
+        }
+
     def get_chat(self, chat_id: int) -> AsyncResult:
         """
         This is offline request, if there is no chat in your database it will not be found
@@ -462,6 +736,70 @@ class Telegram:
 
         return self._send_data(data)
 
+    def load_all_chats(
+        self,
+        chat_list: dict | None = None,
+        limit: int = 100,
+        timeout: float | None = None,
+    ) -> list[Any]:
+        """
+        Loads the whole chat list and returns its chats in the order of the list.
+
+        ``loadChats`` is called until tdlib reports that all the chats have been loaded,
+        while the chats are collected from the ``updateNewChat`` and ``updateChatPosition``
+        updates it sends. Only the chats tdlib has sent before this call are requested
+        with ``getChat``, all at once, so the list costs a few round trips instead of one per chat.
+
+        Args:
+            chat_list: the chat list to load, the main chat list if not set.
+                For example: ``{'@type': 'chatListArchive'}``
+            limit: how many chats to ask for with every ``loadChats``
+            timeout: how long to wait for every request, in seconds
+
+        Returns:
+            the ``chat`` objects, their ``positions`` are up to date
+
+        Raises:
+            RuntimeError: if tdlib returns an error
+            TimeoutError: if tdlib does not answer in time
+        """
+        chats: dict[int, Any] = {}
+
+        def collect(update: dict[Any, Any]) -> None:
+            # called in the listener thread
+            if update["@type"] == "updateNewChat":
+                chats[update["chat"]["id"]] = update["chat"]
+            elif update["chat_id"] in chats:
+                _set_chat_position(chats[update["chat_id"]], update["position"])
+
+        self._chat_hooks.append(collect)
+
+        try:
+            while True:
+                result = self.load_chats(limit=limit, chat_list=chat_list)
+                result.wait(timeout=timeout)
+
+                if result.error:
+                    if result.error_info and result.error_info.get("code") == 404:
+                        # all the chats have been loaded
+                        break
+                    raise RuntimeError(f"Telegram error: {result.error_info}")
+
+            # all the chats are in memory, so tdlib answers with the whole list at once
+            result = self.get_chats(limit=_ALL_CHATS_LIMIT, chat_list=chat_list)
+            result.wait(timeout=timeout, raise_exc=True)
+            chat_ids: list[int] = result.update["chat_ids"]  # type: ignore[index]
+
+            known = {chat_id: self.get_chat(chat_id) for chat_id in chat_ids if chat_id not in chats}
+
+            for chat_id, result in known.items():
+                result.wait(timeout=timeout, raise_exc=True)
+                chats[chat_id] = result.update
+        finally:
+            self._chat_hooks.remove(collect)
+
+        return [chats[chat_id] for chat_id in chat_ids]
+
     def get_chat_history(
         self,
         chat_id: int,
@@ -491,6 +829,74 @@ class Telegram:
 
         return self._send_data(data)
 
+    def export_chat_history(
+        self,
+        chat_id: int,
+        sink: str | Path,
+        format: ExportFormat = "jsonl",
+        checkpoint_path: str | Path | None = None,
+        **kwargs: Any,
+    ) -> int:
+        """
+        Writes the whole history of a chat to a JSON lines file or to parquet files,
+        page by page, see ``telegram.export.export_chat_history``.
+
+        Args:
+            chat_id: the chat to export
+            sink: the file (``jsonl``) or the directory (``parquet``) to write to
+            format: ``jsonl`` or ``parquet``, which needs ``pyarrow``
+            checkpoint_path: the progress is saved to this file, and an export started
+                again with it continues where the previous one has stopped
+
+        Returns:
+            how many messages have been written
+        """
+        from telegram.export import export_chat_history
+
+        return export_chat_history(self, chat_id, sink, format=format, checkpoint_path=checkpoint_path, **kwargs)
+
+    def enable_local_search(self, index: MessageIndex, batch_size: int = 500, max_delay: float = 1.0) -> None:
+        """
+        Keeps the full-text index of the messages of this client up to date, see ``search_local``.
+
+        The index is updated from the message updates in batches, in the worker.
+
+        Args:
+            index: the index, usually in the ``files_directory``
+            batch_size: how many updates are written in one transaction
+            max_delay: how long a new message may stay out of the index, in seconds
+        """
+        from telegram.search import INDEXED_UPDATES
+
+        self._message_index = index
+        self.add_update_handler(
+            CATCH_ALL,
+            index.index_updates,
+            update_filter=UpdateFilter(predicate=lambda update: update["@type"] in INDEXED_UPDATES),
+            batch_size=batch_size,
+            max_delay=max_delay,
+        )
+
+    def search_local(
+        self, query: str, chat_ids: Iterable[int] | None = None, limit: int = 100
+    ) -> list[dict[str, Any]]:
+        """
+        Searches the messages in the local index instead of calling ``searchChatMessages``,
+        it needs ``enable_local_search``. See ``telegram.search.MessageIndex.search``.
+
+        Args:
+            query: the words to search for
+            chat_ids: only messages from these chats
+            limit: the maximum number of messages to return
+
+        Returns:
+            dicts with the ``chat_id``, ``message_id``, ``date`` and ``text`` of the messages, the newest first
+        """
+        if self._message_index is None:
+            raise RuntimeError("The local search is not enabled, call enable_local_search first")
+
+        return self._message_index.search(query, chat_ids=chat_ids, limit=limit)
+
     def get_message(
         self,
         chat_id: int,
@@ -577,26 +983,255 @@ class Telegram:
 
         return self._send_data(data)
 
+    @overload
     def call_method(
         self,
         method_name: str,
         params: dict[str, Any] | None = None,
         block: bool = False,
-    ) -> AsyncResult:
+        fire_and_forget: Literal[False] = False,
+    ) -> AsyncResult: ...
+
+    @overload
+    def call_method(
+        self,
+        method_name: str,
+        params: dict[str, Any] | None = None,
+        block: bool = False,
+        *,
+        fire_and_forget: Literal[True],
+    ) -> None: ...
+
+    def call_method(
+        self,
+        method_name: str,
+        params: dict[str, Any] | None = None,
+        block: bool = False,
+        fire_and_forget: bool = False,
+    ) -> AsyncResult | None:
         """
         Use this method to call any other method of the tdlib
 
         Args:
             method_name: Name of the method
             params: parameters
+            fire_and_forget: only send the request, without an AsyncResult.
+                The answer of tdlib, including an error, is ignored.
         """
         data = {"@type": method_name}
 
         if params:
             data.update(params)
 
+        if fire_and_forget:
+            if block:
+                raise ValueError("A fire_and_forget call can not block")
+
+            self._start()
+            self._tdjson.send(data)
+            return None
+
         return self._send_data(data, block=block)
 
+    def execute(self, method_name: str, params: dict[str, Any] | None = None) -> dict[Any, Any]:
+        """
+        Synchronously executes a tdlib method in the calling thread and returns its result.
+
+        Only the methods that tdlib can run without a session are supported
+        (``parseTextEntities``, ``getMarkdownText``, ``getFileMimeType``, ...).
+        They do not need ``login`` and do not start the client.
+
+        Args:
+            method_name: Name of the method
+            params: parameters
+
+        Raises:
+            RuntimeError: if tdlib returns an error
+        """
+        data = {"@type": method_name}
+
+        if params:
+            data.update(params)
+
+        result: dict[Any, Any] = td_execute(data, library_path=self.library_path)
+
+        if result is not None and result.get("@type") == "error":
+            raise RuntimeError(f"Telegram error: {result}")
+
+        return result
+
+    def parse_markdown(self, text: dict[Any, Any]) -> dict[Any, Any]:
+        """
+        Parses Markdown entities in a human-friendly format (``**bold**``, ``__italic__``, ...)
+        of a ``formattedText`` and returns a new ``formattedText``. Runs synchronously.
+        """
+        return self.execute("parseMarkdown", {"text": text})
+
+    def get_markdown_text(self, text: dict[Any, Any]) -> dict[Any, Any]:
+        """
+        Replaces the text entities of a ``formattedText`` with Markdown.
+        The reverse of ``parse_markdown``. Runs synchronously.
+        """
+        return self.execute("getMarkdownText", {"text": text})
+
+    def get_text_entities(self, text: str) -> list[dict[Any, Any]]:
+        """
+        Returns the mentions, hashtags, bot commands, URLs and emails found in the text.
+        Runs synchronously.
+        """
+        entities: list[dict[Any, Any]] = self.execute("getTextEntities", {"text": text})["entities"]
+        return entities
+
+    def get_file_mime_type(self, file_name: str) -> str:
+        """Returns the MIME type of a file guessed by its extension. Runs synchronously."""
+        mime_type: str = self.execute("getFileMimeType", {"file_name": file_name})["text"]
+        return mime_type
+
+    def get_file_extension(self, mime_type: str) -> str:
+        """Returns the extension of a file guessed by its MIME type. Runs synchronously."""
+        extension: str = self.execute("getFileExtension", {"mime_type": mime_type})["text"]
+        return extension
+
+    def get_json_string(self, json_value: dict[Any, Any]) -> str:
+        """Converts a ``JsonValue`` object to the corresponding JSON string. Runs synchronously."""
+        json_string: str = self.execute("getJsonString", {"json_value": json_value})["text"]
+        return json_string
+
+    def get_language_pack_string(
+        self,
+        language_pack_database_path: str,
+        localization_target: str,
+        language_pack_id: str,
+        key: str,
+    ) -> dict[Any, Any]:
+        """
+        Returns a string stored in the local database of a language pack.
+        Runs synchronously.
+        """
+        return self.execute(
+            "getLanguagePackString",
+            {
+                "language_pack_database_path": language_pack_database_path,
+                "localization_target": localization_target,
+                "language_pack_id": language_pack_id,
+                "key": key,
+            },
+        )
+
+    def download_file(
+        self,
+        file_id: int,
+        priority: int = 1,
+        on_progress: Callable[[dict[str, Any]], None] | None = None,
+    ) -> Future[dict[str, Any]]:
+        """
+        Downloads a file, no more than ``DEFAULT_MAX_CONCURRENT_DOWNLOADS`` files at the same time.
+        See ``telegram.files.DownloadManager``.
+
+        Args:
+            file_id: the tdlib id of the file
+            priority: from 1 to 32, files with a higher priority are downloaded first
+            on_progress: called in the listener thread with the ``file`` object on every ``updateFile``
+
+        Returns:
+            a future of the ``file`` object, its local path is ``file['local']['path']``
+        """
+        return self._get_download_manager().download(file_id, priority=priority, on_progress=on_progress)
+
+    def download_many(self, file_ids: Iterable[int], priority: int = 1) -> Iterator[Future[dict[str, Any]]]:
+        """
+        Downloads the files and yields their futures as they finish,
+        like ``concurrent.futures.as_completed``
+        """
+        return self._get_download_manager().download_many(file_ids, priority=priority)
+
+    def _get_download_manager(self) -> DownloadManager:
+        if self._download_manager is None:
+            with self._start_lock:
+                if self._download_manager is None:
+                    from telegram.files import DownloadManager
+
+                    self._download_manager = DownloadManager(self, cache=self._file_cache)
+        return self._download_manager
+
+    def upload_file(
+        self,
+        path: str | Path,
+        file_type: str = "fileTypeDocument",
+        priority: int = 1,
+        on_progress: Callable[[dict[str, Any]], None] | None = None,
+    ) -> Future[dict[str, Any]]:
+        """
+        Uploads a file before sending it, no more than ``DEFAULT_MAX_CONCURRENT_UPLOADS`` files at the same time.
+        See ``telegram.files.UploadManager``.
+
+        Args:
+            path: the local path of the file
+            file_type: the tdlib ``FileType`` of the file, for example ``fileTypePhoto``
+            priority: from 1 to 32, files with a higher priority are uploaded first
+            on_progress: called in the listener thread with the ``file`` object on every ``updateFile``
+
+        Returns:
+            a future of the ``file`` object, ``telegram.files.input_file(file)`` refers to it in a message
+        """
+        return self._get_upload_manager().upload(path, file_type=file_type, priority=priority, on_progress=on_progress)
+
+    def send_album(
+        self,
+        chat_id: int,
+        paths: Sequence[str | Path],
+        captions: Sequence[str | None] | None = None,
+        as_documents: bool = False,
+        timeout: float | None = None,
+    ) -> list[AsyncResult]:
+        """
+        Uploads the files concurrently and sends them to the chat as albums of up to ten files.
+        See ``telegram.files.UploadManager.send_album``.
+        """
+        return self._get_upload_manager().send_album(
+            chat_id, paths, captions=captions, as_documents=as_documents, timeout=timeout
+        )
+
+    def _get_upload_manager(self) -> UploadManager:
+        if self._upload_manager is None:
+            with self._start_lock:
+                if self._upload_manager is None:
+                    from telegram.files import UploadManager
+
+                    self._upload_manager = UploadManager(self)
+        return self._upload_manager
+
+    def _stop_handlers(self) -> None:
+        for lane in list(self._handler_lanes.values()):
+            lane.stop()
+
+        for batcher in list(self._handler_batchers.values()):
+            batcher.stop()
+
+    def _start(self) -> None:
+        """Creates the tdlib client and starts the listener and the worker, once"""
+        if self._started:
+            return
+
+        with self._start_lock:
+            if self._started:
+                return
+
+            if self._start_cancelled:
+                raise ClientDestroyedError("The tdlib client is stopped and cannot be used anymore")
+
+            self._tdjson = TDJson(
+                library_path=self.library_path,
+                verbosity=self._tdlib_verbosity,
+                object_hook=self._object_hook,
+                log_file_path=self._tdlib_log_file_path,
+                log_max_file_size=self._tdlib_log_max_file_size,
+                log_forwarder=self._tdlib_log_forwarder,
+                debug_log_sample_rate=self._debug_log_sample_rate,
+            )
+            self._run()
+            self._started = True
+
     def _run(self) -> None:
         self._td_listener = threading.Thread(target=self._listen_to_td)
         self._td_listener.daemon = True
@@ -612,8 +1247,7 @@ class Telegram:
                 update = self._tdjson.receive()
 
                 if update:
-                    self._update_async_result(update)
-                    self._run_handlers(update)
+                    self._process_update(update)
             except ClientDestroyedError:
                 # nothing left to listen to, and retrying would spin
                 logger.info("[Telegram.td_listener] the tdlib client is gone, stopping")
@@ -623,6 +1257,24 @@ class Telegram:
                     break
                 logger.exception("[Telegram.td_listener] error processing update")
 
+    def _process_update(self, update: dict[Any, Any]) -> None:
+        update_type = update.get("@type")
+
+        if update_type == "updateAuthorizationState":
+            # before the result, so that whoever waits for it sees the new state already
+            self._track_authorization_state(update)
+        elif update_type in _DELIVERY_UPDATES:
+            self._track_delivery(update)
+        elif update_type == "updateFile":
+            for hook in self._update_file_hooks:
+                hook(update)
+        elif update_type in _CHAT_LIST_UPDATES:
+            for hook in self._chat_hooks:
+                hook(update)
+
+        self._update_async_result(update)
+        self._run_handlers(update)
+
     def _update_async_result(self, update: dict[Any, Any]) -> AsyncResult | None:
         async_result = None
 
@@ -633,30 +1285,90 @@ class Telegram:
         else:
             request_id = update.get("@extra", {}).get("request_id")
 
-        if not request_id:
-            logger.debug("request_id has not been found in the update")
-        else:
+        if request_id:
             async_result = self._results.get(request_id)
 
         if not async_result:
-            logger.debug("async_result has not been found in by request_id=%s", request_id)
+            if self._debug_log():
+                logger.debug("async_result has not been found by request_id=%s", request_id)
         else:
             done = async_result.parse_update(update)
 
             if done:
                 self._results.pop(request_id, None)
 
+                if async_result._is_sending():
+                    # the first request wins, a later one can not take over its delivery
+                    self._pending_sends.setdefault((update["chat_id"], update["id"]), async_result)
+
         return async_result
 
+    def _track_delivery(self, update: dict[Any, Any]) -> None:
+        """Resolves the delivery of a sent message, it is called in the listener thread"""
+        message = update["message"]
+        async_result = self._pending_sends.pop((message["chat_id"], update["old_message_id"]), None)
+
+        if async_result is None:
+            return
+
+        if update["@type"] == "updateMessageSendSucceeded":
+            async_result._set_delivered(message, None)
+        else:
+            # tdlib < 1.8.45 reports the error in two fields
+            error = update.get("error") or {
+                "@type": "error",
+                "code": update.get("error_code"),
+                "message": update.get("error_message", ""),
+            }
+            async_result._set_delivered(None, error)
+
+    def _forget_result(self, async_result: AsyncResult) -> None:
+        """Stops waiting for the answer and the delivery of a request that its caller has given up on"""
+        if self._results.get(async_result.id) is async_result:
+            self._results.pop(async_result.id, None)
+
+        message = async_result.update
+        if message is not None and message.get("@type") == "message":
+            key = (message["chat_id"], message["id"])
+            if self._pending_sends.get(key) is async_result:
+                self._pending_sends.pop(key, None)
+
     def _run_handlers(self, update: dict[Any, Any]) -> None:
         update_type: str = update.get("@type", "unknown")
 
-        for handler in self._update_handlers[update_type]:
+        # read the table once: adding a handler replaces it, and routes built
+        # from the old handlers must not end up in the new table
+        dispatch_table = self._dispatch_table
+        routes = dispatch_table.get(update_type)
+        if routes is None:
+            routes = dispatch_table[update_type] = self._build_routes(update_type)
+
+        for handler, update_filter, lane in routes:
+            if update_filter is not None and not update_filter(update):
+                continue
+
+            if lane is not None:
+                if not lane.put(update):
+                    logger.error("Handler lane full, dropping update %s for handler %s", update_type, handler)
+                continue
+
             try:
                 self._workers_queue.put((handler, update), timeout=self._queue_put_timeout)
             except queue.Full:
                 logger.error("Handler queue full, dropping update %s for handler %s", update_type, handler)
 
+    def _build_routes(self, update_type: str) -> tuple[_Route, ...]:
+        return tuple(
+            (
+                self._handler_batchers.get((handler_type, handler), handler),
+                self._handler_filters.get((handler_type, handler)),
+                self._handler_lanes.get((handler_type, handler)),
+            )
+            for handler_type, handlers in list(self._update_handlers.items())
+            if matches_update_type(handler_type, update_type)
+            for handler in list(handlers)
+        )
+
     def remove_update_handler(self, handler_type: str, func: Callable) -> None:
         """
         Remove a handler with the specified type
@@ -667,13 +1379,127 @@ class Telegram:
             # not in the list
             pass
 
-    def add_message_handler(self, func: Callable) -> None:
-        self.add_update_handler(MESSAGE_HANDLER_TYPE, func)
+        self._handler_filters.pop((handler_type, func), None)
+        self._dispatch_table = {}
+
+        lane = self._handler_lanes.pop((handler_type, func), None)
+        if lane is not None:
+            lane.stop()
+
+        batcher = self._handler_batchers.pop((handler_type, func), None)
+        if batcher is not None:
+            batcher.stop()
+
+    def add_message_handler(
+        self,
+        func: Callable,
+        update_filter: UpdateFilter | None = None,
+        concurrency: int | None = None,
+        queue_size: int | None = None,
+        batch_size: int | None = None,
+        max_delay: float | None = None,
+    ) -> None:
+        self.add_update_handler(
+            MESSAGE_HANDLER_TYPE,
+            func,
+            update_filter=update_filter,
+            concurrency=concurrency,
+            queue_size=queue_size,
+            batch_size=batch_size,
+            max_delay=max_delay,
+        )
+
+    def add_update_handler(
+        self,
+        handler_type: str,
+        func: Callable,
+        update_filter: UpdateFilter | None = None,
+        concurrency: int | None = None,
+        queue_size: int | None = None,
+        batch_size: int | None = None,
+        max_delay: float | None = None,
+    ) -> None:
+        """
+        Registers a handler for updates of the specified type
+
+        Registering the same handler again replaces its filter and lane settings.
+
+        Args:
+            handler_type: an update type, for example ``updateNewMessage``,
+                a prefix followed by ``*`` (``updateChat*``), or ``*`` for all updates
+            func: the handler, it is called in the worker with the update.
+                It can be a coroutine function if the worker supports them, see ``AsyncioWorker``
+            update_filter: the handler receives only the updates that pass this filter
+            concurrency: if set, the handler gets its own lane: a queue and this
+                many threads, so it neither waits for nor delays other handlers
+            queue_size: the size of the lane queue, ``default_workers_queue_size``
+                if not set. Setting it also gives the handler its own lane.
+            batch_size: if set, the handler is called with a list of updates
+                once this many have been collected
+            max_delay: how long a batched handler waits for a full batch, in seconds.
+                After that it is called with the updates collected so far.
+        """
+        import inspect
+
+        has_lane = concurrency is not None or queue_size is not None
+
+        if inspect.iscoroutinefunction(func) and (
+            has_lane or batch_size is not None or not self.worker.supports_coroutines
+        ):
+            raise ValueError(
+                f"{func} is a coroutine function, it needs a worker that supports them, for example AsyncioWorker, "
+                "and can not have its own lane or batches"
+            )
 
-    def add_update_handler(self, handler_type: str, func: Callable) -> None:
         if func not in self._update_handlers[handler_type]:
             self._update_handlers[handler_type].append(func)
 
+        if update_filter is None:
+            self._handler_filters.pop((handler_type, func), None)
+        else:
+            self._handler_filters[(handler_type, func)] = update_filter
+
+        old_lane = self._handler_lanes.pop((handler_type, func), None)
+        old_batcher = self._handler_batchers.pop((handler_type, func), None)
+
+        handler = func
+        if batch_size is not None:
+            handler = self._handler_batchers[(handler_type, func)] = UpdateBatcher(
+                handler=func,
+                batch_size=batch_size,
+                max_delay=DEFAULT_BATCH_MAX_DELAY if max_delay is None else max_delay,
+            )
+
+        if has_lane:
+            lane = HandlerLane(
+                queue=queue.Queue(maxsize=queue_size or self._default_workers_queue_size),
+                handler=handler,
+                concurrency=concurrency or 1,
+            )
+            lane.run()
+            self._handler_lanes[(handler_type, func)] = lane
+
+        self._dispatch_table = {}
+
+        if old_lane is not None:
+            old_lane.stop()
+
+        if old_batcher is not None:
+            old_batcher.stop()
+
+    def get_handler_stats(self) -> list[dict[str, Any]]:
+        """
+        Returns the counters of the handlers that have their own lanes.
+
+        Each item contains ``handler_type`` and ``handler``, and the number of
+        ``queued``, ``processed``, ``failed`` and ``dropped`` updates, and the
+        ``average_latency`` and ``max_latency`` in seconds.
+        """
+        return [
+            {"handler_type": handler_type, "handler": handler, **lane.stats()}
+            for (handler_type, handler), lane in list(self._handler_lanes.items())
+        ]
+
     def _send_data(
         self,
         data: dict[Any, Any],
@@ -686,6 +1512,8 @@ class Telegram:
         If `block`is True, waits for the result
         """
 
+        self._start()
+
         if "@extra" not in data:
             data["@extra"] = {}
 
@@ -695,7 +1523,7 @@ class Telegram:
         if result_id:
             pending = self._results.get(result_id)
 
-            if pending is not None and not pending._ready.is_set():
+            if pending is not None and not pending._is_ready():
                 # Overwriting the entry would leave `pending` unreachable from
                 # `_update_async_result`, so nothing would ever resolve it and
                 # anyone waiting on it would block forever.
@@ -704,17 +1532,33 @@ class Telegram:
                     "Authorization calls share a fixed request id, so they cannot be made concurrently."
                 )
 
-        async_result = AsyncResult(client=self, result_id=result_id)
+        async_result = AsyncResult(client=self, result_id=result_id or next(self._request_ids))
         data["@extra"]["request_id"] = async_result.id
+        async_result.request = data
         self._results[async_result.id] = async_result
         self._tdjson.send(data)
-        async_result.request = data
 
         if block:
             async_result.wait(raise_exc=True)
 
         return async_result
 
+    def _send_encoded(self, query: bytes, request_type: str) -> AsyncResult:
+        """
+        Sends a query that is already encoded to JSON, a JSON object without ``@extra``.
+        The request id is added to the end of the object.
+        `request_type` is its ``@type``, the only part of it kept in ``AsyncResult.request``.
+        """
+        self._start()
+
+        request_id = next(self._request_ids)
+        async_result = AsyncResult(client=self, result_id=request_id)
+        async_result.request = {"@type": request_type}
+        self._results[request_id] = async_result
+        self._tdjson.send_encoded(b'%s,"@extra":{"request_id":%d}}' % (query[:-1], request_id))
+
+        return async_result
+
     def idle(
         self,
         stop_signals: tuple = (
@@ -754,6 +1598,10 @@ class Telegram:
 
             if result.id == "getAuthorizationState":
                 authorization_state = result.update["@type"]
+            elif self._authorization_state_tracked:
+                # the listener has tracked this update already, and maybe
+                # newer ones, which must not be overwritten by an older state
+                return self.authorization_state
             else:
                 authorization_state = result.update["authorization_state"]["@type"]
 
@@ -792,6 +1640,8 @@ class Telegram:
          - AuthorizationState.READY if the login process succeeded.
         """
 
+        self._start()
+
         if self.proxy_server:
             self._send_add_proxy()
 
@@ -820,6 +1670,23 @@ class Telegram:
         else:
             logger.info("[login] Login process has been started with bot token")
 
+        if (
+            self.warm_start
+            and self.authorization_state in (AuthorizationState.NONE, AuthorizationState.WAIT_TDLIB_PARAMETERS)
+            and self._has_database()
+        ):
+            self._login_warm()
+
+        if self.authorization_state == AuthorizationState.NONE:
+            # tdlib reports the first state on its own right after the start
+            try:
+                self.wait_for_state(
+                    [state for state in AuthorizationState if state != AuthorizationState.NONE],
+                    timeout=INITIAL_AUTHORIZATION_STATE_TIMEOUT,
+                )
+            except TimeoutError:
+                pass
+
         while self.authorization_state != AuthorizationState.READY:
             logger.info("[login] current authorization state: %s", self.authorization_state)
 
@@ -842,7 +1709,43 @@ class Telegram:
 
         return self.authorization_state
 
-    def _set_initial_params(self) -> AsyncResult:
+    def _has_database(self) -> bool:
+        """Checks if files_directory has the tdlib database of a previous session"""
+        binlog_name = "td_test.binlog" if self.use_test_dc else "td.binlog"
+
+        return (self.files_directory / "database" / binlog_name).is_file()
+
+    def _login_warm(self) -> None:
+        """
+        Starts the client with an existing database.
+
+        A new tdlib client always waits for the parameters first, so they are
+        sent without waiting for tdlib to report that, and the result is the
+        next state reported by tdlib: usually READY right away, because the
+        database keeps the authorization.
+        """
+        logger.info("[login] found the database of a previous session, sending the tdlib parameters right away")
+
+        result = self._set_initial_params(result_id=None)
+        result.wait(timeout=WARM_START_TIMEOUT, raise_exc=True)
+
+        try:
+            self.wait_for_state(
+                [
+                    state
+                    for state in AuthorizationState
+                    if state not in (AuthorizationState.NONE, AuthorizationState.WAIT_TDLIB_PARAMETERS)
+                ],
+                timeout=WARM_START_TIMEOUT,
+            )
+        except TimeoutError:
+            logger.warning(
+                "[login] tdlib has not left the state %s in %s seconds, continuing with the usual login steps",
+                self.authorization_state,
+                WARM_START_TIMEOUT,
+            )
+
+    def _set_initial_params(self, result_id: str | None = "updateAuthorizationState") -> AsyncResult:
         logger.info(
             "Setting tdlib initial params: files_dir=%s, test_dc=%s",
             self.files_directory,
@@ -870,7 +1773,7 @@ class Telegram:
             **parameters,
         }
 
-        return self._send_data(data, result_id="updateAuthorizationState")
+        return self._send_data(data, result_id=result_id)
 
     def _send_encryption_key(self) -> AsyncResult:
         logger.info("Sending encryption key")
@@ -1081,3 +1984,66 @@ class Telegram:
         self.authorization_state = self._wait_authorization_result(result)
 
         return self.authorization_state
+
+
+def login_many(
+    clients: Collection[Telegram],
+    max_workers: int | None = None,
+    on_login: Callable[[Telegram, AuthorizationState | Exception], None] | None = None,
+) -> dict[Telegram, AuthorizationState | Exception]:
+    """
+    Logs in several clients at the same time.
+
+    Every client runs ``login(blocking=False)`` in its own thread, so starting
+    many accounts takes as long as the slowest of them, not as long as all of them together.
+
+    Args:
+        clients: the clients to log in
+        max_workers: how many clients log in at the same time, all of them by default
+        on_login: called in the calling thread as soon as a client has finished,
+            with the client and its result; its exceptions are logged and ignored
+
+    Returns:
+        the result of every client: ``AuthorizationState.READY``, the state that
+        needs an action from the user (for example ``AuthorizationState.WAIT_CODE``,
+        see ``login``), or the exception if the login has failed
+    """
+    results: dict[Telegram, AuthorizationState | Exception] = {}
+
+    if not clients:
+        return results
+
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(clients), thread_name_prefix="login") as executor:
+        futures = {executor.submit(client.login, blocking=False): client for client in clients}
+
+        for future in as_completed(futures):
+            client = futures[future]
+            result: AuthorizationState | Exception
+
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.exception("[login_many] login of %s has failed", client)
+                result = e
+
+            results[client] = result
+
+            if on_login is not None:
+                try:
+                    on_login(client, result)
+                except Exception:
+                    logger.exception("[login_many] on_login callback has failed for %s", client)
+
+    return results
+
+
+def _set_chat_position(chat: Any, position: dict[str, Any]) -> None:
+    """Applies ``updateChatPosition`` to the chat, a position with the order 0 removes the chat from its list"""
+    positions = [p for p in chat.get("positions") or () if p["list"] != position["list"]]
+
+    if int(position["order"]) != 0:
+        positions.append(position)
+
+    chat["positions"] = positions
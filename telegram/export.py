@@ -0,0 +1,304 @@
+"""Exporting chat histories to files, page by page, with resumable checkpoints."""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import IO, TYPE_CHECKING, Any, Literal
+
+from telegram.models import encode_object
+
+if TYPE_CHECKING:
+    from telegram.client import Telegram
+
+logger = logging.getLogger(__name__)
+
+ExportFormat = Literal["jsonl", "parquet"]
+
+# how many messages getChatHistory returns at most
+DEFAULT_PAGE_SIZE = 100
+
+# how many messages go to one parquet file
+DEFAULT_PARQUET_PART_SIZE = 100_000
+
+
+def iter_chat_history(
+    telegram: Telegram,
+    chat_id: int,
+    from_message_id: int = 0,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    timeout: float | None = None,
+) -> Iterator[list[Any]]:
+    """
+    Yields the messages of the chat page by page, from the newest to the oldest.
+
+    Only one page is kept in memory. The history ends when tdlib returns an empty page.
+
+    Args:
+        telegram: a logged in client
+        chat_id: the chat
+        from_message_id: start from the message older than this one, from the newest message if 0
+        page_size: how many messages to ask for at once, 100 at most
+        timeout: how long to wait for every page, in seconds
+
+    Raises:
+        RuntimeError: if tdlib returns an error
+        TimeoutError: if tdlib does not answer in time
+    """
+    while True:
+        result = telegram.get_chat_history(chat_id, limit=page_size, from_message_id=from_message_id)
+        result.wait(timeout=timeout, raise_exc=True)
+        messages = result.update["messages"]  # type: ignore[index]
+
+        if not messages:
+            return
+
+        yield messages
+
+        from_message_id = messages[-1]["id"]
+
+
+def export_chat_history(
+    telegram: Telegram,
+    chat_id: int,
+    sink: str | Path,
+    format: ExportFormat = "jsonl",
+    checkpoint_path: str | Path | None = None,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    parquet_part_size: int = DEFAULT_PARQUET_PART_SIZE,
+    timeout: float | None = None,
+) -> int:
+    """
+    Writes the whole history of the chat to `sink`, from the newest message to the oldest.
+
+    With ``format='jsonl'`` the sink is a file with a message per line. With
+    ``format='parquet'`` it is a directory of ``part-N.parquet`` files of `parquet_part_size`
+    messages, with the ``id``, ``chat_id``, ``date``, ``content_type`` and ``json``
+    (the whole message) columns; it needs ``pyarrow``, ``pip install python-telegram[parquet]``.
+    Only a page of messages (a part for parquet) is kept in memory.
+
+    With `checkpoint_path`, the progress is saved after every page (every part for parquet).
+    An export started again with the same checkpoint continues from the saved position
+    and writes every message once, even if the previous export was interrupted
+    in the middle of a page.
+
+    Args:
+        telegram: a logged in client
+        chat_id: the chat to export
+        sink: the file or the directory to write to
+        format: ``jsonl`` or ``parquet``
+        checkpoint_path: the file with the progress of the export
+        page_size: how many messages to ask for at once, 100 at most
+        parquet_part_size: how many messages to write to one parquet file
+        timeout: how long to wait for every page, in seconds
+
+    Returns:
+        how many messages have been written, by this call only
+    """
+    if format == "jsonl":
+        exporter: _Exporter = _JSONLinesExporter(Path(sink))
+    elif format == "parquet":
+        exporter = _ParquetExporter(Path(sink), parquet_part_size)
+    else:
+        raise ValueError(f"Unknown export format: {format!r}")
+
+    checkpoint = _Checkpoint(Path(checkpoint_path)) if checkpoint_path is not None else None
+    state = checkpoint.read() if checkpoint is not None else {}
+
+    if state.get("finished"):
+        return 0
+
+    exporter.open(state)
+    exported = 0
+
+    try:
+        for messages in iter_chat_history(
+            telegram, chat_id, from_message_id=state.get("from_message_id", 0), page_size=page_size, timeout=timeout
+        ):
+            if exporter.write(messages) and checkpoint is not None:
+                checkpoint.write({"from_message_id": messages[-1]["id"], **exporter.position()})
+            exported += len(messages)
+
+        exporter.finish()
+
+        if checkpoint is not None:
+            checkpoint.write({"finished": True})
+    finally:
+        exporter.close()
+
+    logger.info("Exported %s messages of chat %s to %s", exported, chat_id, sink)
+
+    return exported
+
+
+def export_chats(
+    telegram: Telegram,
+    chat_ids: Iterable[int],
+    directory: str | Path,
+    format: ExportFormat = "jsonl",
+    max_workers: int = 4,
+    **kwargs: Any,
+) -> dict[int, int | Exception]:
+    """
+    Exports several chats at the same time, see `export_chat_history`.
+
+    The history of every chat goes to ``directory/<chat_id>.jsonl`` (or the
+    ``directory/<chat_id>`` directory for parquet) with the ``directory/<chat_id>.checkpoint``
+    checkpoint, so an interrupted export is resumed by calling it again.
+
+    Returns:
+        how many messages have been written for every chat, or the exception if its export has failed
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    results: dict[int, int | Exception] = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="export") as executor:
+        futures = {
+            executor.submit(
+                export_chat_history,
+                telegram,
+                chat_id,
+                directory / (f"{chat_id}.jsonl" if format == "jsonl" else str(chat_id)),
+                format=format,
+                checkpoint_path=directory / f"{chat_id}.checkpoint",
+                **kwargs,
+            ): chat_id
+            for chat_id in chat_ids
+        }
+
+        for future in as_completed(futures):
+            chat_id = futures[future]
+
+            try:
+                results[chat_id] = future.result()
+            except Exception as e:
+                logger.exception("[export_chats] export of chat %s has failed", chat_id)
+                results[chat_id] = e
+
+    return results
+
+
+def _to_json(message: Any) -> str:
+    return json.dumps(message, ensure_ascii=False, separators=(",", ":"), default=encode_object)
+
+
+class _Checkpoint:
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+    def read(self) -> dict[str, Any]:
+        if not self.path.exists():
+            return {}
+
+        state: dict[str, Any] = json.loads(self.path.read_text(encoding="utf-8"))
+        return state
+
+    def write(self, state: dict[str, Any]) -> None:
+        # replaced at once, so an interrupted write leaves the previous checkpoint
+        temporary_path = self.path.with_name(self.path.name + ".tmp")
+        temporary_path.write_text(json.dumps(state), encoding="utf-8")
+        os.replace(temporary_path, self.path)
+
+
+class _Exporter:
+    def open(self, state: dict[str, Any]) -> None:
+        """Prepares the sink to continue from the checkpoint"""
+
+    def write(self, messages: list[Any]) -> bool:
+        """Writes a page, returns whether everything written so far is on disk"""
+        raise NotImplementedError()
+
+    def position(self) -> dict[str, Any]:
+        """The position in the sink to save with the checkpoint"""
+        return {}
+
+    def finish(self) -> None:
+        """Writes what is left after the last page"""
+
+    def close(self) -> None:
+        pass
+
+
+class _JSONLinesExporter(_Exporter):
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._file: IO[str] | None = None
+
+    def open(self, state: dict[str, Any]) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = self.path.open("a+", encoding="utf-8")
+        # drops the lines written after the checkpoint
+        self._file.truncate(state.get("offset", 0))
+        self._file.seek(0, os.SEEK_END)
+
+    def write(self, messages: list[Any]) -> bool:
+        assert self._file is not None
+        self._file.writelines(_to_json(message) + "\n" for message in messages)
+        self._file.flush()
+        return True
+
+    def position(self) -> dict[str, Any]:
+        assert self._file is not None
+        return {"offset": self._file.tell()}
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+
+
+class _ParquetExporter(_Exporter):
+    def __init__(self, directory: Path, part_size: int) -> None:
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError(
+                "The parquet export needs pyarrow, install it with: pip install python-telegram[parquet]"
+            ) from None
+
+        self.directory = directory
+        self.part_size = part_size
+        self.part = 0
+        self._rows: list[Any] = []
+
+    def open(self, state: dict[str, Any]) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # the parts after the checkpoint are written again
+        self.part = state.get("part", 0)
+
+    def write(self, messages: list[Any]) -> bool:
+        self._rows.extend(messages)
+
+        if len(self._rows) < self.part_size:
+            return False
+
+        self._write_part()
+        return True
+
+    def position(self) -> dict[str, Any]:
+        return {"part": self.part}
+
+    def finish(self) -> None:
+        if self._rows:
+            self._write_part()
+
+    def _write_part(self) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.table(
+            {
+                "id": pa.array([message["id"] for message in self._rows], pa.int64()),
+                "chat_id": pa.array([message["chat_id"] for message in self._rows], pa.int64()),
+                "date": pa.array([message.get("date") for message in self._rows], pa.int64()),
+                "content_type": pa.array([message["content"]["@type"] for message in self._rows], pa.string()),
+                "json": pa.array([_to_json(message) for message in self._rows], pa.string()),
+            }
+        )
+        pq.write_table(table, self.directory / f"part-{self.part}.parquet")
+        self.part += 1
+        self._rows = []
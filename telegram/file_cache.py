@@ -0,0 +1,160 @@
+"""A content-addressed cache of downloaded files shared by many clients on the same host."""
+
+from __future__ import annotations
+
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# how long to wait for another process that writes to the index, in seconds
+BUSY_TIMEOUT = 30.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    unique_id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_last_used ON files (last_used);
+"""
+
+
+class FileCache:
+    """
+    Keeps one copy of every downloaded file, keyed by its ``remote.unique_id``,
+    which is the same for a file in every account.
+
+    The copies live in ``directory/files`` and the index is the SQLite database
+    ``directory/index.sqlite``, so the clients of several processes can share a cache.
+    A cached file is hard linked into the files directory of the client that asks for it,
+    or copied when the cache is on another file system. When the cached files take more
+    than `max_size` bytes, the least recently used ones are removed from the cache; the
+    links in the files directories of the clients stay.
+
+    Pass the cache to the clients that should share it::
+
+        cache = FileCache('/var/cache/tdlib', max_size=10 * 1024**3)
+        tg = Telegram(..., file_cache=cache)
+
+    Args:
+        directory: the directory of the cache, created if needed
+        max_size: the size budget of the cached files, in bytes
+    """
+
+    def __init__(self, directory: str | Path, max_size: int) -> None:
+        if max_size < 0:
+            raise ValueError("max_size must not be negative")
+
+        self.directory = Path(directory)
+        self.max_size = max_size
+        self._files_directory = self.directory / "files"
+        self._files_directory.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            self.directory / "index.sqlite",
+            check_same_thread=False,
+            isolation_level=None,
+            timeout=BUSY_TIMEOUT,
+        )
+        # readers and the writer of other processes do not block each other
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+
+    def get(self, unique_id: str, destination_directory: str | Path) -> Path | None:
+        """
+        Puts the cached copy of the file into `destination_directory`
+        and returns its path there, or ``None`` if the file is not cached.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT name FROM files WHERE unique_id = ?", (unique_id,)).fetchone()
+
+            if row is None:
+                return None
+
+            name: str = row[0]
+            cached = self._files_directory / name
+
+            if not cached.is_file():
+                # removed behind our back
+                self._db.execute("DELETE FROM files WHERE unique_id = ?", (unique_id,))
+                return None
+
+            self._db.execute("UPDATE files SET last_used = ? WHERE unique_id = ?", (time.time(), unique_id))
+
+        destination = Path(destination_directory) / name
+
+        if not destination.exists():
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            _link_or_copy(cached, destination)
+
+        return destination
+
+    def put(self, unique_id: str, path: str | Path) -> None:
+        """Adds a downloaded file to the cache and evicts the least recently used files over the budget"""
+        path = Path(path)
+        size = path.stat().st_size
+
+        if size > self.max_size:
+            return
+
+        # the unique id is safe to be a file name, the suffix keeps the file type visible
+        name = unique_id + path.suffix
+        cached = self._files_directory / name
+
+        with self._lock:
+            if self._db.execute("SELECT 1 FROM files WHERE unique_id = ?", (unique_id,)).fetchone():
+                return
+
+            if not cached.exists():
+                _link_or_copy(path, cached)
+
+            self._db.execute(
+                "INSERT OR REPLACE INTO files (unique_id, name, size, last_used) VALUES (?, ?, ?, ?)",
+                (unique_id, name, size, time.time()),
+            )
+            self._evict()
+
+    @property
+    def size(self) -> int:
+        """The size of the cached files, in bytes"""
+        with self._lock:
+            return int(self._db.execute("SELECT COALESCE(SUM(size), 0) FROM files").fetchone()[0])
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def _evict(self) -> None:
+        # called with the lock held
+        excess = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM files").fetchone()[0] - self.max_size
+
+        if excess <= 0:
+            return
+
+        evicted = []
+
+        for unique_id, name, size in self._db.execute("SELECT unique_id, name, size FROM files ORDER BY last_used"):
+            if excess <= 0:
+                break
+            evicted.append((unique_id,))
+            excess -= size
+            (self._files_directory / name).unlink(missing_ok=True)
+
+        self._db.executemany("DELETE FROM files WHERE unique_id = ?", evicted)
+        logger.debug("Evicted %s files from the file cache", len(evicted))
+
+
+def _link_or_copy(source: Path, destination: Path) -> None:
+    try:
+        os.link(source, destination)
+    except OSError:
+        # another file system, or links are not supported
+        shutil.copyfile(source, destination)
@@ -0,0 +1,476 @@
+"""Downloading and uploading files with a bounded number of concurrent transfers."""
+
+from __future__ import annotations
+
+import heapq
+import itertools
+import logging
+import queue
+import sqlite3
+import threading
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, ClassVar
+
+if TYPE_CHECKING:
+    from telegram.client import Telegram
+    from telegram.file_cache import FileCache
+    from telegram.utils import AsyncResult
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENT_DOWNLOADS = 4
+DEFAULT_MAX_CONCURRENT_UPLOADS = 4
+
+# the most messages tdlib sends as one album
+MAX_ALBUM_SIZE = 10
+
+ProgressCallback = Callable[[dict[str, Any]], None]
+
+
+class _Transfer:
+    __slots__ = ("callbacks", "file_id", "future", "priority", "request", "started")
+
+    def __init__(self, request: dict[str, Any], priority: int, file_id: int | None = None) -> None:
+        self.request = request
+        self.priority = priority
+        # unknown for an upload until tdlib answers preliminaryUploadFile
+        self.file_id = file_id
+        self.future: Future[dict[str, Any]] = Future()
+        self.callbacks: list[ProgressCallback] = []
+        # tdlib has answered the request
+        self.started = False
+
+
+class _TransferManager:
+    """
+    The common part of `DownloadManager` and `UploadManager`: no more than `max_concurrent`
+    transfers run at the same time, the waiting ones start by priority, and every transfer
+    is resolved from the ``updateFile`` updates of its file.
+    """
+
+    # the tdlib method that starts a transfer
+    METHOD: ClassVar[str]
+
+    def __init__(self, telegram: Telegram, max_concurrent: int) -> None:
+        if max_concurrent < 1:
+            raise ValueError("max_concurrent must be at least 1")
+
+        self.telegram = telegram
+        self.max_concurrent = max_concurrent
+        self._lock = threading.Lock()
+        # file id -> transfer, for the transfers whose file id is known
+        self._by_file_id: dict[int, _Transfer] = {}
+        self._active: set[_Transfer] = set()
+        # -priority, order, transfer
+        self._waiting: list[tuple[int, int, _Transfer]] = []
+        self._order = itertools.count()
+
+        telegram._update_file_hooks.append(self._on_update_file)
+
+    def _progress(self, file: dict[str, Any]) -> tuple[bool, bool]:
+        """Returns whether the transfer of the file is completed and whether it is still active"""
+        raise NotImplementedError()
+
+    def _submit(self, transfer: _Transfer) -> list[_Transfer]:
+        # called with the lock held
+        heapq.heappush(self._waiting, (-transfer.priority, next(self._order), transfer))
+        return self._take_waiting()
+
+    def _take_waiting(self) -> list[_Transfer]:
+        # called with the lock held
+        to_start = []
+
+        while self._waiting and len(self._active) < self.max_concurrent:
+            _, _, transfer = heapq.heappop(self._waiting)
+            self._active.add(transfer)
+            to_start.append(transfer)
+
+        return to_start
+
+    def _start(self, transfers: list[_Transfer]) -> None:
+        for transfer in transfers:
+            try:
+                result = self.telegram.call_method(self.METHOD, transfer.request)
+            except RuntimeError as e:
+                # the client has been stopped
+                self._finish(transfer, error=e)
+                continue
+
+            result.delivery_future().add_done_callback(self._on_started(transfer, result))
+
+    def _on_started(self, transfer: _Transfer, result: AsyncResult) -> Callable[[Future], None]:
+        def on_started(_: Future) -> None:
+            transfer.started = True
+
+            if result.error:
+                self._finish(transfer, error=RuntimeError(f"Telegram error: {result.error_info}"))
+            elif result.update is not None:
+                with self._lock:
+                    transfer.file_id = result.update["id"]
+                    self._by_file_id[transfer.file_id] = transfer
+                # a file that has been transferred before is complete already
+                self._on_file(result.update)
+
+        return on_started
+
+    def _on_update_file(self, update: dict[str, Any]) -> None:
+        # called in the listener thread for every updateFile
+        self._on_file(update["file"])
+
+    def _on_file(self, file: dict[str, Any]) -> None:
+        transfer = self._by_file_id.get(file["id"])
+
+        if transfer is None:
+            return
+
+        for callback in transfer.callbacks:
+            try:
+                callback(file)
+            except Exception:
+                logger.exception("Error in the progress callback of file %s", file["id"])
+
+        completed, active = self._progress(file)
+
+        if completed:
+            self._finish(transfer, file=file)
+        elif transfer.started and not active:
+            self._finish(transfer, error=RuntimeError(f"The transfer of file {file['id']} has stopped"))
+
+    def _finish(
+        self,
+        transfer: _Transfer,
+        file: dict[str, Any] | None = None,
+        error: BaseException | None = None,
+    ) -> None:
+        with self._lock:
+            if transfer not in self._active:
+                # finished already
+                return
+            self._active.discard(transfer)
+            if transfer.file_id is not None:
+                self._by_file_id.pop(transfer.file_id, None)
+            to_start = self._take_waiting()
+
+        if not transfer.future.cancelled():
+            if error is not None:
+                transfer.future.set_exception(error)
+            else:
+                transfer.future.set_result(file)  # type: ignore[arg-type]
+
+        self._start(to_start)
+
+
+class DownloadManager(_TransferManager):
+    """
+    Downloads files, no more than `max_concurrent` at the same time.
+
+    Every download is a future of the tdlib ``file`` object, resolved when
+    ``updateFile`` reports that the file is completely downloaded; its local path
+    is ``file['local']['path']``. Progress callbacks receive every ``file``
+    object of ``updateFile`` for the file, they are called in the listener thread
+    and must be quick. A file that is being downloaded or waits for its turn
+    is not downloaded twice, all the callers get the same future.
+
+    With a `cache`, the manager asks tdlib for the ``unique_id`` of the file first,
+    and a file that another client has downloaded is linked from the cache into
+    ``files_directory/files/cached`` instead of being downloaded again; the future
+    then has the ``file`` object with the local path of that link. Downloaded files
+    are added to the cache before their futures are resolved. The cache is used
+    from a thread of the manager, never from the listener thread.
+
+    ``Telegram.download_file`` and ``Telegram.download_many`` use a manager
+    with ``DEFAULT_MAX_CONCURRENT_DOWNLOADS`` and the ``file_cache`` of the client.
+
+    Args:
+        telegram: the client
+        max_concurrent: how many files are downloaded at the same time
+        cache: the cache shared with other clients
+    """
+
+    METHOD = "downloadFile"
+
+    def __init__(
+        self,
+        telegram: Telegram,
+        max_concurrent: int = DEFAULT_MAX_CONCURRENT_DOWNLOADS,
+        cache: FileCache | None = None,
+    ) -> None:
+        super().__init__(telegram, max_concurrent)
+        self.cache = cache
+        # runs the cache lookups and writes, created on first use
+        self._executor: ThreadPoolExecutor | None = None
+
+    def download(
+        self,
+        file_id: int,
+        priority: int = 1,
+        on_progress: ProgressCallback | None = None,
+    ) -> Future[dict[str, Any]]:
+        """
+        Starts downloading the file, or waits for its turn.
+
+        Args:
+            file_id: the tdlib id of the file
+            priority: from 1 to 32, files with a higher priority are downloaded first
+            on_progress: called with the ``file`` object on every ``updateFile``
+        """
+        to_start = []
+        look_up = False
+
+        with self._lock:
+            download = self._by_file_id.get(file_id)
+
+            if download is None:
+                request = {"file_id": file_id, "priority": priority, "offset": 0, "limit": 0, "synchronous": False}
+                download = self._by_file_id[file_id] = _Transfer(request, priority, file_id=file_id)
+
+                if self.cache is None:
+                    to_start = self._submit(download)
+                else:
+                    look_up = True
+
+            if on_progress is not None:
+                download.callbacks.append(on_progress)
+
+        if look_up:
+            self._look_up(download)
+
+        self._start(to_start)
+
+        return download.future
+
+    def download_many(self, file_ids: Iterable[int], priority: int = 1) -> Iterator[Future[dict[str, Any]]]:
+        """
+        Downloads the files and yields their futures as they finish, like ``concurrent.futures.as_completed``::
+
+            for future in tg.download_many(file_ids):
+                print(future.result()['local']['path'])
+        """
+        finished: queue.SimpleQueue[Future[dict[str, Any]]] = queue.SimpleQueue()
+        # started here, not on the first iteration
+        futures = {self.download(file_id, priority=priority) for file_id in file_ids}
+
+        for future in futures:
+            future.add_done_callback(finished.put)
+
+        return (finished.get() for _ in futures)
+
+    def _look_up(self, download: _Transfer) -> None:
+        try:
+            result = self.telegram.call_method("getFile", {"file_id": download.file_id})
+        except RuntimeError as e:
+            # the client has been stopped
+            self._resolve(download, error=e)
+            return
+
+        # the cache reads and writes files, which must not hold up the listener thread
+        result.delivery_future().add_done_callback(
+            lambda _: self._cache_executor().submit(self._on_looked_up, download, result)
+        )
+
+    def _on_looked_up(self, download: _Transfer, result: AsyncResult) -> None:
+        # called in the cache thread
+        file = result.update
+
+        if file is not None and not result.error and not file["local"]["is_downloading_completed"]:
+            try:
+                cached = self.cache.get(  # type: ignore[union-attr]
+                    file["remote"]["unique_id"], self.telegram.files_directory / "files" / "cached"
+                )
+            except (OSError, sqlite3.Error):
+                logger.exception("Could not read file %s from the file cache", file["id"])
+                cached = None
+
+            if cached is not None:
+                local = {**file["local"], "path": str(cached), "is_downloading_completed": True}
+                self._resolve(download, file={**file, "local": local})
+                return
+
+        # not cached, or the error is reported by downloadFile
+        with self._lock:
+            to_start = self._submit(download)
+
+        self._start(to_start)
+
+    def _resolve(
+        self,
+        download: _Transfer,
+        file: dict[str, Any] | None = None,
+        error: BaseException | None = None,
+    ) -> None:
+        # finishes a download that has not been started
+        with self._lock:
+            self._by_file_id.pop(download.file_id, None)  # type: ignore[arg-type]
+
+        if download.future.cancelled():
+            return
+        if error is not None:
+            download.future.set_exception(error)
+        else:
+            download.future.set_result(file)  # type: ignore[arg-type]
+
+    def _finish(
+        self,
+        transfer: _Transfer,
+        file: dict[str, Any] | None = None,
+        error: BaseException | None = None,
+    ) -> None:
+        if self.cache is not None and file is not None:
+            # resolved in the cache thread, once the file is in the cache
+            self._cache_executor().submit(self._cache_and_finish, self.cache, transfer, file)
+            return
+
+        super()._finish(transfer, file=file, error=error)
+
+    def _cache_and_finish(self, cache: FileCache, transfer: _Transfer, file: dict[str, Any]) -> None:
+        try:
+            cache.put(file["remote"]["unique_id"], file["local"]["path"])
+        except (OSError, sqlite3.Error):
+            logger.exception("Could not add file %s to the file cache", file["id"])
+
+        super()._finish(transfer, file=file)
+
+    def _cache_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="file_cache")
+            return self._executor
+
+    def _progress(self, file: dict[str, Any]) -> tuple[bool, bool]:
+        local = file["local"]
+        return local["is_downloading_completed"], local["is_downloading_active"]
+
+
+class UploadManager(_TransferManager):
+    """
+    Uploads files with ``preliminaryUploadFile``, no more than `max_concurrent` at the same time.
+
+    The files are uploaded before the messages with them are sent, so captions
+    can be prepared and more files uploaded in the meantime. Every upload is a future
+    of the tdlib ``file`` object, resolved when ``updateFile`` reports that the
+    upload is completed; a message refers to the uploaded file with ``input_file(file)``.
+    Progress callbacks work like those of `DownloadManager`.
+
+    ``Telegram.upload_file`` and ``Telegram.send_album`` use a manager
+    with ``DEFAULT_MAX_CONCURRENT_UPLOADS``.
+
+    Args:
+        telegram: the client
+        max_concurrent: how many files are uploaded at the same time
+    """
+
+    METHOD = "preliminaryUploadFile"
+
+    def __init__(self, telegram: Telegram, max_concurrent: int = DEFAULT_MAX_CONCURRENT_UPLOADS) -> None:
+        super().__init__(telegram, max_concurrent)
+
+    def upload(
+        self,
+        path: str | Path,
+        file_type: str = "fileTypeDocument",
+        priority: int = 1,
+        on_progress: ProgressCallback | None = None,
+    ) -> Future[dict[str, Any]]:
+        """
+        Starts uploading the file, or waits for its turn.
+
+        Args:
+            path: the local path of the file
+            file_type: the tdlib ``FileType`` of the file, for example ``fileTypePhoto``
+            priority: from 1 to 32, files with a higher priority are uploaded first
+            on_progress: called with the ``file`` object on every ``updateFile``
+        """
+        request = {
+            "file": {"@type": "inputFileLocal", "path": str(path)},
+            "file_type": {"@type": file_type},
+            "priority": priority,
+        }
+        upload = _Transfer(request, priority)
+
+        if on_progress is not None:
+            upload.callbacks.append(on_progress)
+
+        with self._lock:
+            to_start = self._submit(upload)
+
+        self._start(to_start)
+
+        return upload.future
+
+    def send_album(
+        self,
+        chat_id: int,
+        paths: Sequence[str | Path],
+        captions: Sequence[str | None] | None = None,
+        as_documents: bool = False,
+        timeout: float | None = None,
+    ) -> list[AsyncResult]:
+        """
+        Uploads the files concurrently and sends them as albums of up to ``MAX_ALBUM_SIZE`` files.
+
+        All the uploads start at once, and every album is sent with ``sendMessageAlbum``
+        as soon as its files are uploaded, while the next ones are still being uploaded.
+
+        Args:
+            chat_id: the chat to send the files to
+            paths: the local paths of the files
+            captions: a caption for every file
+            as_documents: send the files as documents instead of photos
+            timeout: how long to wait for every upload, in seconds
+
+        Returns:
+            the results of ``sendMessageAlbum``, one for every album,
+            or of ``sendMessage`` for an album of one file
+        """
+        if captions is not None and len(captions) != len(paths):
+            raise ValueError("There must be a caption for every file")
+
+        file_type = "fileTypeDocument" if as_documents else "fileTypePhoto"
+        uploads = [self.upload(path, file_type=file_type) for path in paths]
+
+        # prepared while the files are being uploaded
+        contents = [
+            _input_message_content(as_documents, captions[n] if captions is not None else None)
+            for n in range(len(paths))
+        ]
+
+        results = []
+
+        for start in range(0, len(paths), MAX_ALBUM_SIZE):
+            album = contents[start : start + MAX_ALBUM_SIZE]
+
+            for content, upload in zip(album, uploads[start : start + MAX_ALBUM_SIZE]):
+                content["document" if as_documents else "photo"] = input_file(upload.result(timeout=timeout))
+
+            if len(album) == 1:
+                result = self.telegram.call_method(
+                    "sendMessage", {"chat_id": chat_id, "input_message_content": album[0]}
+                )
+            else:
+                result = self.telegram.call_method(
+                    "sendMessageAlbum", {"chat_id": chat_id, "input_message_contents": album}
+                )
+
+            results.append(result)
+
+        return results
+
+    def _progress(self, file: dict[str, Any]) -> tuple[bool, bool]:
+        remote = file["remote"]
+        return remote["is_uploading_completed"], remote["is_uploading_active"]
+
+
+def input_file(file: dict[str, Any]) -> dict[str, Any]:
+    """Returns the ``InputFile`` that refers to a file known to tdlib, for example an uploaded one"""
+    return {"@type": "inputFileId", "id": file["id"]}
+
+
+def _input_message_content(as_document: bool, caption: str | None) -> dict[str, Any]:
+    content: dict[str, Any] = {"@type": "inputMessageDocument" if as_document else "inputMessagePhoto"}
+
+    if caption is not None:
+        content["caption"] = {"@type": "formattedText", "text": caption, "entities": []}
+
+    return content
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import re
+from collections.abc import Callable, Iterable
+from typing import Any
+
+from telegram.utils import get_message_text
+
+# matches every update type
+CATCH_ALL: str = "*"
+
+
+class UpdateFilter:
+    """
+    Declarative filter for update handlers.
+
+    An update passes the filter only if it matches all the given conditions.
+    Filters are checked in the listener thread before the update is put into
+    the workers queue, so updates that no handler wants never reach the worker.
+
+    Args:
+        chat_ids: only updates from these chats
+        content_types: only messages with these content types, for example ``messageText``
+        is_outgoing: only outgoing (``True``) or only incoming (``False``) messages
+        text: a regular expression searched in the text or the caption of a message
+        predicate: a function that receives the update and returns ``True`` to accept it
+    """
+
+    __slots__ = ("chat_ids", "content_types", "is_outgoing", "predicate", "text")
+
+    def __init__(
+        self,
+        chat_ids: Iterable[int] | None = None,
+        content_types: Iterable[str] | None = None,
+        is_outgoing: bool | None = None,
+        text: str | re.Pattern[str] | None = None,
+        predicate: Callable[[dict[Any, Any]], bool] | None = None,
+    ) -> None:
+        self.chat_ids = frozenset(chat_ids) if chat_ids is not None else None
+        self.content_types = frozenset(content_types) if content_types is not None else None
+        self.is_outgoing = is_outgoing
+        self.text = re.compile(text) if isinstance(text, str) else text
+        self.predicate = predicate
+
+    def __repr__(self) -> str:
+        conditions = ", ".join(
+            f"{name}={getattr(self, name)!r}" for name in self.__slots__ if getattr(self, name) is not None
+        )
+        return f"UpdateFilter({conditions})"
+
+    def __call__(self, update: dict[Any, Any]) -> bool:
+        message = update.get("message")
+
+        if self.chat_ids is not None:
+            chat_id = update.get("chat_id")
+            if chat_id is None and message is not None:
+                chat_id = message.get("chat_id")
+            if chat_id not in self.chat_ids:
+                return False
+
+        if self.is_outgoing is not None and (message is None or message.get("is_outgoing") is not self.is_outgoing):
+            return False
+
+        if self.content_types is not None or self.text is not None:
+            content = _get_content(update)
+
+            if self.content_types is not None and (content is None or content.get("@type") not in self.content_types):
+                return False
+
+            if self.text is not None:
+                text = get_message_text(content)
+                if text is None or self.text.search(text) is None:
+                    return False
+
+        return self.predicate is None or self.predicate(update)
+
+
+def matches_update_type(handler_type: str, update_type: str) -> bool:
+    """
+    Checks if handlers registered for `handler_type` must receive updates of `update_type`.
+
+    `handler_type` is an exact update type, ``*`` for all updates,
+    or a prefix followed by ``*``, for example ``updateChat*``.
+    """
+    if handler_type == update_type or handler_type == CATCH_ALL:
+        return True
+
+    return handler_type.endswith("*") and update_type.startswith(handler_type[:-1])
+
+
+def _get_content(update: dict[Any, Any]) -> dict[Any, Any] | None:
+    message = update.get("message")
+
+    if message is not None:
+        content: dict[Any, Any] | None = message.get("content")
+        return content
+
+    # updateMessageContent
+    new_content: dict[Any, Any] | None = update.get("new_content")
+    return new_content
@@ -0,0 +1,305 @@
+"""Compact models for the most frequent tdlib objects.
+
+tdlib sends every object as a JSON dict. With ``Telegram(..., compact_models=True)``
+the objects listed in ``MODELS`` are decoded into instances of the classes below
+instead. They keep their fields in ``__slots__``, which takes several times less
+memory than a dict, and they can be read both as attributes and like dicts,
+so handlers written for dicts keep working::
+
+    def new_message_handler(update):
+        message = update.message  # or update['message']
+        print(message.chat_id, message['content'])
+"""
+
+from __future__ import annotations
+
+from collections.abc import Iterator, Mapping
+from typing import Any, ClassVar
+
+
+class TDObject(Mapping):
+    """
+    Base class of the compact tdlib objects.
+
+    Fields that the model does not know about, for example the ones added in
+    a newer tdlib, are kept in a dict, so nothing from the original object is lost.
+    """
+
+    __slots__ = ("_extra", "_other")
+
+    _extra: Any
+    _other: dict[str, Any] | None
+
+    TYPE: ClassVar[str] = ""
+    FIELDS: ClassVar[frozenset[str]] = frozenset()
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        cls.FIELDS = frozenset(cls.__slots__)
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> TDObject:
+        obj = cls.__new__(cls)
+        obj._extra = None
+        obj._other = None
+        fields = cls.FIELDS
+
+        for key, value in data.items():
+            if key in fields:
+                setattr(obj, key, value)
+            elif key == "@extra":
+                obj._extra = value
+            elif key != "@type":
+                if obj._other is None:
+                    obj._other = {}
+                obj._other[key] = value
+
+        return obj
+
+    def __getattr__(self, name: str) -> Any:
+        # only called for the fields that were not in the original object
+        if name in self.FIELDS:
+            return None
+        raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+
+    def __getitem__(self, key: str) -> Any:
+        if key == "@type":
+            return self.TYPE
+
+        if key == "@extra":
+            if self._extra is None:
+                raise KeyError(key)
+            return self._extra
+
+        if key in self.FIELDS:
+            try:
+                return object.__getattribute__(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+
+        if self._other is not None and key in self._other:
+            return self._other[key]
+
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key in self.FIELDS:
+            setattr(self, key, value)
+        elif key == "@extra":
+            self._extra = value
+        elif key == "@type":
+            raise KeyError("@type of a compact model can not be changed")
+        else:
+            if self._other is None:
+                self._other = {}
+            self._other[key] = value
+
+    def __iter__(self) -> Iterator[str]:
+        yield "@type"
+
+        for key in self.__slots__:
+            try:
+                object.__getattribute__(self, key)
+            except AttributeError:
+                continue
+            yield key
+
+        if self._other is not None:
+            yield from self._other
+
+        if self._extra is not None:
+            yield "@extra"
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+    def to_dict(self) -> dict[str, Any]:
+        """Returns the object as a dict, nested compact objects are converted too"""
+        return {key: _to_plain(value) for key, value in self.items()}
+
+
+def _to_plain(value: Any) -> Any:
+    if isinstance(value, TDObject):
+        return value.to_dict()
+    if isinstance(value, list):
+        return [_to_plain(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _to_plain(item) for key, item in value.items()}
+    return value
+
+
+class FormattedText(TDObject):
+    __slots__ = ("entities", "text")
+    TYPE = "formattedText"
+
+
+class User(TDObject):
+    __slots__ = (
+        "accent_color_id",
+        "added_to_attachment_menu",
+        "background_custom_emoji_id",
+        "emoji_status",
+        "first_name",
+        "has_active_stories",
+        "has_unread_active_stories",
+        "have_access",
+        "id",
+        "is_close_friend",
+        "is_contact",
+        "is_fake",
+        "is_mutual_contact",
+        "is_premium",
+        "is_scam",
+        "is_support",
+        "is_verified",
+        "language_code",
+        "last_name",
+        "phone_number",
+        "profile_accent_color_id",
+        "profile_background_custom_emoji_id",
+        "profile_photo",
+        "restriction_reason",
+        "restricts_new_chats",
+        "status",
+        "type",
+        "usernames",
+    )
+    TYPE = "user"
+
+
+class Chat(TDObject):
+    __slots__ = (
+        "accent_color_id",
+        "action_bar",
+        "available_reactions",
+        "background",
+        "background_custom_emoji_id",
+        "block_list",
+        "business_bot_manage_bar",
+        "can_be_deleted_for_all_users",
+        "can_be_deleted_only_for_self",
+        "can_be_reported",
+        "chat_lists",
+        "client_data",
+        "default_disable_notification",
+        "draft_message",
+        "emoji_status",
+        "has_protected_content",
+        "has_scheduled_messages",
+        "id",
+        "is_marked_as_unread",
+        "is_translatable",
+        "last_message",
+        "last_read_inbox_message_id",
+        "last_read_outbox_message_id",
+        "message_auto_delete_time",
+        "message_sender_id",
+        "notification_settings",
+        "pending_join_requests",
+        "permissions",
+        "photo",
+        "positions",
+        "profile_accent_color_id",
+        "profile_background_custom_emoji_id",
+        "reply_markup_message_id",
+        "theme_name",
+        "title",
+        "type",
+        "unread_count",
+        "unread_mention_count",
+        "unread_reaction_count",
+        "video_chat",
+        "view_as_topics",
+    )
+    TYPE = "chat"
+
+
+class Message(TDObject):
+    __slots__ = (
+        "author_signature",
+        "auto_delete_in",
+        "can_be_deleted_for_all_users",
+        "can_be_deleted_only_for_self",
+        "can_be_edited",
+        "can_be_forwarded",
+        "can_be_replied_in_another_chat",
+        "can_be_saved",
+        "can_get_added_reactions",
+        "can_get_media_timestamp_links",
+        "can_get_message_thread",
+        "can_get_read_date",
+        "can_get_statistics",
+        "can_get_viewers",
+        "can_report_reactions",
+        "chat_id",
+        "contains_unread_mention",
+        "content",
+        "date",
+        "edit_date",
+        "effect_id",
+        "fact_check",
+        "forward_info",
+        "has_timestamped_media",
+        "id",
+        "import_info",
+        "interaction_info",
+        "is_channel_post",
+        "is_from_offline",
+        "is_outgoing",
+        "is_pinned",
+        "is_topic_message",
+        "media_album_id",
+        "message_thread_id",
+        "reply_markup",
+        "reply_to",
+        "restriction_reason",
+        "saved_messages_topic_id",
+        "scheduling_state",
+        "self_destruct_in",
+        "self_destruct_type",
+        "sender_boost_count",
+        "sender_business_bot_user_id",
+        "sender_id",
+        "sending_state",
+        "unread_reactions",
+        "via_bot_user_id",
+    )
+    TYPE = "message"
+
+
+class UpdateNewMessage(TDObject):
+    __slots__ = ("message",)
+    TYPE = "updateNewMessage"
+
+
+MODELS: dict[str, type[TDObject]] = {
+    model.TYPE: model for model in (FormattedText, User, Chat, Message, UpdateNewMessage)
+}
+
+
+def decode_object(data: dict[str, Any]) -> dict[str, Any] | TDObject:
+    """
+    Converts a decoded tdlib object into its compact model, if there is one.
+
+    It is meant to be used as ``object_hook`` of ``json.loads``.
+    """
+    model = MODELS.get(data.get("@type", ""))
+
+    if model is None:
+        return data
+
+    return model.from_dict(data)
+
+
+def encode_object(obj: Any) -> Any:
+    """
+    Converts a compact model back into a dict for JSON.
+
+    It is meant to be used as ``default`` of ``json.dumps``.
+    """
+    if isinstance(obj, TDObject):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
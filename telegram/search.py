@@ -0,0 +1,186 @@
+"""A local full-text index of messages, searched without requests to tdlib."""
+
+from __future__ import annotations
+
+import logging
+import sqlite3
+import threading
+from collections.abc import Iterable
+from pathlib import Path
+from typing import Any
+
+from telegram.utils import get_message_text
+
+logger = logging.getLogger(__name__)
+
+# the updates that change the index
+INDEXED_UPDATES = frozenset(
+    ("updateNewMessage", "updateMessageContent", "updateMessageSendSucceeded", "updateDeleteMessages")
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    chat_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    date INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    UNIQUE (chat_id, message_id)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(text, content='messages', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS messages_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_update AFTER UPDATE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    INSERT INTO messages_fts (rowid, text) VALUES (new.id, new.text);
+END;
+"""
+
+
+class MessageIndex:
+    """
+    A full-text index of the texts and captions of messages, an SQLite FTS5 database.
+
+    ``Telegram.enable_local_search`` keeps the index of a client up to date from
+    ``updateNewMessage``, ``updateMessageContent``, ``updateMessageSendSucceeded`` and
+    ``updateDeleteMessages``, in batches, and ``Telegram.search_local`` searches it.
+    Older messages can be added from history pages::
+
+        index = MessageIndex(tg.files_directory / 'messages.sqlite')
+        tg.enable_local_search(index)
+
+        for messages in iter_chat_history(tg, chat_id):
+            index.add_messages(messages)
+
+        tg.search_local('invoice march', chat_ids=[chat_id])
+
+    Use one index per account, message ids are unique only within an account.
+
+    Args:
+        path: the database file, created if needed
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+
+    def add_messages(self, messages: Iterable[Any]) -> None:
+        """Adds the messages or replaces their texts, messages without a text or a caption are skipped"""
+        with self._lock, self._db:
+            self._upsert_messages(messages)
+
+    def delete_messages(self, chat_id: int, message_ids: Iterable[int]) -> None:
+        with self._lock, self._db:
+            self._delete(chat_id, message_ids)
+
+    def index_updates(self, updates: list[dict[str, Any]]) -> None:
+        """
+        Applies a batch of updates in one transaction, in their order.
+        It is the handler that ``Telegram.enable_local_search`` registers.
+        """
+        with self._lock, self._db:
+            for update in updates:
+                self._index_update(update)
+
+    def search(self, query: str, chat_ids: Iterable[int] | None = None, limit: int = 100) -> list[dict[str, Any]]:
+        """
+        Returns the messages that contain all the words of the query, the newest first.
+
+        Args:
+            query: the words to search for, the word forms are not taken into account
+            chat_ids: only messages from these chats
+            limit: the maximum number of messages to return
+
+        Returns:
+            dicts with the ``chat_id``, ``message_id``, ``date`` and ``text`` of the messages
+        """
+        match = _match_expression(query)
+
+        if not match:
+            return []
+
+        sql = (
+            "SELECT messages.chat_id, messages.message_id, messages.date, messages.text "
+            "FROM messages_fts JOIN messages ON messages.id = messages_fts.rowid "
+            "WHERE messages_fts MATCH ?"
+        )
+        params: list[Any] = [match]
+
+        if chat_ids is not None:
+            chat_ids = list(chat_ids)
+            sql += f" AND messages.chat_id IN ({', '.join('?' * len(chat_ids))})"
+            params.extend(chat_ids)
+
+        sql += " ORDER BY messages.date DESC, messages.message_id DESC LIMIT ?"
+        params.append(limit)
+
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+
+        return [{"chat_id": row[0], "message_id": row[1], "date": row[2], "text": row[3]} for row in rows]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return int(self._db.execute("SELECT COUNT(*) FROM messages").fetchone()[0])
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def _index_update(self, update: dict[str, Any]) -> None:
+        # called with the lock held, in a transaction
+        update_type = update["@type"]
+
+        if update_type == "updateNewMessage":
+            self._upsert_messages([update["message"]])
+        elif update_type == "updateMessageSendSucceeded":
+            # the message has got its real id
+            message = update["message"]
+            self._delete(message["chat_id"], [update["old_message_id"]])
+            self._upsert_messages([message])
+        elif update_type == "updateMessageContent":
+            text = get_message_text(update["new_content"])
+            if text:
+                # a message that had no text, e.g. a photo that got a caption, is added;
+                # the update has no date, it is set when the message is added from history
+                self._db.execute(
+                    "INSERT INTO messages (chat_id, message_id, date, text) VALUES (?, ?, 0, ?) "
+                    "ON CONFLICT (chat_id, message_id) DO UPDATE SET text = excluded.text",
+                    (update["chat_id"], update["message_id"], text),
+                )
+            else:
+                self._delete(update["chat_id"], [update["message_id"]])
+        elif update_type == "updateDeleteMessages" and update.get("is_permanent"):
+            # messages removed only from the tdlib cache stay in the index
+            self._delete(update["chat_id"], update["message_ids"])
+
+    def _upsert_messages(self, messages: Iterable[Any]) -> None:
+        self._upsert(
+            (message["chat_id"], message["id"], message.get("date") or 0, text)
+            for message in messages
+            if (text := get_message_text(message.get("content")))
+        )
+
+    def _upsert(self, rows: Iterable[tuple[int, int, int, str]]) -> None:
+        self._db.executemany(
+            "INSERT INTO messages (chat_id, message_id, date, text) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (chat_id, message_id) DO UPDATE SET text = excluded.text, date = excluded.date",
+            rows,
+        )
+
+    def _delete(self, chat_id: int, message_ids: Iterable[int]) -> None:
+        self._db.executemany(
+            "DELETE FROM messages WHERE chat_id = ? AND message_id = ?",
+            ((chat_id, message_id) for message_id in message_ids),
+        )
+
+
+def _match_expression(query: str) -> str:
+    # every word is quoted, so the punctuation of the query is not parsed as FTS5 syntax
+    return " ".join('"{}"'.format(word.replace('"', '""')) for word in query.split())
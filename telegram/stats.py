@@ -0,0 +1,320 @@
+"""Streaming word statistics over chat histories, with exact and approximate mergeable counters."""
+
+from __future__ import annotations
+
+import heapq
+import string
+import zlib
+from array import array
+from collections import Counter
+from collections.abc import Iterable
+from typing import TYPE_CHECKING, Any
+
+from telegram.export import iter_chat_history
+from telegram.utils import get_message_text
+
+if TYPE_CHECKING:
+    from telegram.client import Telegram
+
+# punctuation becomes spaces, so "hello,world" are two words
+_PUNCTUATION = str.maketrans(string.punctuation, " " * len(string.punctuation))
+
+
+def tokenize(texts: Iterable[str], min_length: int = 4) -> list[str]:
+    """
+    Splits the texts into lowercase words without punctuation.
+
+    The texts are joined and processed at once, so a page of messages costs one
+    ``lower``, ``translate`` and ``split`` instead of one per message.
+
+    Args:
+        texts: the texts, for example of a page of messages
+        min_length: shorter words are skipped
+    """
+    words = "\n".join(texts).lower().translate(_PUNCTUATION).split()
+
+    if min_length <= 1:
+        return words
+
+    return [word for word in words if len(word) >= min_length]
+
+
+class SpaceSaving:
+    """
+    The approximate top of the most frequent words in a fixed amount of memory, the Space-Saving algorithm.
+
+    At most `capacity` words are counted. A new word replaces the word with the smallest count and
+    inherits it, so counts are overestimated by at most ``error(word)``, and every word that occurs
+    more than ``n / capacity`` times out of ``n`` is guaranteed to be in the top.
+
+    Summaries of different parts of a stream can be merged, the merged summary keeps the same
+    guarantees for the whole stream.
+    """
+
+    __slots__ = ("_heap", "capacity", "counts", "errors")
+
+    def __init__(self, capacity: int = 1000) -> None:
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+
+        self.capacity = capacity
+        self.counts: dict[str, int] = {}
+        self.errors: dict[str, int] = {}
+        # count, word; an entry is outdated when the word has another count now
+        self._heap: list[tuple[int, str]] = []
+
+    def update(self, words: Iterable[str]) -> None:
+        counts = self.counts
+
+        for word, count in Counter(words).items():
+            if word in counts:
+                counts[word] += count
+            elif len(counts) < self.capacity:
+                counts[word] = count
+                self.errors[word] = 0
+            else:
+                minimum, evicted = self._pop_minimum()
+                del counts[evicted]
+                del self.errors[evicted]
+                counts[word] = minimum + count
+                self.errors[word] = minimum
+
+            heapq.heappush(self._heap, (counts[word], word))
+
+        if len(self._heap) > 4 * self.capacity:
+            self._rebuild_heap()
+
+    def most_common(self, n: int | None = None) -> list[tuple[str, int]]:
+        return Counter(self.counts).most_common(n)
+
+    def error(self, word: str) -> int:
+        """How much the count of the word can be overestimated"""
+        return self.errors.get(word, 0)
+
+    def merge(self, other: SpaceSaving) -> None:
+        """Adds the counts of another summary, for example of another chat or process"""
+        # a word missing in one of the summaries could have occurred up to its minimum count there
+        own_minimum = self._minimum_count()
+        other_minimum = other._minimum_count()
+        counts: dict[str, int] = {}
+        errors: dict[str, int] = {}
+
+        for word in self.counts.keys() | other.counts.keys():
+            counts[word] = self.counts.get(word, own_minimum) + other.counts.get(word, other_minimum)
+            errors[word] = self.errors.get(word, own_minimum) + other.errors.get(word, other_minimum)
+
+        top = heapq.nlargest(self.capacity, counts, key=counts.__getitem__)
+        self.counts = {word: counts[word] for word in top}
+        self.errors = {word: errors[word] for word in top}
+        self._rebuild_heap()
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def _minimum_count(self) -> int:
+        # a summary that is not full has counted every word it has seen
+        if len(self.counts) < self.capacity:
+            return 0
+        return min(self.counts.values())
+
+    def _pop_minimum(self) -> tuple[int, str]:
+        while True:
+            count, word = heapq.heappop(self._heap)
+            if self.counts.get(word) == count:
+                return count, word
+
+    def _rebuild_heap(self) -> None:
+        self._heap = [(count, word) for word, count in self.counts.items()]
+        heapq.heapify(self._heap)
+
+    def __getstate__(self) -> dict[str, Any]:
+        return {"capacity": self.capacity, "counts": self.counts, "errors": self.errors}
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.capacity = state["capacity"]
+        self.counts = state["counts"]
+        self.errors = state["errors"]
+        self._rebuild_heap()
+
+
+class CountMinSketch:
+    """
+    Approximate counts of any number of words in ``width * depth`` counters.
+
+    A count is never underestimated, and is overestimated by more than ``2n / width``
+    out of ``n`` words with a probability of at most ``2 ** -depth``. The rows are hashed
+    with ``crc32``, which does not depend on the process, so sketches with the same
+    `width` and `depth` made in different processes can be merged.
+    """
+
+    __slots__ = ("depth", "rows", "total", "width")
+
+    def __init__(self, width: int = 2048, depth: int = 4) -> None:
+        if width < 1 or depth < 1:
+            raise ValueError("width and depth must be at least 1")
+
+        self.width = width
+        self.depth = depth
+        self.total = 0
+        self.rows = [array("q", bytes(8 * width)) for _ in range(depth)]
+
+    def update(self, words: Iterable[str]) -> None:
+        width = self.width
+
+        for word, count in Counter(words).items():
+            data = word.encode("utf-8")
+            for seed, row in enumerate(self.rows):
+                row[zlib.crc32(data, seed) % width] += count
+            self.total += count
+
+    def estimate(self, word: str) -> int:
+        data = word.encode("utf-8")
+        return min(row[zlib.crc32(data, seed) % self.width] for seed, row in enumerate(self.rows))
+
+    def merge(self, other: CountMinSketch) -> None:
+        if (self.width, self.depth) != (other.width, other.depth):
+            raise ValueError("Only sketches with the same width and depth can be merged")
+
+        for row, other_row in zip(self.rows, other.rows):
+            for n, count in enumerate(other_row):
+                row[n] += count
+
+        self.total += other.total
+
+    def __getstate__(self) -> dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        for name, value in state.items():
+            setattr(self, name, value)
+
+
+class WordStats:
+    """
+    Word statistics of a stream of messages, which can be built page by page and merged.
+
+    The top of the most frequent words is kept by `SpaceSaving` in a bounded amount of memory.
+    With ``exact=True`` every word is also counted exactly, which takes memory for every
+    distinct word. With ``sketch=True`` a `CountMinSketch` estimates the count of any word,
+    including the ones that are not in the top.
+
+    The stats of several chats, threads or processes (they can be pickled) are combined with `merge`::
+
+        stats = WordStats()
+        for chat_id in chat_ids:
+            stats.merge(collect_word_stats(tg, chat_id))
+        print(stats.most_common(30))
+
+    Args:
+        top_size: how many words the approximate top keeps
+        exact: count every word exactly
+        sketch: estimate the count of any word
+        min_length: shorter words are skipped
+    """
+
+    __slots__ = ("exact", "messages", "min_length", "sketch", "top", "words")
+
+    def __init__(self, top_size: int = 1000, exact: bool = False, sketch: bool = False, min_length: int = 4) -> None:
+        self.min_length = min_length
+        self.top = SpaceSaving(top_size)
+        self.exact: Counter[str] | None = Counter() if exact else None
+        self.sketch: CountMinSketch | None = CountMinSketch() if sketch else None
+        self.messages = 0
+        self.words = 0
+
+    def add_texts(self, texts: Iterable[str]) -> None:
+        words = tokenize(texts, min_length=self.min_length)
+
+        self.words += len(words)
+        self.top.update(words)
+
+        if self.exact is not None:
+            self.exact.update(words)
+
+        if self.sketch is not None:
+            self.sketch.update(words)
+
+    def add_messages(self, messages: Iterable[Any]) -> None:
+        """Adds the texts and captions of the messages, for example of a page of ``iter_chat_history``"""
+        texts = []
+
+        for message in messages:
+            self.messages += 1
+            text = get_message_text(message.get("content"))
+            if text:
+                texts.append(text)
+
+        self.add_texts(texts)
+
+    def count(self, word: str) -> int:
+        """The exact count if it is known, otherwise an estimate that is never lower than the real count"""
+        if self.exact is not None:
+            return self.exact[word]
+
+        if self.sketch is not None:
+            return self.sketch.estimate(word)
+
+        return self.top.counts.get(word, 0)
+
+    def most_common(self, n: int | None = None) -> list[tuple[str, int]]:
+        if self.exact is not None:
+            return self.exact.most_common(n)
+
+        return self.top.most_common(n)
+
+    def merge(self, other: WordStats) -> None:
+        self.messages += other.messages
+        self.words += other.words
+        self.top.merge(other.top)
+
+        if self.exact is not None:
+            if other.exact is None:
+                raise ValueError("Exact stats can only be merged with exact stats")
+            self.exact.update(other.exact)
+
+        if self.sketch is not None:
+            if other.sketch is None:
+                raise ValueError("Stats with a sketch can only be merged with stats with a sketch")
+            self.sketch.merge(other.sketch)
+
+    def __getstate__(self) -> dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        for name, value in state.items():
+            setattr(self, name, value)
+
+
+def collect_word_stats(
+    telegram: Telegram,
+    chat_id: int,
+    stats: WordStats | None = None,
+    limit: int | None = None,
+    **kwargs: Any,
+) -> WordStats:
+    """
+    Reads the history of the chat page by page and adds it to the stats.
+
+    Args:
+        telegram: a logged in client
+        chat_id: the chat
+        stats: the stats to add to, ``WordStats()`` if not set
+        limit: stop after this many messages, approximately, the whole history if not set
+        kwargs: passed to ``iter_chat_history``
+
+    Returns:
+        the stats
+    """
+    if stats is None:
+        stats = WordStats()
+
+    read = 0
+
+    for messages in iter_chat_history(telegram, chat_id, **kwargs):
+        stats.add_messages(messages)
+        read += len(messages)
+
+        if limit is not None and read >= limit:
+            break
+
+    return stats
@@ -5,9 +5,15 @@ import importlib.resources
 import json
 import logging
 import platform
+import threading
+import time
+from collections.abc import Callable
 from ctypes import CDLL, CFUNCTYPE, c_char_p, c_double, c_int, c_longlong, c_void_p
 from typing import Any
 
+from telegram.models import encode_object
+from telegram.utils import DebugLogSampler
+
 logger = logging.getLogger(__name__)
 
 
@@ -29,57 +35,120 @@ def _get_tdjson_lib_path() -> str:
     return str(importlib.resources.files("telegram").joinpath(f"lib/{lib_name}"))
 
 
-class TDJson:
-    def __init__(self, library_path: str | None = None, verbosity: int = 2) -> None:
-        if library_path is None:
-            library_path = _get_tdjson_lib_path()
-        logger.info('Using shared library "%s"', library_path)
+# tdlib verbosity levels: 0 fatal, 1 error, 2 warning, 3 info, 4 debug, 5+ verbose debug
+_TDLIB_LOG_LEVELS = (logging.CRITICAL, logging.ERROR, logging.WARNING, logging.INFO, logging.DEBUG)
 
-        self._build_client(library_path, verbosity)
+# messages of this verbosity and more talkative are sampled
+_TDLIB_SAMPLED_VERBOSITY = 3
 
-    def __del__(self) -> None:
-        if hasattr(self, "_td_json_client_destroy"):
-            self.stop()
 
-    def _build_client(self, library_path: str, verbosity: int) -> None:
+class TDLibLogForwarder:
+    """
+    Forwards the log messages of tdlib to the ``telegram.tdjson`` logger.
+
+    tdlib calls it from its own threads for every message, so it is kept cheap:
+    messages the logger would ignore are skipped at once, only one of every
+    `sample_rate` info and debug messages is forwarded, and no more than
+    `rate_limit` messages per second are forwarded at all. Fatal errors are
+    always forwarded. The number of messages dropped by the rate limit is
+    logged with the next forwarded message.
+
+    Args:
+        rate_limit: messages per second
+        sample_rate: forward one of every `sample_rate` info and debug messages
+    """
+
+    def __init__(self, rate_limit: float = 100.0, sample_rate: int = 1) -> None:
+        if rate_limit <= 0:
+            raise ValueError("rate_limit must be positive")
+        if sample_rate < 1:
+            raise ValueError("sample_rate must be at least 1")
+
+        self.rate_limit = rate_limit
+        self.sample_rate = sample_rate
+        self._tokens = rate_limit
+        self._updated_at = time.monotonic()
+        self._sampled = 0
+        self._dropped = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, verbosity_level: int, message: bytes) -> None:
+        level = _TDLIB_LOG_LEVELS[min(max(verbosity_level, 0), len(_TDLIB_LOG_LEVELS) - 1)]
+
+        if not logger.isEnabledFor(level):
+            return
+
+        with self._lock:
+            if verbosity_level >= _TDLIB_SAMPLED_VERBOSITY:
+                self._sampled += 1
+                if self._sampled % self.sample_rate:
+                    return
+
+            if verbosity_level > 0:
+                now = time.monotonic()
+                self._tokens = min(self.rate_limit, self._tokens + (now - self._updated_at) * self.rate_limit)
+                self._updated_at = now
+
+                if self._tokens < 1:
+                    self._dropped += 1
+                    return
+
+                self._tokens -= 1
+
+            dropped, self._dropped = self._dropped, 0
+
+        if dropped:
+            logger.warning("%s tdlib log messages have been dropped by the rate limit", dropped)
+
+        logger.log(level, "[tdlib] %s", message.decode("utf-8", errors="replace").rstrip())
+
+
+class _TDJsonLibrary:
+    """
+    The loaded libtdjson and the prototypes of its functions.
+
+    The library is loaded once per path and shared by all the clients of the process,
+    the fatal error callback is registered once too, because tdlib keeps it globally.
+    """
+
+    def __init__(self, library_path: str) -> None:
+        logger.info('Using shared library "%s"', library_path)
         self._tdjson = CDLL(library_path)
 
         # load TDLib functions from shared library
-        self._td_json_client_create = self._tdjson.td_json_client_create
-        self._td_json_client_create.restype = c_void_p
-        self._td_json_client_create.argtypes = []
+        self.td_json_client_create = self._tdjson.td_json_client_create
+        self.td_json_client_create.restype = c_void_p
+        self.td_json_client_create.argtypes = []
 
-        self.td_json_client: int | None = self._td_json_client_create()
+        self.td_json_client_receive = self._tdjson.td_json_client_receive
+        self.td_json_client_receive.restype = c_char_p
+        self.td_json_client_receive.argtypes = [c_void_p, c_double]
 
-        self._td_json_client_receive = self._tdjson.td_json_client_receive
-        self._td_json_client_receive.restype = c_char_p
-        self._td_json_client_receive.argtypes = [c_void_p, c_double]
+        self.td_json_client_send = self._tdjson.td_json_client_send
+        self.td_json_client_send.restype = None
+        self.td_json_client_send.argtypes = [c_void_p, c_char_p]
 
-        self._td_json_client_send = self._tdjson.td_json_client_send
-        self._td_json_client_send.restype = None
-        self._td_json_client_send.argtypes = [c_void_p, c_char_p]
+        self.td_json_client_execute = self._tdjson.td_json_client_execute
+        self.td_json_client_execute.restype = c_char_p
+        self.td_json_client_execute.argtypes = [c_void_p, c_char_p]
 
-        self._td_json_client_execute = self._tdjson.td_json_client_execute
-        self._td_json_client_execute.restype = c_char_p
-        self._td_json_client_execute.argtypes = [c_void_p, c_char_p]
+        self.td_json_client_destroy = self._tdjson.td_json_client_destroy
+        self.td_json_client_destroy.restype = None
+        self.td_json_client_destroy.argtypes = [c_void_p]
 
-        self._td_json_client_destroy = self._tdjson.td_json_client_destroy
-        self._td_json_client_destroy.restype = None
-        self._td_json_client_destroy.argtypes = [c_void_p]
+        self.td_set_log_file_path = self._tdjson.td_set_log_file_path
+        self.td_set_log_file_path.restype = c_int
+        self.td_set_log_file_path.argtypes = [c_char_p]
 
-        self._td_set_log_file_path = self._tdjson.td_set_log_file_path
-        self._td_set_log_file_path.restype = c_int
-        self._td_set_log_file_path.argtypes = [c_char_p]
-
-        self._td_set_log_max_file_size = self._tdjson.td_set_log_max_file_size
-        self._td_set_log_max_file_size.restype = None
-        self._td_set_log_max_file_size.argtypes = [c_longlong]
+        self.td_set_log_max_file_size = self._tdjson.td_set_log_max_file_size
+        self.td_set_log_max_file_size.restype = None
+        self.td_set_log_max_file_size.argtypes = [c_longlong]
 
         self._td_set_log_verbosity_level = self._tdjson.td_set_log_verbosity_level
         self._td_set_log_verbosity_level.restype = None
         self._td_set_log_verbosity_level.argtypes = [c_int]
-
-        self._td_set_log_verbosity_level(verbosity)
+        self._verbosity: int | None = None
+        self._verbosity_lock = threading.Lock()
 
         fatal_error_callback_type = CFUNCTYPE(None, c_char_p)
 
@@ -91,8 +160,148 @@ class TDJson:
         def on_fatal_error_callback(error_message: str) -> None:
             logger.error("TDLib fatal error: %s", error_message)
 
-        self._c_on_fatal_error_callback = fatal_error_callback_type(on_fatal_error_callback)
-        self._td_set_log_fatal_error_callback(self._c_on_fatal_error_callback)
+        # tdlib calls it until the process exits, so the library must keep a reference to it
+        self.c_on_fatal_error_callback = fatal_error_callback_type(on_fatal_error_callback)
+        self._td_set_log_fatal_error_callback(self.c_on_fatal_error_callback)
+
+        self._log_message_callback_type = CFUNCTYPE(None, c_int, c_char_p)
+        # tdlib < 1.8 has no td_set_log_message_callback
+        self._td_set_log_message_callback = getattr(self._tdjson, "td_set_log_message_callback", None)
+        if self._td_set_log_message_callback is not None:
+            self._td_set_log_message_callback.restype = None
+            self._td_set_log_message_callback.argtypes = [c_int, self._log_message_callback_type]
+        self.c_on_log_message_callback: Any = None
+
+    def set_verbosity(self, verbosity: int) -> None:
+        """Sets the tdlib log verbosity, which is global for the process"""
+        with self._verbosity_lock:
+            if verbosity != self._verbosity:
+                self._td_set_log_verbosity_level(verbosity)
+                self._verbosity = verbosity
+
+    def set_log_file(self, path: str, max_file_size: int | None = None) -> None:
+        """Writes the tdlib log to a file instead of stderr, for the whole process"""
+        if not self.td_set_log_file_path(path.encode("utf-8")):
+            raise RuntimeError(f'tdlib can not write its log to "{path}"')
+
+        if max_file_size is not None:
+            self.td_set_log_max_file_size(max_file_size)
+
+    def set_log_message_callback(self, max_verbosity: int, callback: Callable[[int, bytes], None] | None) -> None:
+        """
+        Passes the tdlib log messages up to `max_verbosity` to `callback`, for the whole process.
+        `None` removes the callback.
+        """
+        if self._td_set_log_message_callback is None:
+            logger.warning("This tdlib version does not support td_set_log_message_callback")
+            return
+
+        c_callback = self._log_message_callback_type(callback) if callback is not None else None
+        self._td_set_log_message_callback(max_verbosity, c_callback)
+        # tdlib keeps calling it, so it must stay referenced
+        self.c_on_log_message_callback = c_callback
+
+
+_libraries: dict[str, _TDJsonLibrary] = {}
+_libraries_lock = threading.Lock()
+# the library found by `_get_tdjson_lib_path`, find_library runs a subprocess, so only once
+_default_library_path: str | None = None
+
+
+def _get_default_library_path() -> str:
+    global _default_library_path
+
+    with _libraries_lock:
+        if _default_library_path is None:
+            _default_library_path = _get_tdjson_lib_path()
+
+        return _default_library_path
+
+
+def _load_library(library_path: str) -> _TDJsonLibrary:
+    with _libraries_lock:
+        library = _libraries.get(library_path)
+
+        if library is None:
+            library = _libraries[library_path] = _TDJsonLibrary(library_path)
+
+        return library
+
+
+def td_execute(query: dict[Any, Any], library_path: str | None = None) -> dict[Any, Any] | Any:
+    """
+    Synchronously executes a tdlib method that does not need a client.
+
+    Only the methods that tdlib marks as "Can be called synchronously" are supported,
+    for example ``parseTextEntities`` or ``getFileMimeType``.
+    """
+    if library_path is None:
+        library_path = _get_default_library_path()
+
+    dumped_query = json.dumps(query, default=encode_object).encode("utf-8")
+    result_str = _load_library(library_path).td_json_client_execute(None, dumped_query)
+
+    if result_str:
+        result: dict[Any, Any] = json.loads(result_str.decode("utf-8"))
+
+        return result
+
+    return None
+
+
+class TDJson:
+    def __init__(
+        self,
+        library_path: str | None = None,
+        verbosity: int = 2,
+        object_hook: Callable[[dict[str, Any]], Any] | None = None,
+        log_file_path: str | None = None,
+        log_max_file_size: int | None = None,
+        log_forwarder: TDLibLogForwarder | None = None,
+        debug_log_sample_rate: int = 1,
+    ) -> None:
+        """
+        Args:
+            library_path: path to the libtdjson library, found automatically if not set
+            verbosity: tdlib log verbosity
+            object_hook: called with every decoded object of the received JSON,
+                it returns the object to use instead, like in ``json.loads``
+            log_file_path: file to write the tdlib log to instead of stderr
+            log_max_file_size: size of the log file in bytes after which tdlib rotates it
+            log_forwarder: forwards the tdlib log messages to the Python logging
+            debug_log_sample_rate: log only one of every N sent and received frames at DEBUG
+
+        The tdlib log settings are global, the last client that sets them wins.
+        """
+        if library_path is None:
+            library_path = _get_default_library_path()
+
+        self._object_hook = object_hook
+        self._debug_log = DebugLogSampler(logger, debug_log_sample_rate)
+
+        self._build_client(library_path, verbosity)
+
+        if log_file_path is not None:
+            self._library.set_log_file(log_file_path, log_max_file_size)
+
+        if log_forwarder is not None:
+            self._library.set_log_message_callback(verbosity, log_forwarder)
+
+    def __del__(self) -> None:
+        if hasattr(self, "_td_json_client_destroy"):
+            self.stop()
+
+    def _build_client(self, library_path: str, verbosity: int) -> None:
+        self._library = _load_library(library_path)
+
+        self._td_json_client_receive = self._library.td_json_client_receive
+        self._td_json_client_send = self._library.td_json_client_send
+        self._td_json_client_execute = self._library.td_json_client_execute
+        self._td_json_client_destroy = self._library.td_json_client_destroy
+
+        self._library.set_verbosity(verbosity)
+
+        self.td_json_client: int | None = self._library.td_json_client_create()
 
     def _get_client(self) -> int:
         """
@@ -107,23 +316,31 @@ class TDJson:
         return self.td_json_client
 
     def send(self, query: dict[Any, Any]) -> None:
-        dumped_query = json.dumps(query).encode("utf-8")
+        dumped_query = json.dumps(query, default=encode_object).encode("utf-8")
         self._td_json_client_send(self._get_client(), dumped_query)
-        logger.debug("[me ==>] Sent %s", dumped_query)
+        if self._debug_log():
+            logger.debug("[me ==>] Sent %s", dumped_query)
+
+    def send_encoded(self, query: bytes) -> None:
+        """Sends a query that is already encoded to JSON"""
+        self._td_json_client_send(self._get_client(), query)
+        if self._debug_log():
+            logger.debug("[me ==>] Sent %s", query)
 
     def receive(self) -> None | dict[Any, Any]:
         result_str = self._td_json_client_receive(self._get_client(), 1.0)
 
         if result_str:
-            result: dict[Any, Any] = json.loads(result_str.decode("utf-8"))
-            logger.debug("[me <==] Received %s", result)
+            result: dict[Any, Any] = json.loads(result_str.decode("utf-8"), object_hook=self._object_hook)
+            if self._debug_log():
+                logger.debug("[me <==] Received %s", result)
 
             return result
 
         return None
 
     def td_execute(self, query: dict[Any, Any]) -> dict[Any, Any] | Any:
-        dumped_query = json.dumps(query).encode("utf-8")
+        dumped_query = json.dumps(query, default=encode_object).encode("utf-8")
         result_str = self._td_json_client_execute(self._get_client(), dumped_query)
 
         if result_str:
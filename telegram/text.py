@@ -3,26 +3,30 @@ you can find more examples of how to use markup components on
 telegram-text.alinsky.tech or github.com/SKY-ALIN/telegram-text
 """
 
-from telegram_text import (
-    Bold,
-    Chain,
-    Code,
-    Hashtag,
-    InlineCode,
-    InlineUser,
-    Italic,
-    Link,
-    OrderedList,
-    PlainText,
-    Spoiler,
-    Strikethrough,
-    Text,
-    TOMLSection,
-    Underline,
-    UnorderedList,
-    User,
-)
-from telegram_text.bases import Element
+import importlib
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from telegram_text import (
+        Bold,
+        Chain,
+        Code,
+        Hashtag,
+        InlineCode,
+        InlineUser,
+        Italic,
+        Link,
+        OrderedList,
+        PlainText,
+        Spoiler,
+        Strikethrough,
+        Text,
+        TOMLSection,
+        Underline,
+        UnorderedList,
+        User,
+    )
+    from telegram_text.bases import Element
 
 __all__ = [
     "Bold",
@@ -44,3 +48,15 @@ __all__ = [
     "UnorderedList",
     "User",
 ]
+
+
+def __getattr__(name: str) -> Any:
+    # telegram-text is imported on the first use of a markup component,
+    # so `import telegram.client` does not pay for it
+    if name not in __all__:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    module = importlib.import_module("telegram_text.bases" if name == "Element" else "telegram_text")
+    value = getattr(module, name)
+    globals()[name] = value
+    return value
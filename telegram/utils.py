@@ -1,26 +1,136 @@
 from __future__ import annotations
 
 import logging
+import re
 import threading
 import uuid
+from collections.abc import Mapping
 from typing import TYPE_CHECKING, Any
 
 if TYPE_CHECKING:
+    from concurrent.futures import Future
+
     from telegram.client import Telegram
 
 
 logger = logging.getLogger(__name__)
 
+# how many frames a DebugLogSampler trusts its cached logger level
+DEBUG_LOG_REFRESH_INTERVAL = 1024
+
+# the requests that send one message, their result is delivered with updateMessageSendSucceeded
+SEND_REQUESTS = frozenset(("sendMessage", "sendBotStartMessage", "sendInlineQueryResultMessage"))
+
+_RETRY_AFTER_RE = re.compile(r"retry after (\d+)", re.IGNORECASE)
+
+
+def get_retry_after(error: dict[str, Any]) -> int | None:
+    """
+    Returns how many seconds to wait before sending again a request that has failed
+    with ``429 Too Many Requests``, or ``None`` if the error is not a flood wait.
+    """
+    if error.get("code") != 429:
+        return None
+
+    match = _RETRY_AFTER_RE.search(error.get("message", ""))
+    return int(match.group(1)) if match else 1
+
+
+def get_message_text(content: Mapping[str, Any] | None) -> str | None:
+    """
+    Returns the text of a message ``content``: the text of ``messageText``,
+    the caption of a photo, a video or a document, or ``None`` if it has neither.
+    """
+    if content is None:
+        return None
+
+    formatted_text = content.get("text") or content.get("caption")
+
+    # a dict, or a compact model with `compact_models`
+    if not isinstance(formatted_text, Mapping):
+        return None
+
+    text: str | None = formatted_text.get("text")
+    return text
+
+
+class DebugLogSampler:
+    """
+    Decides whether the debug log of a frame sent to or received from tdlib is written.
+
+    Calling ``logger.debug`` for every frame costs time even when DEBUG is off.
+    The sampler checks ``logger.isEnabledFor(DEBUG)`` once every
+    ``DEBUG_LOG_REFRESH_INTERVAL`` frames instead, so a changed log level is
+    picked up with a small delay. With `sample_rate` N, only one of every N frames is logged.
+    """
+
+    __slots__ = ("_countdown", "_enabled", "_frames", "logger", "sample_rate")
+
+    def __init__(self, logger: logging.Logger, sample_rate: int = 1) -> None:
+        if sample_rate < 1:
+            raise ValueError("sample_rate must be at least 1")
+
+        self.logger = logger
+        self.sample_rate = sample_rate
+        self._enabled = False
+        self._countdown = 0
+        self._frames = 0
+
+    def __call__(self) -> bool:
+        self._countdown -= 1
+        if self._countdown < 0:
+            self._enabled = self.logger.isEnabledFor(logging.DEBUG)
+            self._countdown = DEBUG_LOG_REFRESH_INTERVAL
+
+        if not self._enabled:
+            return False
+
+        if self.sample_rate == 1:
+            return True
+
+        self._frames += 1
+        return self._frames % self.sample_rate == 0
+
+
+_debug_log = DebugLogSampler(logger)
+
+# guards the lazy creation of the AsyncResult events
+_ready_lock = threading.Lock()
+
 
 class AsyncResult:
     """
     tdlib is asynchronous, and this class helps you get results back.
     After each API call, you receive AsyncResult object, which you can use to get results back.
+
+    The event to wait on is only created when somebody waits for the result,
+    so the results nobody waits for cost no more than a few slots.
+
+    A sent message is only a local copy until Telegram accepts it. For such results
+    ``wait_delivered`` and ``delivery_future`` wait for ``updateMessageSendSucceeded``
+    or ``updateMessageSendFailed``, for other results they are resolved with the result itself.
     """
 
-    def __init__(self, client: Telegram, result_id: str | None = None) -> None:
+    __slots__ = (
+        "_delivery_done",
+        "_delivery_future",
+        "_done",
+        "_event",
+        "client",
+        "delivered_message",
+        "delivery_error",
+        "error",
+        "error_info",
+        "id",
+        "ok_received",
+        "request",
+        "update",
+    )
+
+    def __init__(self, client: Telegram, result_id: str | int | None = None) -> None:
         self.client = client
 
+        self.id: str | int
         if result_id:
             self.id = result_id
         else:
@@ -31,17 +141,118 @@ class AsyncResult:
         self.error = False
         self.error_info: dict[Any, Any] | None = None
         self.update: dict[Any, Any] | None = None
-        self._ready = threading.Event()
+        self._done = False
+        self._event: threading.Event | None = None
+        # the message sent to Telegram, or why it has not been sent
+        self.delivered_message: dict[Any, Any] | None = None
+        self.delivery_error: dict[Any, Any] | None = None
+        self._delivery_done = False
+        self._delivery_future: Future[dict[Any, Any] | None] | None = None
 
     def __str__(self) -> str:
         return f"AsyncResult <{self.id}>"
 
+    @property
+    def _ready(self) -> threading.Event:
+        if self._event is None:
+            with _ready_lock:
+                if self._event is None:
+                    event = threading.Event()
+                    if self._done:
+                        event.set()
+                    self._event = event
+        return self._event
+
+    def _is_ready(self) -> bool:
+        return self._done or (self._event is not None and self._event.is_set())
+
+    def _set_ready(self) -> None:
+        # a message that is being sent is delivered later, see `_set_delivered`
+        delivered = not self._is_sending()
+        future = None
+
+        with _ready_lock:
+            self._done = True
+            event = self._event
+            if delivered:
+                self.delivered_message = None if self.error else self.update
+                self.delivery_error = self.error_info
+                self._delivery_done = True
+                future = self._delivery_future
+
+        if event is not None:
+            event.set()
+        if delivered and future is not None:
+            self._resolve_delivery_future(future)
+
+    def _is_sending(self) -> bool:
+        """Whether the request has sent a message that Telegram has not accepted yet"""
+        if self.update is None or self.request is None or self.request.get("@type") not in SEND_REQUESTS:
+            # for example getMessage of a message that is still being sent
+            return False
+        sending_state = self.update.get("sending_state")
+        return sending_state is not None and sending_state.get("@type") == "messageSendingStatePending"
+
+    def _set_delivered(self, message: dict[Any, Any] | None, error: dict[Any, Any] | None) -> None:
+        with _ready_lock:
+            self.delivered_message = message
+            self.delivery_error = error
+            self._delivery_done = True
+            future = self._delivery_future
+
+        if future is not None:
+            self._resolve_delivery_future(future)
+
+    def _resolve_delivery_future(self, future: Future[dict[Any, Any] | None]) -> None:
+        if self.delivery_error is not None:
+            future.set_exception(RuntimeError(f"Telegram error: {self.delivery_error}"))
+        else:
+            future.set_result(self.delivered_message)
+
+    def delivery_future(self) -> Future[dict[Any, Any] | None]:
+        """
+        Returns a future of the delivered message. It fails with ``RuntimeError`` if the message
+        has not been sent. In a coroutine it can be awaited with ``asyncio.wrap_future``.
+        """
+        # imported on first use, most clients never need it
+        from concurrent.futures import Future
+
+        with _ready_lock:
+            future = self._delivery_future
+            if future is not None:
+                return future
+            future = self._delivery_future = Future()
+            delivered = self._delivery_done
+
+        if delivered:
+            self._resolve_delivery_future(future)
+
+        return future
+
+    def wait_delivered(self, timeout: float | None = None) -> dict[Any, Any] | None:
+        """
+        Blocking method to wait until Telegram has accepted the sent message.
+
+        Returns the message with its final id. Raises ``RuntimeError`` if it has not been sent.
+        """
+        if self._delivery_done:
+            if self.delivery_error is not None:
+                raise RuntimeError(f"Telegram error: {self.delivery_error}")
+            return self.delivered_message
+
+        from concurrent.futures import TimeoutError as FuturesTimeoutError
+
+        try:
+            return self.delivery_future().result(timeout=timeout)
+        except FuturesTimeoutError:
+            # the same class since Python 3.11
+            raise TimeoutError() from None
+
     def wait(self, timeout: float | None = None, raise_exc: bool = False) -> None:
         """
         Blocking method to wait for the result
         """
-        result = self._ready.wait(timeout=timeout)
-        if result is False:
+        if not self._done and self._ready.wait(timeout=timeout) is False:
             raise TimeoutError()
         if raise_exc and self.error:
             raise RuntimeError(f"Telegram error: {self.error_info}")
@@ -49,7 +260,8 @@ class AsyncResult:
     def parse_update(self, update: dict[Any, Any]) -> bool:
         update_type = update.get("@type")
 
-        logger.debug("update id=%s type=%s received", self.id, update_type)
+        if _debug_log():
+            logger.debug("update id=%s type=%s received", self.id, update_type)
 
         if update_type == "ok":
             self.ok_received = True
@@ -64,6 +276,6 @@ class AsyncResult:
         else:
             self.update = update
 
-        self._ready.set()
+        self._set_ready()
 
         return True
@@ -1,6 +1,9 @@
 import logging
 import threading
-from queue import Empty, Queue
+import time
+from collections.abc import Awaitable, Callable
+from queue import Empty, Full, Queue
+from typing import Any
 
 logger = logging.getLogger(__name__)
 
@@ -12,6 +15,9 @@ class BaseWorker:
     and calling handler functions
     """
 
+    # whether handlers can be coroutine functions (async def)
+    supports_coroutines = False
+
     def __init__(self, queue: Queue):
         self._is_enabled = True
         self._queue = queue
@@ -49,3 +55,274 @@ class SimpleWorker(BaseWorker):
     def stop(self) -> None:
         self._is_enabled = False
         self._thread.join()
+
+
+class AsyncioWorker(BaseWorker):
+    """
+    Runs update handlers in a dedicated asyncio event loop.
+
+    Coroutine handlers (``async def``) run as tasks, so up to `max_tasks`
+    of them wait for I/O at the same time on one thread. Regular handlers
+    are called in the event loop thread and must not block it.
+    """
+
+    supports_coroutines = True
+
+    def __init__(self, queue: Queue, max_tasks: int = 1000):
+        # imported here, so that the clients with other workers do not load asyncio
+        import asyncio
+
+        super().__init__(queue)
+        self._slots = threading.BoundedSemaphore(max_tasks)
+        self._tasks: set[asyncio.Task] = set()
+        self.loop = asyncio.new_event_loop()
+
+    def run(self) -> None:
+        self._loop_thread = threading.Thread(target=self.loop.run_forever)
+        self._loop_thread.daemon = True
+        self._loop_thread.start()
+
+        self._thread = threading.Thread(target=self._run_thread)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run_thread(self) -> None:
+        logger.info("[AsyncioWorker] started")
+
+        while self._is_enabled:
+            # a free slot first, so that an update is never taken from the queue and then left behind
+            if not self._slots.acquire(timeout=0.5):
+                continue
+
+            try:
+                handler, update = self._queue.get(timeout=0.5)
+            except Empty:
+                self._slots.release()
+                continue
+
+            self.loop.call_soon_threadsafe(self._start_handler, handler, update)
+
+    def _start_handler(self, handler: Callable, update: Any) -> None:
+        try:
+            result = handler(update)
+        except Exception:
+            logger.exception("Error in update handler %s", handler)
+            self._handler_done()
+            return
+
+        if not isinstance(result, Awaitable):
+            self._handler_done()
+            return
+
+        task = self.loop.create_task(self._await_handler(handler, result))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _await_handler(self, handler: Callable, awaitable: Any) -> None:
+        try:
+            await awaitable
+        except Exception:
+            logger.exception("Error in update handler %s", handler)
+        finally:
+            self._handler_done()
+
+    def _handler_done(self) -> None:
+        self._slots.release()
+        self._queue.task_done()
+
+    async def _cancel_tasks(self) -> None:
+        import asyncio
+
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stop(self) -> None:
+        import asyncio
+
+        self._is_enabled = False
+        self._thread.join()
+
+        # handlers that are still running are cancelled
+        asyncio.run_coroutine_threadsafe(self._cancel_tasks(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._loop_thread.join()
+        self.loop.close()
+
+
+class HandlerLane(BaseWorker):
+    """
+    A dedicated bounded queue and threads for one update handler.
+
+    A slow handler in a lane does not hold back the handlers in the shared
+    worker or in other lanes. When the queue of the lane is full, new updates
+    for it are dropped right away, so the listener never waits for a lane.
+    """
+
+    def __init__(self, queue: Queue, handler: Callable, concurrency: int = 1):
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+
+        super().__init__(queue)
+        self.handler = handler
+        self.concurrency = concurrency
+        self._threads: list[threading.Thread] = []
+        self._stats_lock = threading.Lock()
+        self._processed = 0
+        self._failed = 0
+        self._dropped = 0
+        self._total_latency = 0.0
+        self._max_latency = 0.0
+
+    def put(self, update: Any) -> bool:
+        """Adds the update to the queue of the lane, returns False if it was dropped"""
+        try:
+            self._queue.put_nowait((update, time.monotonic()))
+        except Full:
+            with self._stats_lock:
+                self._dropped += 1
+            return False
+
+        return True
+
+    def run(self) -> None:
+        for _ in range(self.concurrency):
+            thread = threading.Thread(target=self._run_thread)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _run_thread(self) -> None:
+        logger.info("[HandlerLane] started for %s", self.handler)
+
+        while self._is_enabled:
+            try:
+                update, enqueued_at = self._queue.get(timeout=0.5)
+            except Empty:
+                continue
+
+            failed = False
+            try:
+                self.handler(update)
+            except Exception:
+                failed = True
+                logger.exception("Error in update handler %s", self.handler)
+
+            latency = time.monotonic() - enqueued_at
+            with self._stats_lock:
+                self._processed += 1
+                self._failed += failed
+                self._total_latency += latency
+                self._max_latency = max(self._max_latency, latency)
+
+            self._queue.task_done()
+
+    def stop(self) -> None:
+        self._is_enabled = False
+        for thread in self._threads:
+            thread.join()
+
+    def stats(self) -> dict[str, Any]:
+        """
+        Returns the counters of the lane.
+
+        Latency is the time from putting an update into the queue until
+        the handler has finished with it, in seconds.
+        """
+        with self._stats_lock:
+            processed = self._processed
+            return {
+                "queued": self._queue.qsize(),
+                "processed": processed,
+                "failed": self._failed,
+                "dropped": self._dropped,
+                "average_latency": self._total_latency / processed if processed else 0.0,
+                "max_latency": self._max_latency,
+            }
+
+
+class UpdateBatcher:
+    """
+    Collects updates and calls the handler with a list of them.
+
+    The handler is called when `batch_size` updates have been collected,
+    or `max_delay` seconds after the first update of a batch. In the second
+    case it is called from the flusher thread of the batcher, not from the worker.
+    The flusher thread is started with the first delayed batch and lives until `stop`.
+    """
+
+    def __init__(self, handler: Callable, batch_size: int, max_delay: float | None = None):
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+
+        self.handler = handler
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self._batch: list[Any] = []
+        self._deadline: float | None = None
+        self._stopped = False
+        self._flusher: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self._deadline_changed = threading.Condition(self._lock)
+        # keeps batches in order when the worker and the flusher flush at the same time
+        self._flush_lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"UpdateBatcher <{self.handler}>"
+
+    def __call__(self, update: Any) -> None:
+        with self._lock:
+            self._batch.append(update)
+
+            if len(self._batch) < self.batch_size:
+                if self._deadline is None and self.max_delay is not None and not self._stopped:
+                    self._deadline = time.monotonic() + self.max_delay
+
+                    if self._flusher is None:
+                        self._flusher = threading.Thread(target=self._run_flusher, daemon=True)
+                        self._flusher.start()
+                    else:
+                        self._deadline_changed.notify()
+                return
+
+        self.flush()
+
+    def flush(self) -> None:
+        """Calls the handler with the collected updates, if there are any"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._batch = self._batch, []
+                self._deadline = None
+
+            if batch:
+                self.handler(batch)
+
+    def stop(self) -> None:
+        """Flushes the collected updates and stops the flusher thread"""
+        with self._lock:
+            self._stopped = True
+            self._deadline_changed.notify()
+
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Error in update handler %s", self.handler)
+
+        if self._flusher is not None and self._flusher is not threading.current_thread():
+            self._flusher.join()
+
+    def _run_flusher(self) -> None:
+        while True:
+            with self._lock:
+                while not self._stopped and (self._deadline is None or time.monotonic() < self._deadline):
+                    timeout = None if self._deadline is None else self._deadline - time.monotonic()
+                    self._deadline_changed.wait(timeout)
+
+                if self._stopped:
+                    return
+
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Error in update handler %s", self.handler)
@@ -0,0 +1,19 @@
+from unittest.mock import patch
+
+import pytest
+
+from telegram.client import Telegram
+
+
+@pytest.fixture
+def telegram():
+    # tdjson is a mock and the listener thread is not started,
+    # updates are passed to `telegram._process_update` by the tests
+    with patch("telegram.client.TDJson"), patch("telegram.client.threading"):
+        return Telegram(
+            api_id=1,
+            api_hash="hash",
+            phone="+71234567890",
+            library_path="/lib/",
+            database_encryption_key="changeme1234",
+        )
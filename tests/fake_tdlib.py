@@ -0,0 +1,45 @@
+import json
+
+
+class FakeTdlib:
+    """
+    Answers the requests of a client from the `telegram` fixture, in the thread that sends them,
+    like tdlib answers in the listener thread. The requests are kept in `requests`.
+
+    `answer` returns the result of a request, or ``None`` to leave the request without a result;
+    subclasses override it, or it is passed as an argument.
+    """
+
+    def __init__(self, telegram, answer=None):
+        self.telegram = telegram
+        self.requests = []
+        if answer is not None:
+            self.answer = answer
+        telegram._tdjson.send.side_effect = self.send
+        telegram._tdjson.send_encoded.side_effect = lambda query: self.send(json.loads(query))
+
+    def send(self, request):
+        self.requests.append(request)
+        result = self.answer(request)
+        if result is not None:
+            self.reply(request, result)
+
+    def answer(self, request):
+        return None
+
+    def reply(self, request, result):
+        self.update({**result, "@extra": request["@extra"]})
+
+    def update(self, update):
+        self.telegram._process_update(update)
+
+
+def message(chat_id, message_id, text, caption=False, **fields):
+    """A text message, or a photo with the text as the caption"""
+    formatted_text = {"@type": "formattedText", "text": text, "entities": []}
+    content = (
+        {"@type": "messagePhoto", "caption": formatted_text}
+        if caption
+        else {"@type": "messageText", "text": formatted_text}
+    )
+    return {"@type": "message", "id": message_id, "chat_id": chat_id, "date": message_id, "content": content, **fields}
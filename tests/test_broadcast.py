@@ -0,0 +1,156 @@
+import json
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from telegram.broadcast import Broadcaster
+from tests.fake_tdlib import FakeTdlib
+
+
+class BroadcastTdlib(FakeTdlib):
+    """Answers sendMessage like tdlib: the temporary message, then the outcome"""
+
+    def __init__(self, telegram, outcomes=None):
+        super().__init__(telegram)
+        # chat id -> list of outcomes, "ok" or an error dict, one per attempt
+        self.outcomes = outcomes or {}
+        self._message_ids = iter(range(1000, 100000))
+
+    def answer(self, request):
+        chat_id = request["chat_id"]
+        outcomes = self.outcomes.get(chat_id, [])
+        outcome = outcomes.pop(0) if outcomes else "ok"
+
+        if outcome == "request_error":
+            return {"@type": "error", "code": 400, "message": "Chat not found"}
+
+        temporary_id = next(self._message_ids)
+        self.reply(
+            request,
+            {
+                "@type": "message",
+                "id": temporary_id,
+                "chat_id": chat_id,
+                "sending_state": {"@type": "messageSendingStatePending"},
+            },
+        )
+
+        if outcome == "ok":
+            self.update(
+                {
+                    "@type": "updateMessageSendSucceeded",
+                    "message": {"@type": "message", "id": temporary_id + 1, "chat_id": chat_id},
+                    "old_message_id": temporary_id,
+                }
+            )
+        elif outcome != "silent":
+            self.update(
+                {
+                    "@type": "updateMessageSendFailed",
+                    "message": {"@type": "message", "id": temporary_id, "chat_id": chat_id},
+                    "old_message_id": temporary_id,
+                    "error": outcome,
+                }
+            )
+
+        return None
+
+
+class TestBroadcaster:
+    def test_sends_to_every_chat(self, telegram):
+        tdlib = BroadcastTdlib(telegram)
+
+        report = Broadcaster(telegram, "hello", max_in_flight=3).run(range(1, 11))
+
+        assert sorted(report.sent) == list(range(1, 11))
+        assert report.failed == {}
+        assert [request["chat_id"] for request in tdlib.requests] == list(range(1, 11))
+        assert tdlib.requests[0]["input_message_content"] == {
+            "@type": "inputMessageText",
+            "text": {"@type": "formattedText", "text": "hello", "entities": []},
+        }
+        assert telegram._pending_sends == {}
+
+    def test_payload_is_encoded_once(self, telegram):
+        broadcaster = Broadcaster(
+            telegram, {"@type": "inputMessageText", "text": {"@type": "formattedText", "text": "hi"}}
+        )
+
+        with patch("telegram.broadcast.json.dumps") as dumps:
+            broadcaster._encode(1)
+            broadcaster._encode(2)
+
+        dumps.assert_not_called()
+        assert json.loads(broadcaster._encode(42))["chat_id"] == 42
+
+    def test_failures(self, telegram):
+        error = {"@type": "error", "code": 403, "message": "Forbidden"}
+        BroadcastTdlib(telegram, outcomes={2: [error], 3: ["request_error"]})
+
+        report = Broadcaster(telegram, "hello").run([1, 2, 3])
+
+        assert list(report.sent) == [1]
+        assert report.failed[2] == error
+        assert report.failed[3]["code"] == 400
+
+    def test_flood_wait_is_retried(self, telegram):
+        flood = {"@type": "error", "code": 429, "message": "Too Many Requests: retry after 0"}
+        tdlib = BroadcastTdlib(telegram, outcomes={1: [flood, flood]})
+
+        report = Broadcaster(telegram, "hello").run([1, 2])
+
+        assert sorted(report.sent) == [1, 2]
+        assert [request["chat_id"] for request in tdlib.requests].count(1) == 3
+
+    def test_flood_wait_gives_up_after_max_retries(self, telegram):
+        flood = {"@type": "error", "code": 429, "message": "Too Many Requests: retry after 0"}
+        BroadcastTdlib(telegram, outcomes={1: [flood] * 3})
+
+        report = Broadcaster(telegram, "hello", max_retries=2).run([1])
+
+        assert report.failed == {1: flood}
+
+    def test_checkpoint(self, telegram, tmp_path):
+        checkpoint_path = tmp_path / "campaign.txt"
+        error = {"@type": "error", "code": 403, "message": "Forbidden"}
+        tdlib = BroadcastTdlib(telegram, outcomes={2: [error]})
+
+        Broadcaster(telegram, "hello", checkpoint_path=checkpoint_path).run([1, 2])
+
+        assert checkpoint_path.read_text().splitlines() == ["1 sent", "2 failed"]
+
+        report = Broadcaster(telegram, "hello", checkpoint_path=checkpoint_path).run([1, 2, 3])
+
+        # the failed chat is tried again
+        assert report.skipped == 1
+        assert sorted(report.sent) == [2, 3]
+        assert [request["chat_id"] for request in tdlib.requests] == [1, 2, 2, 3]
+        assert checkpoint_path.read_text().splitlines() == ["1 sent", "2 failed", "2 sent", "3 sent"]
+
+        report = Broadcaster(telegram, "hello", checkpoint_path=checkpoint_path).run([1, 2, 3])
+
+        assert report.skipped == 3
+
+    def test_max_in_flight_and_send_timeout(self, telegram):
+        tdlib = BroadcastTdlib(telegram, outcomes={chat_id: ["silent"] for chat_id in range(4)})
+        broadcaster = Broadcaster(telegram, "hello", max_in_flight=2, send_timeout=0.3)
+        reports = []
+
+        thread = threading.Thread(target=lambda: reports.append(broadcaster.run(range(4))))
+        thread.start()
+        time.sleep(0.15)
+        # nothing has been delivered yet, so only two messages are in flight
+        assert len(tdlib.requests) == 2
+        thread.join(timeout=5)
+
+        assert sorted(reports[0].failed) == [0, 1, 2, 3]
+        assert reports[0].failed[0]["code"] == 408
+        # nothing waits for the abandoned messages anymore
+        assert telegram._results == {}
+        assert telegram._pending_sends == {}
+
+    def test_max_in_flight_must_be_positive(self, telegram):
+        with pytest.raises(ValueError):
+            Broadcaster(telegram, "hello", max_in_flight=0)
@@ -0,0 +1,125 @@
+import json
+import sys
+from unittest.mock import patch
+
+import pytest
+
+from telegram.export import export_chat_history, export_chats, iter_chat_history
+from telegram.models import Message
+from telegram.utils import AsyncResult
+from tests.fake_tdlib import FakeTdlib, message
+
+
+def _message(chat_id, message_id):
+    return message(chat_id, message_id, f"message {message_id}", date=1700000000 + message_id)
+
+
+class HistoryTdlib(FakeTdlib):
+    """Answers getChatHistory from `histories`, chat id -> number of messages, the newest first"""
+
+    def __init__(self, telegram, histories, fail_after=None):
+        super().__init__(telegram)
+        self.histories = histories
+        # raise after this many pages, like an interrupted export
+        self.fail_after = fail_after
+
+    def send(self, request):
+        if self.fail_after is not None and len(self.requests) == self.fail_after:
+            raise KeyboardInterrupt()
+        super().send(request)
+
+    def answer(self, request):
+        chat_id = request["chat_id"]
+        from_message_id = request["from_message_id"] or self.histories[chat_id] + 1
+        ids = range(from_message_id - 1, max(from_message_id - 1 - request["limit"], 0), -1)
+        return {
+            "@type": "messages",
+            "total_count": len(ids),
+            "messages": [_message(chat_id, message_id) for message_id in ids],
+        }
+
+
+def _result(messages):
+    result = AsyncResult(client=None)
+    result.parse_update({"@type": "messages", "messages": messages})
+    return result
+
+
+def _ids(path):
+    return [json.loads(line)["id"] for line in path.read_text().splitlines()]
+
+
+class TestIterChatHistory:
+    def test_pages(self, telegram):
+        tdlib = HistoryTdlib(telegram, {1: 5})
+
+        pages = list(iter_chat_history(telegram, 1, page_size=2))
+
+        assert [[message["id"] for message in page] for page in pages] == [[5, 4], [3, 2], [1]]
+        assert [request["from_message_id"] for request in tdlib.requests] == [0, 4, 2, 1]
+
+
+class TestExportChatHistory:
+    def test_jsonl(self, telegram, tmp_path):
+        HistoryTdlib(telegram, {1: 5})
+
+        assert telegram.export_chat_history(1, tmp_path / "1.jsonl", page_size=2) == 5
+        assert _ids(tmp_path / "1.jsonl") == [5, 4, 3, 2, 1]
+
+    def test_compact_models(self, telegram, tmp_path):
+        pages = [[Message.from_dict(_message(1, 1))], []]
+
+        with patch.object(telegram, "get_chat_history", side_effect=[_result(page) for page in pages]):
+            export_chat_history(telegram, 1, tmp_path / "1.jsonl")
+
+        assert _ids(tmp_path / "1.jsonl") == [1]
+
+    def test_resume_from_checkpoint(self, telegram, tmp_path):
+        sink = tmp_path / "1.jsonl"
+        checkpoint = tmp_path / "1.checkpoint"
+        HistoryTdlib(telegram, {1: 7}, fail_after=2)
+
+        with pytest.raises(KeyboardInterrupt):
+            export_chat_history(telegram, 1, sink, checkpoint_path=checkpoint, page_size=3)
+
+        assert json.loads(checkpoint.read_text())["from_message_id"] == 2
+        # a page written after the checkpoint is dropped when the export is resumed
+        with sink.open("a") as f:
+            f.write(json.dumps(_message(1, 1)) + "\n")
+
+        tdlib = HistoryTdlib(telegram, {1: 7})
+        assert export_chat_history(telegram, 1, sink, checkpoint_path=checkpoint, page_size=3) == 1
+
+        assert _ids(sink) == [7, 6, 5, 4, 3, 2, 1]
+        assert tdlib.requests[0]["from_message_id"] == 2
+        assert export_chat_history(telegram, 1, sink, checkpoint_path=checkpoint) == 0
+
+    def test_unknown_format(self, telegram, tmp_path):
+        with pytest.raises(ValueError):
+            export_chat_history(telegram, 1, tmp_path / "1.csv", format="csv")
+
+    def test_parquet_needs_pyarrow(self, telegram, tmp_path):
+        with patch.dict(sys.modules, {"pyarrow": None}), pytest.raises(ImportError, match="pyarrow"):
+            export_chat_history(telegram, 1, tmp_path / "1", format="parquet")
+
+    def test_parquet(self, telegram, tmp_path):
+        pq = pytest.importorskip("pyarrow.parquet")
+        HistoryTdlib(telegram, {1: 5})
+
+        export_chat_history(telegram, 1, tmp_path / "1", format="parquet", page_size=2, parquet_part_size=3)
+
+        tables = [pq.read_table(tmp_path / "1" / f"part-{n}.parquet") for n in range(2)]
+        assert [table.column("id").to_pylist() for table in tables] == [[5, 4, 3, 2], [1]]
+
+
+class TestExportChats:
+    def test_exports_every_chat(self, telegram, tmp_path):
+        HistoryTdlib(telegram, {1: 3, 2: 4})
+
+        results = export_chats(telegram, [1, 2, 3], tmp_path)
+
+        assert results[1] == 3
+        assert results[2] == 4
+        assert isinstance(results[3], KeyError)
+        assert _ids(tmp_path / "2.jsonl") == [4, 3, 2, 1]
+        assert (tmp_path / "1.checkpoint").exists()
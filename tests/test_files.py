@@ -0,0 +1,386 @@
+import os
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from telegram.file_cache import FileCache
+from telegram.files import DownloadManager, UploadManager
+from tests.fake_tdlib import FakeTdlib
+
+
+def _file(file_id, downloaded=0, size=100, active=True):
+    completed = downloaded == size
+    return {
+        "@type": "file",
+        "id": file_id,
+        "size": size,
+        "local": {
+            "@type": "localFile",
+            "path": f"/files/{file_id}" if completed else "",
+            "downloaded_size": downloaded,
+            "is_downloading_active": active and not completed,
+            "is_downloading_completed": completed,
+        },
+    }
+
+
+class DownloadTdlib(FakeTdlib):
+    """Answers downloadFile with the file, the progress is sent with `progress`"""
+
+    def __init__(self, telegram, completed=(), unique_id=None):
+        super().__init__(telegram)
+        self.completed = set(completed)
+        # with a unique id, getFile is answered too
+        self.unique_id = unique_id
+
+    def answer(self, request):
+        file_id = request["file_id"]
+        if request["@type"] == "getFile":
+            return {**_file(file_id), "remote": {"@type": "remoteFile", "unique_id": self.unique_id}}
+        return _file(file_id, downloaded=100 if file_id in self.completed else 0)
+
+    @property
+    def started(self):
+        return [request["file_id"] for request in self.requests if request["@type"] == "downloadFile"]
+
+    def progress(self, file_id, downloaded, active=True):
+        self.update({"@type": "updateFile", "file": _file(file_id, downloaded, active=active)})
+
+
+class TestDownloadManager:
+    def test_download(self, telegram):
+        tdlib = DownloadTdlib(telegram)
+        progress = []
+
+        future = telegram.download_file(1, priority=5, on_progress=progress.append)
+
+        assert tdlib.requests[0]["@type"] == "downloadFile"
+        assert tdlib.requests[0]["priority"] == 5
+        assert not future.done()
+
+        tdlib.progress(1, 50)
+        tdlib.progress(1, 100)
+
+        assert future.result(timeout=0)["local"]["path"] == "/files/1"
+        assert [file["local"]["downloaded_size"] for file in progress] == [0, 50, 100]
+
+    def test_file_that_is_downloaded_already(self, telegram):
+        DownloadTdlib(telegram, completed=[1])
+
+        assert telegram.download_file(1).result(timeout=0)["local"]["path"] == "/files/1"
+
+    def test_same_file_is_downloaded_once(self, telegram):
+        tdlib = DownloadTdlib(telegram)
+
+        first = telegram.download_file(1)
+        second = telegram.download_file(1)
+
+        assert first is second
+        assert tdlib.started == [1]
+
+    def test_concurrency_is_bounded_and_priorities_are_respected(self, telegram):
+        tdlib = DownloadTdlib(telegram)
+        manager = DownloadManager(telegram, max_concurrent=2)
+
+        futures = {file_id: manager.download(file_id) for file_id in (1, 2, 3)}
+        futures[4] = manager.download(4, priority=10)
+
+        assert tdlib.started == [1, 2]
+
+        tdlib.progress(1, 100)
+        assert tdlib.started == [1, 2, 4]
+
+        tdlib.progress(2, 100)
+        tdlib.progress(4, 100)
+        tdlib.progress(3, 100)
+
+        assert tdlib.started == [1, 2, 4, 3]
+        assert all(future.done() for future in futures.values())
+
+    def test_stopped_download_fails(self, telegram):
+        tdlib = DownloadTdlib(telegram)
+        future = telegram.download_file(1)
+
+        tdlib.progress(1, 10, active=False)
+
+        with pytest.raises(RuntimeError, match="stopped"):
+            future.result(timeout=0)
+
+    def test_error(self, telegram):
+        FakeTdlib(telegram, lambda request: {"@type": "error", "code": 400, "message": "Invalid file id"})
+
+        with pytest.raises(RuntimeError, match="Invalid file id"):
+            telegram.download_file(1).result(timeout=0)
+
+    def test_download_many_yields_in_completion_order(self, telegram):
+        tdlib = DownloadTdlib(telegram)
+        manager = DownloadManager(telegram, max_concurrent=5)
+
+        files = manager.download_many([1, 2, 3])
+        tdlib.progress(3, 100)
+        tdlib.progress(1, 100)
+        tdlib.progress(2, 100)
+
+        assert [future.result()["id"] for future in files] == [3, 1, 2]
+
+    def test_progress_callback_errors_are_logged(self, telegram):
+        tdlib = DownloadTdlib(telegram)
+
+        def on_progress(file):
+            raise RuntimeError("boom")
+
+        future = telegram.download_file(1, on_progress=on_progress)
+        tdlib.progress(1, 100)
+
+        assert future.done()
+
+    def test_max_concurrent_must_be_positive(self, telegram):
+        with pytest.raises(ValueError):
+            DownloadManager(telegram, max_concurrent=0)
+
+
+def _uploaded_file(file_id, uploaded=0, size=100, active=True):
+    completed = uploaded == size
+    return {
+        "@type": "file",
+        "id": file_id,
+        "size": size,
+        "remote": {
+            "@type": "remoteFile",
+            "uploaded_size": uploaded,
+            "is_uploading_active": active and not completed,
+            "is_uploading_completed": completed,
+        },
+    }
+
+
+class UploadTdlib(FakeTdlib):
+    """Answers preliminaryUploadFile with a new file, and the other requests with empty messages"""
+
+    def answer(self, request):
+        if request["@type"] != "preliminaryUploadFile":
+            return {"@type": "messages"}
+        return _uploaded_file(len(self.uploads))
+
+    @property
+    def uploads(self):
+        return [request for request in self.requests if request["@type"] == "preliminaryUploadFile"]
+
+    @property
+    def messages(self):
+        return [request for request in self.requests if request["@type"] != "preliminaryUploadFile"]
+
+    @property
+    def paths(self):
+        return [request["file"]["path"] for request in self.uploads]
+
+    def progress(self, file_id, uploaded, active=True):
+        self.update({"@type": "updateFile", "file": _uploaded_file(file_id, uploaded, active=active)})
+
+
+class TestUploadManager:
+    def test_upload(self, telegram):
+        tdlib = UploadTdlib(telegram)
+        progress = []
+
+        future = telegram.upload_file("/photos/1.jpg", file_type="fileTypePhoto", on_progress=progress.append)
+
+        assert tdlib.uploads[0]["file"] == {"@type": "inputFileLocal", "path": "/photos/1.jpg"}
+        assert tdlib.uploads[0]["file_type"] == {"@type": "fileTypePhoto"}
+        assert not future.done()
+
+        tdlib.progress(1, 50)
+        tdlib.progress(1, 100)
+
+        assert future.result(timeout=0)["id"] == 1
+        assert [file["remote"]["uploaded_size"] for file in progress] == [0, 50, 100]
+
+    def test_concurrency_is_bounded(self, telegram):
+        tdlib = UploadTdlib(telegram)
+        manager = UploadManager(telegram, max_concurrent=2)
+
+        futures = [manager.upload(f"/files/{n}") for n in range(3)]
+
+        assert tdlib.paths == ["/files/0", "/files/1"]
+
+        tdlib.progress(2, 100)
+
+        assert tdlib.paths == ["/files/0", "/files/1", "/files/2"]
+        assert futures[1].done()
+
+    def test_stopped_upload_fails(self, telegram):
+        tdlib = UploadTdlib(telegram)
+        future = telegram.upload_file("/files/1")
+
+        tdlib.progress(1, 10, active=False)
+
+        with pytest.raises(RuntimeError, match="stopped"):
+            future.result(timeout=0)
+
+    def test_send_album(self, telegram):
+        tdlib = UploadTdlib(telegram)
+        manager = UploadManager(telegram, max_concurrent=20)
+        paths = [f"/photos/{n}.jpg" for n in range(11)]
+        captions = [f"photo {n}" for n in range(11)]
+
+        for file_id in range(1, 12):
+            threading.Timer(0.05, tdlib.progress, (file_id, 100)).start()
+
+        results = manager.send_album(42, paths, captions=captions, timeout=5)
+
+        assert len(results) == 2
+        album, single = tdlib.messages
+        assert album["@type"] == "sendMessageAlbum"
+        assert album["chat_id"] == 42
+        assert len(album["input_message_contents"]) == 10
+        assert album["input_message_contents"][0] == {
+            "@type": "inputMessagePhoto",
+            "caption": {"@type": "formattedText", "text": "photo 0", "entities": []},
+            "photo": {"@type": "inputFileId", "id": 1},
+        }
+        assert single["@type"] == "sendMessage"
+        assert single["input_message_content"]["photo"] == {"@type": "inputFileId", "id": 11}
+
+    def test_send_album_as_documents(self, telegram):
+        tdlib = UploadTdlib(telegram)
+
+        threading.Timer(0.05, tdlib.progress, (1, 100)).start()
+        threading.Timer(0.05, tdlib.progress, (2, 100)).start()
+        telegram.send_album(42, ["/a.pdf", "/b.pdf"], as_documents=True, timeout=5)
+
+        assert [request["file_type"]["@type"] for request in tdlib.uploads] == ["fileTypeDocument"] * 2
+        assert tdlib.messages[0]["input_message_contents"][1] == {
+            "@type": "inputMessageDocument",
+            "document": {"@type": "inputFileId", "id": 2},
+        }
+
+    def test_every_file_needs_a_caption(self, telegram):
+        with pytest.raises(ValueError):
+            telegram.send_album(42, ["/a.jpg", "/b.jpg"], captions=["a"])
+
+
+class TestFileCache:
+    @pytest.fixture
+    def cache(self, tmp_path):
+        cache = FileCache(tmp_path / "cache", max_size=250)
+        yield cache
+        cache.close()
+
+    def _write(self, path, size):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x" * size)
+        return path
+
+    def test_put_and_get(self, cache, tmp_path):
+        downloaded = self._write(tmp_path / "account1" / "photo.jpg", 100)
+        cache.put("unique", downloaded)
+
+        linked = cache.get("unique", tmp_path / "account2")
+
+        assert linked == tmp_path / "account2" / "unique.jpg"
+        assert linked.read_bytes() == downloaded.read_bytes()
+        assert os.stat(linked).st_ino == os.stat(downloaded).st_ino
+        assert cache.get("other", tmp_path / "account2") is None
+        assert cache.size == 100
+
+    def test_copies_when_links_fail(self, cache, tmp_path):
+        cache.put("unique", self._write(tmp_path / "a" / "f", 10))
+
+        with patch("telegram.file_cache.os.link", side_effect=OSError):
+            linked = cache.get("unique", tmp_path / "b")
+
+        assert linked.read_bytes() == b"x" * 10
+
+    def test_least_recently_used_files_are_evicted(self, cache, tmp_path):
+        for n in range(3):
+            cache.put(f"file{n}", self._write(tmp_path / "a" / f"{n}", 100))
+            time.sleep(0.01)
+            if n == 1:
+                # file0 is used, so file1 is the least recently used
+                cache.get("file0", tmp_path / "b")
+
+        assert cache.size == 200
+        assert cache.get("file1", tmp_path / "b") is None
+        assert cache.get("file0", tmp_path / "b") is not None
+
+    def test_shared_between_instances(self, cache, tmp_path):
+        cache.put("unique", self._write(tmp_path / "a" / "f", 10))
+
+        other = FileCache(cache.directory, max_size=250)
+        try:
+            assert other.get("unique", tmp_path / "b") is not None
+        finally:
+            other.close()
+
+    def test_index_uses_write_ahead_log(self, cache):
+        assert cache._db.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+
+
+class TestDownloadManagerWithCache:
+    @pytest.fixture
+    def cache(self, tmp_path):
+        cache = FileCache(tmp_path / "cache", max_size=1000)
+        yield cache
+        cache.close()
+
+    def test_cached_file_is_not_downloaded(self, telegram, cache, tmp_path):
+        telegram.files_directory = tmp_path / "account"
+        cached = tmp_path / "other" / "1.jpg"
+        cached.parent.mkdir()
+        cached.write_bytes(b"photo")
+        cache.put("unique", cached)
+        tdlib = DownloadTdlib(telegram, unique_id="unique")
+
+        file = DownloadManager(telegram, cache=cache).download(1).result(timeout=5)
+
+        assert tdlib.started == []
+        assert file["local"]["is_downloading_completed"]
+        assert file["local"]["path"] == str(tmp_path / "account" / "files" / "cached" / "unique.jpg")
+
+    def test_downloaded_file_is_cached(self, telegram, cache, tmp_path):
+        tdlib = DownloadTdlib(telegram, unique_id="unique")
+        manager = DownloadManager(telegram, cache=cache)
+
+        future = manager.download(1)
+        deadline = time.monotonic() + 5
+        while not tdlib.started and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert tdlib.started == [1]
+
+        downloaded = self._downloaded(tmp_path)
+        file = _file(1, 100)
+        file["local"]["path"] = str(downloaded)
+        file["remote"] = {"@type": "remoteFile", "unique_id": "unique"}
+        telegram._process_update({"@type": "updateFile", "file": file})
+
+        assert future.result(timeout=5) == file
+        assert cache.get("unique", tmp_path / "b") is not None
+
+    def test_cache_is_not_used_from_the_listener_thread(self, telegram, cache, tmp_path):
+        tdlib = DownloadTdlib(telegram, unique_id="unique")
+        threads = []
+        get, put = cache.get, cache.put
+        cache.get = lambda *args: threads.append(threading.current_thread()) or get(*args)
+        cache.put = lambda *args: threads.append(threading.current_thread()) or put(*args)
+        manager = DownloadManager(telegram, cache=cache)
+
+        future = manager.download(1)
+        deadline = time.monotonic() + 5
+        while not tdlib.started and time.monotonic() < deadline:
+            time.sleep(0.01)
+        file = _file(1, 100)
+        file["local"]["path"] = str(self._downloaded(tmp_path))
+        file["remote"] = {"@type": "remoteFile", "unique_id": "unique"}
+        telegram._process_update({"@type": "updateFile", "file": file})
+
+        assert future.result(timeout=5) == file
+        assert len(threads) == 2
+        assert threading.current_thread() not in threads
+
+    def _downloaded(self, tmp_path):
+        path = tmp_path / "account" / "1.jpg"
+        path.parent.mkdir()
+        path.write_bytes(b"photo")
+        return path
@@ -0,0 +1,101 @@
+import re
+
+import pytest
+
+from telegram.filters import UpdateFilter, matches_update_type
+
+
+def _new_message(chat_id=1, text="hello", is_outgoing=False, content_type="messageText"):
+    content = {"@type": content_type}
+    if content_type == "messageText":
+        content["text"] = {"@type": "formattedText", "text": text, "entities": []}
+    else:
+        content["caption"] = {"@type": "formattedText", "text": text, "entities": []}
+
+    return {
+        "@type": "updateNewMessage",
+        "message": {
+            "@type": "message",
+            "chat_id": chat_id,
+            "is_outgoing": is_outgoing,
+            "content": content,
+        },
+    }
+
+
+class TestMatchesUpdateType:
+    @pytest.mark.parametrize(
+        ("handler_type", "update_type", "expected"),
+        [
+            ("updateNewMessage", "updateNewMessage", True),
+            ("updateNewMessage", "updateNewChat", False),
+            ("*", "updateNewChat", True),
+            ("updateChat*", "updateChatReadInbox", True),
+            ("updateChat*", "updateNewChat", False),
+            ("updateChat", "updateChatReadInbox", False),
+        ],
+    )
+    def test_matches(self, handler_type, update_type, expected):
+        assert matches_update_type(handler_type, update_type) is expected
+
+
+class TestUpdateFilter:
+    def test_empty_filter_accepts_everything(self):
+        assert UpdateFilter()({"@type": "updateOption"}) is True
+
+    def test_chat_ids_from_message(self):
+        update_filter = UpdateFilter(chat_ids=[1, 2])
+
+        assert update_filter(_new_message(chat_id=2)) is True
+        assert update_filter(_new_message(chat_id=3)) is False
+
+    def test_chat_ids_from_update(self):
+        update_filter = UpdateFilter(chat_ids=[1])
+
+        assert update_filter({"@type": "updateChatReadInbox", "chat_id": 1}) is True
+        assert update_filter({"@type": "updateChatReadInbox", "chat_id": 2}) is False
+        assert update_filter({"@type": "updateOption"}) is False
+
+    def test_content_types(self):
+        update_filter = UpdateFilter(content_types=["messagePhoto"])
+
+        assert update_filter(_new_message(content_type="messagePhoto")) is True
+        assert update_filter(_new_message()) is False
+        assert update_filter({"@type": "updateOption"}) is False
+
+    def test_content_types_of_updated_message(self):
+        update_filter = UpdateFilter(content_types=["messageText"])
+        update = {"@type": "updateMessageContent", "new_content": {"@type": "messageText"}}
+
+        assert update_filter(update) is True
+
+    def test_is_outgoing(self):
+        update_filter = UpdateFilter(is_outgoing=False)
+
+        assert update_filter(_new_message(is_outgoing=False)) is True
+        assert update_filter(_new_message(is_outgoing=True)) is False
+
+    @pytest.mark.parametrize("pattern", ["^ping", re.compile("^ping")])
+    def test_text(self, pattern):
+        update_filter = UpdateFilter(text=pattern)
+
+        assert update_filter(_new_message(text="ping pong")) is True
+        assert update_filter(_new_message(text="pong")) is False
+
+    def test_text_searches_captions(self):
+        update_filter = UpdateFilter(text="cat")
+
+        assert update_filter(_new_message(text="a cat", content_type="messagePhoto")) is True
+
+    def test_predicate(self):
+        update_filter = UpdateFilter(chat_ids=[1], predicate=lambda update: "message" in update)
+
+        assert update_filter(_new_message(chat_id=1)) is True
+        assert update_filter({"@type": "updateChatReadInbox", "chat_id": 1}) is False
+
+    def test_all_conditions_must_match(self):
+        update_filter = UpdateFilter(chat_ids=[1], is_outgoing=False, text="ping")
+
+        assert update_filter(_new_message(chat_id=1, text="ping")) is True
+        assert update_filter(_new_message(chat_id=1, text="ping", is_outgoing=True)) is False
+        assert update_filter(_new_message(chat_id=2, text="ping")) is False
@@ -0,0 +1,111 @@
+import json
+
+import pytest
+
+from telegram.models import FormattedText, Message, TDObject, UpdateNewMessage, decode_object, encode_object
+
+UPDATE = {
+    "@type": "updateNewMessage",
+    "message": {
+        "@type": "message",
+        "id": 1,
+        "chat_id": 2,
+        "is_outgoing": False,
+        "content": {
+            "@type": "messageText",
+            "text": {"@type": "formattedText", "text": "hello", "entities": []},
+        },
+        "a_field_from_a_newer_tdlib": True,
+    },
+}
+
+
+def _decode(data):
+    return json.loads(json.dumps(data), object_hook=decode_object)
+
+
+class TestDecodeObject:
+    def test_known_types_are_decoded_into_models(self):
+        update = _decode(UPDATE)
+
+        assert isinstance(update, UpdateNewMessage)
+        assert isinstance(update.message, Message)
+        assert isinstance(update.message.content["text"], FormattedText)
+        # no model for messageText
+        assert type(update.message.content) is dict
+
+    def test_unknown_types_stay_dicts(self):
+        data = {"@type": "updateOption", "name": "version"}
+
+        assert decode_object(data) is data
+
+    def test_models_have_no_dict(self):
+        message = _decode(UPDATE["message"])
+
+        assert not hasattr(message, "__dict__")
+
+
+class TestEncodeObject:
+    def test_models_are_encoded_as_dicts(self):
+        assert json.loads(json.dumps(_decode(UPDATE), default=encode_object)) == UPDATE
+
+    def test_other_objects_are_not_serializable(self):
+        with pytest.raises(TypeError):
+            json.dumps(object(), default=encode_object)
+
+
+class TestTDObject:
+    def test_attribute_and_item_access(self):
+        message = _decode(UPDATE["message"])
+
+        assert message.chat_id == message["chat_id"] == 2
+        assert message.get("id") == 1
+        assert message["@type"] == "message"
+
+    def test_missing_fields(self):
+        message = _decode(UPDATE["message"])
+
+        # a known field that was not in the object
+        assert message.date is None
+        assert message.get("date") is None
+        assert "date" not in message
+
+        with pytest.raises(KeyError):
+            message["date"]
+
+        with pytest.raises(AttributeError):
+            message.not_a_field  # noqa: B018
+
+    def test_unknown_fields_are_kept(self):
+        message = _decode(UPDATE["message"])
+
+        assert message["a_field_from_a_newer_tdlib"] is True
+
+    def test_converts_back_to_the_original_dict(self):
+        update = _decode(UPDATE)
+
+        assert update.to_dict() == UPDATE
+        assert update == UPDATE
+        assert len(update) == len(UPDATE)
+
+    def test_extra(self):
+        text = _decode({"@type": "formattedText", "text": "", "entities": [], "@extra": {"request_id": 1}})
+
+        assert text.get("@extra", {}).get("request_id") == 1
+        assert _decode({"@type": "formattedText"}).get("@extra", {}) == {}
+
+    def test_set_item(self):
+        text = FormattedText.from_dict({"@type": "formattedText", "text": "a"})
+
+        text["text"] = "b"
+        text["new"] = 1
+
+        assert text.text == "b"
+        assert text["new"] == 1
+
+        with pytest.raises(KeyError):
+            text["@type"] = "message"
+
+    def test_fields(self):
+        assert FormattedText.FIELDS == {"text", "entities"}
+        assert TDObject.FIELDS == frozenset()
@@ -0,0 +1,116 @@
+import time
+
+import pytest
+
+from telegram.models import Message
+from telegram.search import MessageIndex
+from tests.fake_tdlib import message
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = MessageIndex(tmp_path / "messages.sqlite")
+    yield index
+    index.close()
+
+
+def _found(results):
+    return [(result["chat_id"], result["message_id"]) for result in results]
+
+
+class TestMessageIndex:
+    def test_search(self, index):
+        index.add_messages(
+            [
+                message(1, 1, "The invoice for March"),
+                message(1, 2, "march invoice, paid", caption=True),
+                message(2, 3, "invoice for April"),
+                {"@type": "message", "id": 4, "chat_id": 1, "date": 4, "content": {"@type": "messageSticker"}},
+            ]
+        )
+
+        assert len(index) == 3
+        assert _found(index.search("invoice march")) == [(1, 2), (1, 1)]
+        assert _found(index.search("invoice", chat_ids=[2])) == [(2, 3)]
+        assert _found(index.search("invoice", limit=1)) == [(2, 3)]
+        assert index.search("") == []
+
+    def test_query_syntax_is_not_parsed(self, index):
+        index.add_messages([message(1, 1, 'say "hello" AND bye')])
+
+        assert _found(index.search('"hello" AND')) == [(1, 1)]
+        assert index.search("hello OR nothing") == []
+
+    def test_compact_models(self, index):
+        index.add_messages([Message.from_dict(message(1, 1, "hello"))])
+
+        assert _found(index.search("hello")) == [(1, 1)]
+
+    def test_updates(self, index):
+        index.index_updates(
+            [
+                {"@type": "updateNewMessage", "message": message(1, 1, "first")},
+                {"@type": "updateNewMessage", "message": message(1, 2, "second")},
+                {"@type": "updateNewMessage", "message": message(1, 3, "third")},
+                {
+                    "@type": "updateMessageContent",
+                    "chat_id": 1,
+                    "message_id": 1,
+                    "new_content": {"@type": "messageText", "text": {"@type": "formattedText", "text": "edited"}},
+                },
+                {"@type": "updateDeleteMessages", "chat_id": 1, "message_ids": [2], "is_permanent": True},
+                {"@type": "updateDeleteMessages", "chat_id": 1, "message_ids": [3], "from_cache": True},
+                {"@type": "updateMessageSendSucceeded", "message": message(1, 10, "third"), "old_message_id": 3},
+            ]
+        )
+
+        assert index.search("first") == []
+        assert _found(index.search("edited")) == [(1, 1)]
+        assert index.search("second") == []
+        assert _found(index.search("third")) == [(1, 10)]
+
+    def test_message_that_gets_a_caption_is_indexed(self, index):
+        photo = {**message(1, 1, ""), "content": {"@type": "messagePhoto"}}
+        index.index_updates(
+            [
+                {"@type": "updateNewMessage", "message": photo},
+                {
+                    "@type": "updateMessageContent",
+                    "chat_id": 1,
+                    "message_id": 1,
+                    "new_content": {"@type": "messagePhoto", "caption": {"@type": "formattedText", "text": "sunset"}},
+                },
+            ]
+        )
+
+        assert _found(index.search("sunset")) == [(1, 1)]
+
+    def test_persists(self, index):
+        index.add_messages([message(1, 1, "hello")])
+        index.close()
+
+        reopened = MessageIndex(index.path)
+        try:
+            assert _found(reopened.search("hello")) == [(1, 1)]
+        finally:
+            reopened.close()
+
+
+class TestLocalSearch:
+    def test_not_enabled(self, telegram):
+        with pytest.raises(RuntimeError):
+            telegram.search_local("hello")
+
+    def test_index_is_updated_from_updates(self, telegram, index):
+        telegram.enable_local_search(index, batch_size=2)
+
+        telegram._process_update({"@type": "updateNewMessage", "message": message(1, 1, "hello world")})
+        telegram._process_update({"@type": "updateChatTitle", "chat_id": 1, "title": "hello"})
+        telegram._process_update({"@type": "updateNewMessage", "message": message(1, 2, "hello again")})
+
+        # the worker calls the index with the batch as soon as it is full
+        deadline = time.monotonic() + 5
+        while len(index) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        assert _found(telegram.search_local("hello")) == [(1, 2), (1, 1)]
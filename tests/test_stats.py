@@ -0,0 +1,131 @@
+import pickle
+import random
+from collections import Counter
+
+import pytest
+
+from telegram.stats import CountMinSketch, SpaceSaving, WordStats, collect_word_stats, tokenize
+from tests.fake_tdlib import FakeTdlib, message
+
+
+def _zipf_words(n, seed=0):
+    rng = random.Random(seed)
+    vocabulary = [f"word{n}" for n in range(2000)]
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    return rng.choices(vocabulary, weights=weights, k=n)
+
+
+def _message(message_id, text):
+    return message(1, message_id, text)
+
+
+def test_tokenize():
+    assert tokenize(["Hello, World!", "the hello-world"]) == ["hello", "world", "hello", "world"]
+    assert tokenize(["a bc"], min_length=1) == ["a", "bc"]
+
+
+class TestSpaceSaving:
+    def test_counts_are_exact_below_capacity(self):
+        summary = SpaceSaving(capacity=10)
+        summary.update(["a", "b", "a"])
+        summary.update(["a"])
+
+        assert summary.most_common() == [("a", 3), ("b", 1)]
+        assert summary.error("a") == 0
+
+    def test_finds_the_frequent_words(self):
+        words = _zipf_words(50_000)
+        summary = SpaceSaving(capacity=200)
+
+        for start in range(0, len(words), 1000):
+            summary.update(words[start : start + 1000])
+
+        exact = Counter(words)
+        assert [word for word, _ in summary.most_common(5)] == [word for word, _ in exact.most_common(5)]
+        assert len(summary) == 200
+
+        for word, count in summary.most_common(20):
+            assert exact[word] <= count <= exact[word] + summary.error(word)
+
+    def test_merge(self):
+        words = _zipf_words(20_000)
+        first, second = SpaceSaving(200), SpaceSaving(200)
+        first.update(words[:10_000])
+        second.update(words[10_000:])
+
+        first.merge(pickle.loads(pickle.dumps(second)))
+
+        exact = Counter(words)
+        assert [word for word, _ in first.most_common(5)] == [word for word, _ in exact.most_common(5)]
+        for word, count in first.most_common(20):
+            assert exact[word] <= count <= exact[word] + first.error(word)
+
+    def test_capacity_must_be_positive(self):
+        with pytest.raises(ValueError):
+            SpaceSaving(0)
+
+
+class TestCountMinSketch:
+    def test_estimates_are_never_lower(self):
+        words = _zipf_words(20_000)
+        sketch = CountMinSketch(width=512, depth=4)
+        sketch.update(words)
+
+        exact = Counter(words)
+        assert sketch.total == len(words)
+        assert all(sketch.estimate(word) >= count for word, count in exact.items())
+        assert sketch.estimate("word0") <= exact["word0"] + 2 * len(words) / 512
+
+    def test_merge(self):
+        words = _zipf_words(5000)
+        first, second, whole = CountMinSketch(256), CountMinSketch(256), CountMinSketch(256)
+        first.update(words[:2000])
+        second.update(words[2000:])
+        whole.update(words)
+
+        first.merge(pickle.loads(pickle.dumps(second)))
+
+        assert first.rows == whole.rows
+        assert first.total == whole.total
+
+    def test_merge_needs_the_same_shape(self):
+        with pytest.raises(ValueError):
+            CountMinSketch(256).merge(CountMinSketch(512))
+
+
+class TestWordStats:
+    def test_add_messages(self):
+        stats = WordStats(exact=True, sketch=True)
+        stats.add_messages([_message(1, "hello world"), _message(2, "hello again"), {"content": {"@type": "x"}}])
+
+        assert stats.messages == 3
+        assert stats.words == 4
+        assert stats.most_common(1) == [("hello", 2)]
+        assert stats.count("hello") == 2
+        assert stats.top.most_common(1) == [("hello", 2)]
+        assert stats.sketch.estimate("hello") >= 2
+
+    def test_merge(self):
+        first, second = WordStats(exact=True), WordStats(exact=True)
+        first.add_texts(["hello world"])
+        second.add_texts(["hello there"])
+
+        first.merge(pickle.loads(pickle.dumps(second)))
+
+        assert first.most_common() == [("hello", 2), ("world", 1), ("there", 1)]
+        assert first.words == 4
+
+    def test_merge_needs_the_same_counters(self):
+        with pytest.raises(ValueError):
+            WordStats(exact=True).merge(WordStats())
+
+
+def test_collect_word_stats(telegram):
+    pages = [[_message(3, "hello world"), _message(2, "hello")], [_message(1, "world peace")], []]
+
+    FakeTdlib(telegram, lambda request: {"@type": "messages", "messages": pages.pop(0)})
+
+    stats = collect_word_stats(telegram, 1, stats=WordStats(exact=True))
+
+    assert stats.messages == 3
+    assert dict(stats.most_common()) == {"hello": 2, "world": 2, "peace": 1}
@@ -1,8 +1,20 @@
-from unittest.mock import Mock, patch
+import logging
+from unittest.mock import ANY, Mock, patch
 
 import pytest
 
-from telegram.tdjson import TDJson, _get_tdjson_lib_path
+from telegram import tdjson as tdjson_module
+from telegram.models import FormattedText, decode_object
+from telegram.tdjson import TDJson, TDLibLogForwarder, _get_tdjson_lib_path, td_execute
+
+
+@pytest.fixture(autouse=True)
+def _clear_libraries():
+    tdjson_module._libraries.clear()
+    tdjson_module._default_library_path = None
+    yield
+    tdjson_module._libraries.clear()
+    tdjson_module._default_library_path = None
 
 
 class TestGetTdjsonTdlibPath:
@@ -93,7 +105,215 @@ class TestTDJson:
         tdjson._td_json_client_receive.assert_not_called()
         tdjson._td_json_client_execute.assert_not_called()
 
-    def test_fatal_error_callback_stored_on_instance(self):
+    def test_fatal_error_callback_stored_on_library(self):
+        tdjson = self._make_tdjson()
+        assert tdjson._library.c_on_fatal_error_callback is not None
+
+    def test_default_library_is_found_once(self):
+        with (
+            patch("telegram.tdjson.ctypes.util.find_library", return_value="/usr/lib/libtdjson.so") as find_library,
+            patch("telegram.tdjson.CDLL") as mocked_cdll,
+        ):
+            TDJson(verbosity=0)
+            TDJson(verbosity=0)
+
+        find_library.assert_called_once_with("tdjson")
+        mocked_cdll.assert_called_once_with("/usr/lib/libtdjson.so")
+
+    def test_library_is_loaded_once_per_path(self):
+        with patch("telegram.tdjson.CDLL") as mocked_cdll:
+            mocked_cdll.return_value.td_json_client_create.side_effect = [1, 2, 3]
+
+            first = TDJson(library_path="/fake/lib.so", verbosity=0)
+            second = TDJson(library_path="/fake/lib.so", verbosity=0)
+            other = TDJson(library_path="/other/lib.so", verbosity=0)
+
+        assert first._library is second._library
+        assert other._library is not first._library
+        assert (first.td_json_client, second.td_json_client) == (1, 2)
+        assert mocked_cdll.call_count == 2
+
+        library = mocked_cdll.return_value
+        # the global tdlib settings are not changed by every new client
+        assert library.td_set_log_fatal_error_callback.call_count == 2
+        assert library.td_set_log_verbosity_level.call_count == 2
+
+    def test_verbosity_is_changed_when_it_differs(self):
+        with patch("telegram.tdjson.CDLL") as mocked_cdll:
+            TDJson(library_path="/fake/lib.so", verbosity=0)
+            TDJson(library_path="/fake/lib.so", verbosity=3)
+
+        set_verbosity = mocked_cdll.return_value.td_set_log_verbosity_level
+        assert [call.args for call in set_verbosity.call_args_list] == [(0,), (3,)]
+
+    def test_receive_uses_object_hook(self):
+        with patch("telegram.tdjson.CDLL"):
+            tdjson = TDJson(library_path="/fake/lib.so", verbosity=0, object_hook=decode_object)
+        tdjson._td_json_client_receive.return_value = b'{"@type": "formattedText", "text": "hi", "entities": []}'
+
+        result = tdjson.receive()
+
+        assert isinstance(result, FormattedText)
+        assert result.text == "hi"
+
+    def test_send_encodes_models(self):
         tdjson = self._make_tdjson()
-        assert hasattr(tdjson, "_c_on_fatal_error_callback")
-        assert tdjson._c_on_fatal_error_callback is not None
+        text = FormattedText.from_dict({"@type": "formattedText", "text": "hi", "entities": []})
+
+        tdjson.send({"@type": "sendMessage", "text": text})
+
+        tdjson._td_json_client_send.assert_called_once_with(
+            12345,
+            b'{"@type": "sendMessage", "text": {"@type": "formattedText", "entities": [], "text": "hi"}}',
+        )
+
+
+class TestTDJsonDebugLog:
+    def test_frames_are_not_logged_when_debug_is_off(self):
+        with patch("telegram.tdjson.CDLL") as mocked_cdll:
+            mocked_cdll.return_value.td_json_client_receive.return_value = b'{"@type": "ok"}'
+            tdjson = TDJson(library_path="/fake/lib.so")
+
+        td_logger = tdjson_module.logger
+        with (
+            patch.object(td_logger, "isEnabledFor", return_value=False) as is_enabled_for,
+            patch.object(td_logger, "debug") as debug,
+        ):
+            for _ in range(100):
+                tdjson.send({"@type": "getMe"})
+                tdjson.receive()
+
+        debug.assert_not_called()
+        is_enabled_for.assert_called_once()
+
+    def test_sampled_frames(self, caplog):
+        with patch("telegram.tdjson.CDLL") as mocked_cdll:
+            mocked_cdll.return_value.td_json_client_receive.return_value = b'{"@type": "ok"}'
+            tdjson = TDJson(library_path="/fake/lib.so", debug_log_sample_rate=10)
+
+        with caplog.at_level(logging.DEBUG, logger="telegram.tdjson"):
+            for _ in range(50):
+                tdjson.receive()
+
+        assert len(caplog.records) == 5
+
+
+class TestTdExecute:
+    def test_executes_without_a_client(self):
+        with patch("telegram.tdjson.CDLL") as mocked_cdll:
+            execute = mocked_cdll.return_value.td_json_client_execute
+            execute.return_value = b'{"@type": "text", "text": "image/png"}'
+
+            result = td_execute({"@type": "getFileMimeType", "file_name": "cat.png"}, library_path="/fake/lib.so")
+
+        assert result == {"@type": "text", "text": "image/png"}
+        execute.assert_called_once_with(None, b'{"@type": "getFileMimeType", "file_name": "cat.png"}')
+        mocked_cdll.return_value.td_json_client_create.assert_not_called()
+
+    def test_default_library_is_found_once(self):
+        with (
+            patch("telegram.tdjson.ctypes.util.find_library", return_value="/usr/lib/libtdjson.so") as find_library,
+            patch("telegram.tdjson.CDLL") as mocked_cdll,
+        ):
+            mocked_cdll.return_value.td_json_client_execute.return_value = b'{"@type": "ok"}'
+            td_execute({"@type": "getFileMimeType", "file_name": "cat.png"})
+            td_execute({"@type": "getFileMimeType", "file_name": "dog.png"})
+
+        find_library.assert_called_once_with("tdjson")
+
+
+class TestTDJsonLogSettings:
+    def test_log_file(self):
+        with patch("telegram.tdjson.CDLL") as mocked_cdll:
+            mocked_cdll.return_value.td_set_log_file_path.return_value = 1
+            TDJson(library_path="/fake/lib.so", log_file_path="/tmp/td.log", log_max_file_size=1024)
+
+        library = mocked_cdll.return_value
+        library.td_set_log_file_path.assert_called_once_with(b"/tmp/td.log")
+        library.td_set_log_max_file_size.assert_called_once_with(1024)
+
+    def test_log_file_that_can_not_be_opened(self):
+        with patch("telegram.tdjson.CDLL") as mocked_cdll, pytest.raises(RuntimeError, match="/nope"):
+            mocked_cdll.return_value.td_set_log_file_path.return_value = 0
+            TDJson(library_path="/fake/lib.so", log_file_path="/nope/td.log")
+
+    def test_log_forwarder_is_registered(self):
+        forwarder = TDLibLogForwarder()
+
+        with patch("telegram.tdjson.CDLL") as mocked_cdll:
+            tdjson = TDJson(library_path="/fake/lib.so", verbosity=3, log_forwarder=forwarder)
+
+        mocked_cdll.return_value.td_set_log_message_callback.assert_called_once_with(3, ANY)
+        assert tdjson._library.c_on_log_message_callback is not None
+
+
+class TestTDLibLogForwarder:
+    def test_maps_verbosity_to_log_levels(self, caplog):
+        forwarder = TDLibLogForwarder()
+
+        with caplog.at_level(logging.DEBUG, logger="telegram.tdjson"):
+            for verbosity in range(6):
+                forwarder(verbosity, f"message {verbosity}\n".encode())
+
+        assert [(record.levelno, record.getMessage()) for record in caplog.records] == [
+            (logging.CRITICAL, "[tdlib] message 0"),
+            (logging.ERROR, "[tdlib] message 1"),
+            (logging.WARNING, "[tdlib] message 2"),
+            (logging.INFO, "[tdlib] message 3"),
+            (logging.DEBUG, "[tdlib] message 4"),
+            (logging.DEBUG, "[tdlib] message 5"),
+        ]
+
+    def test_skips_messages_the_logger_ignores(self, caplog):
+        forwarder = TDLibLogForwarder(rate_limit=1)
+
+        with caplog.at_level(logging.WARNING, logger="telegram.tdjson"):
+            forwarder(4, b"debug")
+            forwarder(2, b"warning")
+
+        # the debug message has not used up the rate limit
+        assert [record.getMessage() for record in caplog.records] == ["[tdlib] warning"]
+
+    def test_samples_info_and_debug_messages(self, caplog):
+        forwarder = TDLibLogForwarder(sample_rate=10)
+
+        with caplog.at_level(logging.DEBUG, logger="telegram.tdjson"):
+            for n in range(30):
+                forwarder(4, f"debug {n}".encode())
+            forwarder(1, b"error")
+
+        assert [record.getMessage() for record in caplog.records] == [
+            "[tdlib] debug 9",
+            "[tdlib] debug 19",
+            "[tdlib] debug 29",
+            "[tdlib] error",
+        ]
+
+    def test_rate_limit(self, caplog):
+        forwarder = TDLibLogForwarder(rate_limit=5)
+
+        with caplog.at_level(logging.DEBUG, logger="telegram.tdjson"), patch("telegram.tdjson.time") as mocked_time:
+            mocked_time.monotonic.return_value = forwarder._updated_at
+            for n in range(8):
+                forwarder(2, f"warning {n}".encode())
+            forwarder(0, b"fatal")
+
+            mocked_time.monotonic.return_value += 1
+            forwarder(2, b"later")
+
+        assert [record.getMessage() for record in caplog.records] == [
+            "[tdlib] warning 0",
+            "[tdlib] warning 1",
+            "[tdlib] warning 2",
+            "[tdlib] warning 3",
+            "[tdlib] warning 4",
+            "3 tdlib log messages have been dropped by the rate limit",
+            "[tdlib] fatal",
+            "[tdlib] later",
+        ]
+
+    def test_invalid_arguments(self):
+        with pytest.raises(ValueError):
+            TDLibLogForwarder(rate_limit=0)
+        with pytest.raises(ValueError):
+            TDLibLogForwarder(sample_rate=0)
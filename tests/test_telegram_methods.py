@@ -1,4 +1,7 @@
+import asyncio
 import queue
+import subprocess
+import sys
 import threading
 import time
 from unittest.mock import patch
@@ -6,10 +9,12 @@ from unittest.mock import patch
 import pytest
 
 from telegram import VERSION
-from telegram.client import MESSAGE_HANDLER_TYPE, AuthorizationState, Telegram
+from telegram.client import MESSAGE_HANDLER_TYPE, AuthorizationState, Telegram, _set_chat_position, login_many
+from telegram.filters import UpdateFilter
+from telegram.tdjson import ClientDestroyedError
 from telegram.text import Spoiler
 from telegram.utils import AsyncResult
-from telegram.worker import SimpleWorker
+from telegram.worker import AsyncioWorker, HandlerLane, SimpleWorker, UpdateBatcher
 
 API_ID = 1
 API_HASH = "hash"
@@ -18,12 +23,6 @@ LIBRARY_PATH = "/lib/"
 DATABASE_ENCRYPTION_KEY = "changeme1234"
 
 
-@pytest.fixture
-def telegram():
-    with patch("telegram.client.TDJson"), patch("telegram.client.threading"):
-        return _get_telegram_instance()
-
-
 def _get_telegram_instance(**kwargs):
     kwargs.setdefault("api_id", API_ID)
     kwargs.setdefault("api_hash", API_HASH)
@@ -188,6 +187,67 @@ class TestTelegram:
 
             assert mocked_put.call_count == 0
 
+    def test_run_handlers_with_filter(self, telegram):
+        def my_handler():
+            pass
+
+        telegram.add_message_handler(my_handler, update_filter=UpdateFilter(chat_ids=[1]))
+
+        with patch.object(telegram._workers_queue, "put") as mocked_put:
+            update = {"@type": MESSAGE_HANDLER_TYPE, "message": {"chat_id": 1}}
+            telegram._run_handlers(update)
+            telegram._run_handlers({"@type": MESSAGE_HANDLER_TYPE, "message": {"chat_id": 2}})
+
+            mocked_put.assert_called_once_with((my_handler, update), timeout=10)
+
+    def test_run_handlers_with_prefix_and_catch_all(self, telegram):
+        def chat_handler():
+            pass
+
+        def any_handler():
+            pass
+
+        telegram.add_update_handler("updateChat*", chat_handler)
+        telegram.add_update_handler("*", any_handler)
+
+        with patch.object(telegram._workers_queue, "put") as mocked_put:
+            chat_update = {"@type": "updateChatReadInbox"}
+            option_update = {"@type": "updateOption"}
+            telegram._run_handlers(chat_update)
+            telegram._run_handlers(option_update)
+
+            assert [c.args[0] for c in mocked_put.call_args_list] == [
+                (chat_handler, chat_update),
+                (any_handler, chat_update),
+                (any_handler, option_update),
+            ]
+
+    def test_dispatch_table_is_rebuilt_after_handlers_change(self, telegram):
+        def my_handler():
+            pass
+
+        with patch.object(telegram._workers_queue, "put") as mocked_put:
+            telegram._run_handlers({"@type": MESSAGE_HANDLER_TYPE})
+            assert telegram._dispatch_table == {MESSAGE_HANDLER_TYPE: ()}
+
+            telegram.add_message_handler(my_handler)
+            telegram._run_handlers({"@type": MESSAGE_HANDLER_TYPE})
+            assert mocked_put.call_count == 1
+
+            telegram.remove_update_handler(MESSAGE_HANDLER_TYPE, my_handler)
+            telegram._run_handlers({"@type": MESSAGE_HANDLER_TYPE})
+            assert mocked_put.call_count == 1
+
+    def test_add_update_handler_again_replaces_the_filter(self, telegram):
+        def my_handler():
+            pass
+
+        telegram.add_message_handler(my_handler, update_filter=UpdateFilter(chat_ids=[1]))
+        telegram.add_message_handler(my_handler)
+
+        assert telegram._update_handlers[MESSAGE_HANDLER_TYPE] == [my_handler]
+        assert telegram._handler_filters == {}
+
     def test_call_method(self, telegram):
         method_name = "someMethod"
         params = {"param_1": "value_1", "param_2": 2}
@@ -454,6 +514,99 @@ class TestTelegram__update_async_result:
         assert new_async_result.id == "updateAuthorizationState"
 
 
+class TestAuthorizationStateTracking:
+    def _prepare(self, telegram):
+        # the `telegram` fixture patches `threading`
+        telegram._authorization_state_changed = threading.Condition()
+
+    def _update(self, state):
+        return {"@type": "updateAuthorizationState", "authorization_state": {"@type": state}}
+
+    def test_listener_tracks_unsolicited_updates(self, telegram):
+        self._prepare(telegram)
+        telegram._stopped = threading.Event()
+        updates = [self._update("authorizationStateWaitTdlibParameters"), self._update("authorizationStateClosed")]
+
+        def receive():
+            if not updates:
+                telegram._stopped.set()
+                return None
+            return updates.pop(0)
+
+        telegram._tdjson.receive = receive
+        telegram._listen_to_td()
+
+        assert telegram.authorization_state == AuthorizationState.CLOSED
+
+    def test_unknown_state_is_ignored(self, telegram):
+        self._prepare(telegram)
+
+        telegram._track_authorization_state(self._update("authorizationStateSomethingNew"))
+
+        assert telegram.authorization_state == AuthorizationState.NONE
+
+    def test_wait_for_state(self, telegram):
+        self._prepare(telegram)
+
+        def track_later():
+            time.sleep(0.1)
+            telegram._track_authorization_state(self._update("authorizationStateWaitPhoneNumber"))
+            telegram._track_authorization_state(self._update("authorizationStateReady"))
+
+        thread = threading.Thread(target=track_later)
+        thread.start()
+        state = telegram.wait_for_state(AuthorizationState.READY, timeout=5)
+        thread.join()
+
+        assert state == AuthorizationState.READY
+
+    def test_wait_for_one_of_several_states(self, telegram):
+        self._prepare(telegram)
+        telegram.authorization_state = AuthorizationState.WAIT_CODE
+
+        state = telegram.wait_for_state([AuthorizationState.WAIT_CODE, AuthorizationState.READY], timeout=0)
+
+        assert state == AuthorizationState.WAIT_CODE
+
+    def test_wait_for_state_timeout(self, telegram):
+        self._prepare(telegram)
+
+        with pytest.raises(TimeoutError):
+            telegram.wait_for_state(AuthorizationState.READY, timeout=0.05)
+
+    def test_tracked_state_wins_over_an_older_result(self, telegram):
+        self._prepare(telegram)
+        result = telegram._send_data({"@type": "checkAuthenticationCode"}, result_id="updateAuthorizationState")
+
+        update = self._update("authorizationStateWaitPassword")
+        telegram._track_authorization_state(update)
+        telegram._update_async_result(update)
+        # tdlib has moved on before the waiting thread woke up
+        telegram._track_authorization_state(self._update("authorizationStateReady"))
+
+        assert telegram._wait_authorization_result(result) == AuthorizationState.READY
+
+    def test_close_returns_when_tdlib_reports_closed(self, telegram):
+        self._prepare(telegram)
+        telegram.authorization_state = AuthorizationState.READY
+
+        def answer(data):
+            telegram._update_async_result({"@type": "ok", "@extra": data["@extra"]})
+            threading.Timer(
+                0.1, telegram._track_authorization_state, args=[self._update("authorizationStateClosed")]
+            ).start()
+
+        telegram._tdjson.send.side_effect = answer
+
+        started = time.monotonic()
+        telegram._close(timeout=5)
+
+        assert time.monotonic() - started < 3
+        assert telegram.authorization_state == AuthorizationState.CLOSED
+        # no authorization state polling
+        assert telegram._tdjson.send.call_count == 1
+
+
 class TestTelegram__send_data:
     def test_raises_if_a_request_with_the_same_id_is_in_flight(self, telegram):
         first = telegram._send_data({"@type": "checkAuthenticationCode"}, result_id="updateAuthorizationState")
@@ -485,6 +638,320 @@ class TestTelegram__send_data:
 
         assert first.id != second.id
 
+    def test_request_ids_are_integers_from_a_per_client_counter(self, telegram):
+        other = _get_telegram_instance(phone="+1")
+
+        first = telegram.get_me()
+        second = telegram.get_me()
+
+        assert (first.id, second.id) == (1, 2)
+        assert other.get_me().id == 1
+        assert telegram._tdjson.send.call_args.args[0]["@extra"] == {"request_id": 2}
+
+    def test_integer_request_ids_are_resolved(self, telegram):
+        async_result = telegram.get_me()
+
+        telegram._update_async_result({"@type": "user", "id": 1, "@extra": {"request_id": async_result.id}})
+
+        assert async_result.update == {"@type": "user", "id": 1, "@extra": {"request_id": 1}}
+        assert async_result.id not in telegram._results
+
+
+class TestTelegram__fire_and_forget:
+    def test_sends_without_a_result(self, telegram):
+        assert telegram.call_method("viewMessages", {"chat_id": 1}, fire_and_forget=True) is None
+
+        telegram._tdjson.send.assert_called_once_with({"@type": "viewMessages", "chat_id": 1})
+        assert telegram._results == {}
+
+    def test_can_not_block(self, telegram):
+        with pytest.raises(ValueError):
+            telegram.call_method("viewMessages", block=True, fire_and_forget=True)
+
+        telegram._tdjson.send.assert_not_called()
+
+    def test_answer_is_ignored(self, telegram):
+        telegram.call_method("viewMessages", fire_and_forget=True)
+
+        assert telegram._update_async_result({"@type": "ok"}) is None
+
+
+class TestMessageDelivery:
+    def _send(self, telegram, chat_id=1, temporary_id=100):
+        async_result = telegram.send_message(chat_id=chat_id, text="hello")
+        telegram._process_update(
+            {
+                "@type": "message",
+                "id": temporary_id,
+                "chat_id": chat_id,
+                "sending_state": {"@type": "messageSendingStatePending"},
+                "@extra": {"request_id": async_result.id},
+            }
+        )
+        return async_result
+
+    def test_succeeded(self, telegram):
+        async_result = self._send(telegram)
+        assert telegram._pending_sends == {(1, 100): async_result}
+
+        message = {"@type": "message", "id": 555, "chat_id": 1}
+        telegram._process_update({"@type": "updateMessageSendSucceeded", "message": message, "old_message_id": 100})
+
+        assert async_result.wait_delivered(timeout=0) == message
+        assert telegram._pending_sends == {}
+
+    def test_failed(self, telegram):
+        async_result = self._send(telegram)
+        error = {"@type": "error", "code": 403, "message": "Forbidden"}
+
+        telegram._process_update(
+            {
+                "@type": "updateMessageSendFailed",
+                "message": {"@type": "message", "id": 100, "chat_id": 1},
+                "old_message_id": 100,
+                "error": error,
+            }
+        )
+
+        assert async_result.delivery_error == error
+        with pytest.raises(RuntimeError, match="Forbidden"):
+            async_result.wait_delivered(timeout=0)
+
+    def test_failed_with_error_fields_of_older_tdlib(self, telegram):
+        async_result = self._send(telegram)
+
+        telegram._process_update(
+            {
+                "@type": "updateMessageSendFailed",
+                "message": {"@type": "message", "id": 100, "chat_id": 1},
+                "old_message_id": 100,
+                "error_code": 403,
+                "error_message": "Forbidden",
+            }
+        )
+
+        assert async_result.delivery_error == {"@type": "error", "code": 403, "message": "Forbidden"}
+
+    def test_get_message_does_not_take_over_the_delivery(self, telegram):
+        async_result = self._send(telegram)
+        get_message = telegram.get_message(1, 100)
+        telegram._process_update(
+            {
+                "@type": "message",
+                "id": 100,
+                "chat_id": 1,
+                "sending_state": {"@type": "messageSendingStatePending"},
+                "@extra": {"request_id": get_message.id},
+            }
+        )
+        telegram._process_update(
+            {
+                "@type": "updateMessageSendSucceeded",
+                "message": {"@type": "message", "id": 101, "chat_id": 1},
+                "old_message_id": 100,
+            }
+        )
+
+        assert async_result.wait_delivered(timeout=0)["id"] == 101
+        assert telegram._pending_sends == {}
+
+    def test_outcomes_are_matched_by_chat_and_message(self, telegram):
+        first = self._send(telegram, chat_id=1, temporary_id=100)
+        second = self._send(telegram, chat_id=2, temporary_id=100)
+
+        telegram._process_update(
+            {
+                "@type": "updateMessageSendSucceeded",
+                "message": {"@type": "message", "id": 7, "chat_id": 2},
+                "old_message_id": 100,
+            }
+        )
+
+        assert not first.delivery_future().done()
+        assert second.wait_delivered(timeout=0)["id"] == 7
+
+    def test_delivery_can_be_awaited(self, telegram):
+        async_result = self._send(telegram)
+
+        async def wait():
+            return await asyncio.wrap_future(async_result.delivery_future())
+
+        loop = asyncio.new_event_loop()
+        try:
+            task = loop.create_task(wait())
+            loop.call_soon(
+                telegram._process_update,
+                {
+                    "@type": "updateMessageSendSucceeded",
+                    "message": {"@type": "message", "id": 9, "chat_id": 1},
+                    "old_message_id": 100,
+                },
+            )
+            assert loop.run_until_complete(task)["id"] == 9
+        finally:
+            loop.close()
+
+
+class TestImportContactsBulk:
+    def _contacts(self, n):
+        return [{"phone_number": f"+1555000{i:04d}", "first_name": f"Name {i}"} for i in range(n)]
+
+    def _fake_tdlib(self, telegram, errors=None, answer=True):
+        """Answers importContacts with user id = 1000 + the number in the phone, `errors` are returned first"""
+        errors = list(errors or [])
+        requests = []
+
+        def send(data):
+            requests.append(data)
+            extra = {"@extra": data["@extra"]}
+
+            if errors:
+                telegram._process_update({"@type": "error", **errors.pop(0), **extra})
+                return
+
+            if not answer:
+                return
+
+            numbers = [int(contact["phone_number"][-4:]) for contact in data["contacts"]]
+            telegram._process_update(
+                {
+                    "@type": "importedContacts",
+                    "user_ids": [1000 + number for number in numbers],
+                    "importer_count": [number % 3 for number in numbers],
+                    **extra,
+                }
+            )
+
+        telegram._tdjson.send.side_effect = send
+        return requests
+
+    def test_chunks_are_merged_in_order(self, telegram):
+        requests = self._fake_tdlib(telegram)
+
+        result = telegram.import_contacts_bulk(self._contacts(25), chunk_size=10)
+
+        assert [len(request["contacts"]) for request in requests] == [10, 10, 5]
+        assert requests[0]["contacts"][0]["@type"] == "contact"
+        assert result["user_ids"] == [1000 + i for i in range(25)]
+        assert result["importer_count"] == [i % 3 for i in range(25)]
+
+    def test_flood_wait_is_retried(self, telegram):
+        flood = {"code": 429, "message": "Too Many Requests: retry after 0"}
+        requests = self._fake_tdlib(telegram, errors=[flood, flood])
+
+        result = telegram.import_contacts_bulk(self._contacts(4), chunk_size=2, max_in_flight=1)
+
+        assert len(requests) == 4
+        assert result["user_ids"] == [1000, 1001, 1002, 1003]
+
+    def test_other_errors_are_raised(self, telegram):
+        self._fake_tdlib(telegram, errors=[{"code": 400, "message": "PHONE_NUMBER_INVALID"}])
+
+        with pytest.raises(RuntimeError, match="PHONE_NUMBER_INVALID"):
+            telegram.import_contacts_bulk(self._contacts(4), chunk_size=2)
+
+    def test_gives_up_after_max_retries(self, telegram):
+        flood = {"code": 429, "message": "Too Many Requests: retry after 0"}
+        self._fake_tdlib(telegram, errors=[flood] * 3)
+
+        with pytest.raises(RuntimeError, match="Too Many Requests"):
+            telegram.import_contacts_bulk(self._contacts(1), max_retries=2)
+
+    def test_max_in_flight_and_timeout(self, telegram):
+        requests = self._fake_tdlib(telegram, answer=False)
+
+        with pytest.raises(TimeoutError):
+            telegram.import_contacts_bulk(self._contacts(10), chunk_size=1, max_in_flight=3, timeout=0.05)
+
+        assert len(requests) == 3
+
+    def test_empty(self, telegram):
+        assert telegram.import_contacts_bulk([]) == {"@type": "importedContacts", "user_ids": [], "importer_count": []}
+
+
+class TestLoadAllChats:
+    def _chat(self, chat_id, order):
+        return {"@type": "chat", "id": chat_id, "positions": [_position(order)]}
+
+    def _fake_tdlib(self, telegram, pages, chat_ids, known=()):
+        """Answers loadChats with the next page of updateNewChat, then 404"""
+        pages = list(pages)
+        requests = []
+
+        def send(data):
+            requests.append(data["@type"])
+            extra = {"@extra": data["@extra"]}
+
+            if data["@type"] == "loadChats":
+                if not pages:
+                    telegram._process_update({"@type": "error", "code": 404, "message": "Not Found", **extra})
+                    return
+                for update in pages.pop(0):
+                    telegram._process_update(update)
+                telegram._process_update({"@type": "ok", **extra})
+            elif data["@type"] == "getChats":
+                telegram._process_update(
+                    {"@type": "chats", "total_count": len(chat_ids), "chat_ids": chat_ids, **extra}
+                )
+            elif data["@type"] == "getChat":
+                telegram._process_update({**known[data["chat_id"]], **extra})
+
+        telegram._tdjson.send.side_effect = send
+        return requests
+
+    def test_collects_chats_from_updates(self, telegram):
+        pages = [
+            [
+                {"@type": "updateNewChat", "chat": self._chat(1, 10)},
+                {"@type": "updateNewChat", "chat": self._chat(2, 20)},
+            ],
+            [
+                {"@type": "updateNewChat", "chat": self._chat(3, 5)},
+                {"@type": "updateChatPosition", "chat_id": 1, "position": _position(30)},
+            ],
+        ]
+        requests = self._fake_tdlib(telegram, pages, chat_ids=[1, 2, 3])
+
+        chats = telegram.load_all_chats()
+
+        assert [chat["id"] for chat in chats] == [1, 2, 3]
+        assert chats[0]["positions"] == [_position(30)]
+        assert requests == ["loadChats", "loadChats", "loadChats", "getChats"]
+        assert telegram._chat_hooks == []
+
+    def test_requests_only_the_chats_sent_before(self, telegram):
+        known = {7: {"@type": "chat", "id": 7, "positions": []}}
+        requests = self._fake_tdlib(telegram, [[{"@type": "updateNewChat", "chat": self._chat(1, 10)}]], [7, 1], known)
+
+        chats = telegram.load_all_chats()
+
+        assert [chat["id"] for chat in chats] == [7, 1]
+        assert requests.count("getChat") == 1
+
+    def test_error(self, telegram):
+        def send(data):
+            telegram._process_update({"@type": "error", "code": 400, "message": "Bad", "@extra": data["@extra"]})
+
+        telegram._tdjson.send.side_effect = send
+
+        with pytest.raises(RuntimeError, match="Bad"):
+            telegram.load_all_chats()
+
+        assert telegram._chat_hooks == []
+
+    def test_removed_position(self, telegram):
+        chat = self._chat(1, 10)
+        archive = {"@type": "chatPosition", "list": {"@type": "chatListArchive"}, "order": "7"}
+        chat["positions"].append(archive)
+
+        _set_chat_position(chat, _position(0))
+
+        assert chat["positions"] == [archive]
+
+
+def _position(order):
+    return {"@type": "chatPosition", "list": {"@type": "chatListMain"}, "order": str(order), "is_pinned": False}
+
 
 class TestTelegram__login:
     def test_login_process_should_do_nothing_if_already_authorized(self, telegram):
@@ -532,6 +999,98 @@ class TestTelegram__login:
         assert telegram._tdjson.send.call_count == 0
 
 
+class TestTelegram__login_warm_start:
+    def _make_database(self, path, name="td.binlog"):
+        (path / "database").mkdir()
+        (path / "database" / name).write_bytes(b"")
+
+    def test_has_database(self, tmp_path):
+        telegram = _get_telegram_instance(files_directory=tmp_path)
+        assert telegram._has_database() is False
+
+        self._make_database(tmp_path)
+        assert telegram._has_database() is True
+
+        telegram.use_test_dc = True
+        assert telegram._has_database() is False
+
+    def test_login_sends_parameters_right_away(self, tmp_path):
+        self._make_database(tmp_path)
+        telegram = _get_telegram_instance(files_directory=tmp_path, warm_start=True)
+        telegram._authorization_state_changed = threading.Condition()
+
+        def answer(data):
+            assert data["@type"] == "setTdlibParameters"
+            telegram._update_async_result({"@type": "ok", "@extra": data["@extra"]})
+            threading.Timer(
+                0.05,
+                telegram._track_authorization_state,
+                args=[
+                    {"@type": "updateAuthorizationState", "authorization_state": {"@type": "authorizationStateReady"}}
+                ],
+            ).start()
+
+        telegram._tdjson.send.side_effect = answer
+
+        assert telegram.login() == AuthorizationState.READY
+        # no getAuthorizationState and no waiting for the first state
+        assert telegram._tdjson.send.call_count == 1
+        assert telegram.time_to_ready is not None
+
+    def test_login_continues_if_the_database_is_not_authorized(self, tmp_path):
+        self._make_database(tmp_path)
+        telegram = _get_telegram_instance(files_directory=tmp_path, warm_start=True)
+
+        def login_warm():
+            telegram.authorization_state = AuthorizationState.WAIT_PHONE_NUMBER
+
+        def send_phone_number():
+            result = AsyncResult(client=telegram)
+            result.update = {"authorization_state": {"@type": "authorizationStateWaitCode"}}
+            result._ready.set()
+            return result
+
+        telegram._login_warm = login_warm
+        telegram._send_phone_number_or_bot_token = send_phone_number
+
+        assert telegram.login(blocking=False) == AuthorizationState.WAIT_CODE
+
+    def test_login_warm_falls_back_when_tdlib_does_not_answer(self, tmp_path):
+        self._make_database(tmp_path)
+        telegram = _get_telegram_instance(files_directory=tmp_path, warm_start=True)
+        telegram._authorization_state_changed = threading.Condition()
+        telegram._tdjson.send.side_effect = lambda data: telegram._update_async_result(
+            {"@type": "ok", "@extra": data["@extra"]}
+        )
+
+        with patch("telegram.client.WARM_START_TIMEOUT", 0.05):
+            started = time.monotonic()
+            telegram._login_warm()
+
+        assert time.monotonic() - started < 3
+        # the normal login loop takes over from here
+        assert telegram.authorization_state == AuthorizationState.NONE
+
+    def test_no_warm_start_without_database(self, tmp_path):
+        telegram = _get_telegram_instance(files_directory=tmp_path, warm_start=True)
+        telegram.authorization_state = AuthorizationState.READY
+
+        with patch.object(telegram, "_login_warm") as mocked_login_warm:
+            telegram.login()
+
+        mocked_login_warm.assert_not_called()
+
+    def test_warm_start_is_disabled_by_default(self, tmp_path):
+        self._make_database(tmp_path)
+        telegram = _get_telegram_instance(files_directory=tmp_path)
+        telegram.authorization_state = AuthorizationState.READY
+
+        with patch.object(telegram, "_login_warm") as mocked_login_warm:
+            telegram.login()
+
+        mocked_login_warm.assert_not_called()
+
+
 class TestTelegram__login_non_blocking:
     def test_login_process_with_phone(self, telegram):
         telegram.authorization_state = AuthorizationState.NONE
@@ -629,6 +1188,60 @@ class TestTelegram__login_non_blocking:
         assert "LOGGING_OUT" in str(excinfo.value)
 
 
+class TestLoginMany:
+    def test_clients_log_in_concurrently(self):
+        clients = [_get_telegram_instance(phone=f"+{n}") for n in range(10)]
+
+        def slow_login(blocking):
+            assert blocking is False
+            time.sleep(0.3)
+            return AuthorizationState.READY
+
+        reported = []
+        with patch.object(Telegram, "login", side_effect=slow_login):
+            started = time.monotonic()
+            results = login_many(clients, on_login=lambda client, result: reported.append(client))
+
+        # one after another they would take 3 seconds
+        assert time.monotonic() - started < 2
+        assert results == dict.fromkeys(clients, AuthorizationState.READY)
+        assert sorted(reported, key=id) == sorted(clients, key=id)
+
+    def test_reports_states_and_errors_per_client(self):
+        ready, waiting, failing = (_get_telegram_instance(phone=f"+{n}") for n in range(3))
+        error = RuntimeError("boom")
+
+        ready.login = lambda blocking: AuthorizationState.READY
+        waiting.login = lambda blocking: AuthorizationState.WAIT_CODE
+
+        def fail(blocking):
+            raise error
+
+        failing.login = fail
+
+        results = login_many([ready, waiting, failing])
+
+        assert results == {
+            ready: AuthorizationState.READY,
+            waiting: AuthorizationState.WAIT_CODE,
+            failing: error,
+        }
+
+    def test_on_login_errors_do_not_lose_the_results(self):
+        clients = [_get_telegram_instance(phone=f"+{n}") for n in range(3)]
+
+        def on_login(client, result):
+            raise RuntimeError("boom")
+
+        with patch.object(Telegram, "login", return_value=AuthorizationState.READY):
+            results = login_many(clients, on_login=on_login)
+
+        assert results == dict.fromkeys(clients, AuthorizationState.READY)
+
+    def test_no_clients(self):
+        assert login_many([]) == {}
+
+
 class TestWorkerExceptionHandling:
     def test_worker_thread_survives_handler_exception(self):
         q = queue.Queue()
@@ -660,6 +1273,289 @@ class TestWorkerExceptionHandling:
         assert task_done.call_count == 2
 
 
+class TestAsyncioWorker:
+    def test_coroutine_handlers_run_concurrently(self):
+        q = queue.Queue()
+        worker = AsyncioWorker(queue=q)
+        results = []
+        all_done = threading.Event()
+
+        async def slow_handler(update):
+            await asyncio.sleep(0.3)
+            results.append(update)
+            if len(results) == 20:
+                all_done.set()
+
+        worker.run()
+        started = time.monotonic()
+        for n in range(20):
+            q.put((slow_handler, n))
+
+        assert all_done.wait(timeout=5)
+        # one after another they would take 6 seconds
+        assert time.monotonic() - started < 3
+        worker.stop()
+
+        assert sorted(results) == list(range(20))
+
+    def test_worker_survives_handler_exceptions(self):
+        q = queue.Queue()
+        worker = AsyncioWorker(queue=q)
+        results = []
+        good_handler_called = threading.Event()
+
+        async def bad_coroutine(update):
+            raise RuntimeError("boom")
+
+        def bad_handler(update):
+            raise RuntimeError("boom")
+
+        def good_handler(update):
+            results.append(update)
+            good_handler_called.set()
+
+        with patch.object(q, "task_done", wraps=q.task_done) as task_done:
+            worker.run()
+
+            q.put((bad_coroutine, 1))
+            q.put((bad_handler, 2))
+            q.put((good_handler, 3))
+
+            assert good_handler_called.wait(timeout=5)
+            q.join()
+            worker.stop()
+
+        assert results == [3]
+        assert task_done.call_count == 3
+
+    def test_stop_cancels_running_handlers(self):
+        q = queue.Queue()
+        worker = AsyncioWorker(queue=q, max_tasks=1)
+        started = threading.Event()
+
+        async def endless_handler(update):
+            started.set()
+            await asyncio.sleep(3600)
+
+        worker.run()
+        q.put((endless_handler, 1))
+        assert started.wait(timeout=5)
+
+        worker.stop()
+
+        assert worker.loop.is_closed()
+        assert q.unfinished_tasks == 0
+
+
+class TestCoroutineHandlers:
+    async def _handler(self, update):
+        pass
+
+    def test_coroutine_handler_needs_a_worker_that_supports_them(self, telegram):
+        with pytest.raises(ValueError, match="coroutine"):
+            telegram.add_message_handler(self._handler)
+
+    def test_coroutine_handler_with_asyncio_worker(self):
+        telegram = _get_telegram_instance(worker=AsyncioWorker)
+
+        telegram.add_message_handler(self._handler)
+
+        assert telegram._update_handlers[MESSAGE_HANDLER_TYPE] == [self._handler]
+
+    def test_coroutine_handler_can_not_have_a_lane(self):
+        telegram = _get_telegram_instance(worker=AsyncioWorker)
+
+        with pytest.raises(ValueError, match="lane"):
+            telegram.add_message_handler(self._handler, concurrency=2)
+
+
+class TestHandlerLane:
+    def test_lane_processes_updates_and_counts_them(self):
+        processed = threading.Event()
+        results = []
+
+        def handler(update):
+            results.append(update)
+            if update["n"] == 1:
+                raise RuntimeError("boom")
+            processed.set()
+
+        lane = HandlerLane(queue=queue.Queue(), handler=handler, concurrency=2)
+        lane.run()
+
+        assert lane.put({"n": 1}) is True
+        assert lane.put({"n": 2}) is True
+        assert processed.wait(timeout=5)
+
+        lane.stop()
+
+        stats = lane.stats()
+        assert sorted(u["n"] for u in results) == [1, 2]
+        assert stats["processed"] == 2
+        assert stats["failed"] == 1
+        assert stats["dropped"] == 0
+        assert stats["max_latency"] >= stats["average_latency"] > 0
+
+    def test_full_lane_drops_updates(self):
+        # not running, so nothing takes updates from the queue
+        lane = HandlerLane(queue=queue.Queue(maxsize=1), handler=lambda update: None)
+
+        assert lane.put({"n": 1}) is True
+        assert lane.put({"n": 2}) is False
+        assert lane.stats()["dropped"] == 1
+        assert lane.stats()["queued"] == 1
+
+    def test_concurrency_must_be_positive(self):
+        with pytest.raises(ValueError):
+            HandlerLane(queue=queue.Queue(), handler=lambda update: None, concurrency=0)
+
+
+class TestUpdateBatcher:
+    def test_calls_handler_with_full_batches(self):
+        batches = []
+        batcher = UpdateBatcher(handler=batches.append, batch_size=2, max_delay=None)
+
+        for n in range(5):
+            batcher(n)
+
+        assert batches == [[0, 1], [2, 3]]
+
+        batcher.flush()
+        assert batches == [[0, 1], [2, 3], [4]]
+
+        # nothing left, the handler is not called with an empty list
+        batcher.flush()
+        assert len(batches) == 3
+
+    def test_calls_handler_after_max_delay(self):
+        batches = []
+        flushed = threading.Event()
+
+        def handler(batch):
+            batches.append(batch)
+            flushed.set()
+
+        batcher = UpdateBatcher(handler=handler, batch_size=100, max_delay=0.05)
+        batcher(1)
+        batcher(2)
+
+        assert flushed.wait(timeout=5)
+        assert batches == [[1, 2]]
+
+        batcher.stop()
+
+    def test_uses_one_flusher_thread_for_all_batches(self):
+        batches = []
+        flushed = threading.Semaphore(0)
+
+        def handler(batch):
+            batches.append(batch)
+            flushed.release()
+
+        batcher = UpdateBatcher(handler=handler, batch_size=100, max_delay=0.01)
+
+        batcher(1)
+        assert flushed.acquire(timeout=5)
+        flusher = batcher._flusher
+
+        batcher(2)
+        assert flushed.acquire(timeout=5)
+
+        assert batcher._flusher is flusher
+        assert batches == [[1], [2]]
+
+        batcher.stop()
+        assert not flusher.is_alive()
+
+    def test_stop_flushes_the_batch(self):
+        batches = []
+        batcher = UpdateBatcher(handler=batches.append, batch_size=100, max_delay=60)
+
+        batcher(1)
+        batcher.stop()
+
+        assert batches == [[1]]
+        assert not batcher._flusher.is_alive()
+
+    def test_batch_size_must_be_positive(self):
+        with pytest.raises(ValueError):
+            UpdateBatcher(handler=print, batch_size=0)
+
+
+class TestTelegramBatchedHandlers:
+    def test_batcher_is_put_into_the_queue(self, telegram):
+        def my_handler(updates):
+            pass
+
+        telegram.add_message_handler(my_handler, batch_size=10, max_delay=2)
+
+        batcher = telegram._handler_batchers[(MESSAGE_HANDLER_TYPE, my_handler)]
+        assert batcher.batch_size == 10
+        assert batcher.max_delay == 2
+        assert telegram._update_handlers[MESSAGE_HANDLER_TYPE] == [my_handler]
+
+        with patch.object(telegram._workers_queue, "put") as mocked_put:
+            update = {"@type": MESSAGE_HANDLER_TYPE}
+            telegram._run_handlers(update)
+
+            mocked_put.assert_called_once_with((batcher, update), timeout=10)
+
+    def test_remove_update_handler_flushes_the_batch(self, telegram):
+        batches = []
+        telegram.add_update_handler("updateOption", batches.append, batch_size=10)
+        telegram._handler_batchers[("updateOption", batches.append)]({"@type": "updateOption"})
+
+        telegram.remove_update_handler("updateOption", batches.append)
+
+        assert batches == [[{"@type": "updateOption"}]]
+        assert telegram._handler_batchers == {}
+
+
+class TestTelegramHandlerLanes:
+    def test_handler_with_a_lane_skips_the_shared_queue(self, telegram):
+        def my_handler(update):
+            pass
+
+        with patch("telegram.client.HandlerLane") as mocked_lane:
+            telegram.add_message_handler(my_handler, concurrency=4, queue_size=10)
+
+        lane = mocked_lane.return_value
+        assert mocked_lane.call_args.kwargs["concurrency"] == 4
+        assert mocked_lane.call_args.kwargs["queue"].maxsize == 10
+        lane.run.assert_called_once()
+
+        with patch.object(telegram._workers_queue, "put") as mocked_put:
+            update = {"@type": MESSAGE_HANDLER_TYPE}
+            telegram._run_handlers(update)
+
+            assert mocked_put.call_count == 0
+            lane.put.assert_called_once_with(update)
+
+    def test_remove_update_handler_stops_the_lane(self, telegram):
+        def my_handler(update):
+            pass
+
+        with patch("telegram.client.HandlerLane") as mocked_lane:
+            telegram.add_message_handler(my_handler, concurrency=2)
+
+        telegram.remove_update_handler(MESSAGE_HANDLER_TYPE, my_handler)
+
+        mocked_lane.return_value.stop.assert_called_once()
+        assert telegram._handler_lanes == {}
+
+    def test_get_handler_stats(self, telegram):
+        def my_handler(update):
+            pass
+
+        with patch("telegram.client.HandlerLane") as mocked_lane:
+            mocked_lane.return_value.stats.return_value = {"processed": 3}
+            telegram.add_message_handler(my_handler, queue_size=5)
+
+        assert telegram.get_handler_stats() == [
+            {"handler_type": MESSAGE_HANDLER_TYPE, "handler": my_handler, "processed": 3},
+        ]
+
+
 class TestStop:
     # the `telegram` fixture patches `threading`, so `_stopped` has to be a real
     # event for these tests, and `_td_listener` stays a mock
@@ -717,11 +1613,22 @@ class TestStop:
         self._prepare(telegram)
 
         started = time.monotonic()
-        with pytest.raises(TimeoutError):
-            telegram._close(timeout=0.2)
+        telegram._close(timeout=0.2)
 
         assert time.monotonic() - started < 3
 
+    def test_close_does_not_raise_when_tdlib_returns_an_error(self, telegram):
+        self._prepare(telegram)
+
+        def answer_with_error(data):
+            telegram._update_async_result({"@type": "error", "code": 400, "message": "boom", "@extra": data["@extra"]})
+
+        telegram._tdjson.send.side_effect = answer_with_error
+
+        telegram._close(timeout=5)
+
+        assert telegram._tdjson.send.call_count == 1
+
     def test_close_does_not_wait_at_all_with_a_zero_timeout(self, telegram):
         self._prepare(telegram)
 
@@ -739,6 +1646,69 @@ class TestStop:
         assert telegram._tdjson.send.call_count == 1
 
 
+class TestDeferredStart:
+    def test_tdjson_is_created_on_the_first_request(self):
+        with patch("telegram.client.TDJson") as mocked_tdjson, patch("telegram.client.threading"):
+            telegram = Telegram(
+                api_id=API_ID,
+                api_hash=API_HASH,
+                phone=PHONE,
+                library_path=LIBRARY_PATH,
+                database_encryption_key=DATABASE_ENCRYPTION_KEY,
+                defer_start=True,
+            )
+
+            mocked_tdjson.assert_not_called()
+            assert not hasattr(telegram, "_td_listener")
+
+            telegram.get_me()
+            telegram.get_chats()
+
+        mocked_tdjson.assert_called_once_with(
+            library_path=LIBRARY_PATH,
+            verbosity=2,
+            object_hook=None,
+            log_file_path=None,
+            log_max_file_size=None,
+            log_forwarder=None,
+            debug_log_sample_rate=1,
+        )
+        assert telegram._tdjson.send.call_count == 2
+        telegram._td_listener.start.assert_called_once()
+
+    def test_stop_before_start_does_not_load_tdjson(self):
+        with patch("telegram.client.TDJson") as mocked_tdjson, patch("telegram.client.threading"):
+            telegram = _get_telegram_instance(defer_start=True)
+            telegram._stopped = threading.Event()
+
+            telegram.stop()
+
+            assert telegram._stopped.is_set()
+
+            with pytest.raises(ClientDestroyedError):
+                telegram.get_me()
+
+        mocked_tdjson.assert_not_called()
+
+
+def test_import_does_not_load_optional_modules():
+    # they are imported on first use, so that short-lived scripts start fast
+    modules = [
+        "telegram_text",
+        "asyncio",
+        "inspect",
+        "sqlite3",
+        "concurrent.futures",
+        "telegram.export",
+        "telegram.files",
+        "telegram.search",
+    ]
+    code = f"import sys, telegram.client; print([m for m in {modules!r} if m in sys.modules])"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+
+    assert result.stdout.strip() == "[]"
+
+
 class TestListenerExceptionHandling:
     def test_listener_survives_receive_exception(self, telegram):
         import threading
@@ -802,21 +1772,103 @@ class TestRunHandlersQueueFull:
             telegram._run_handlers({"@type": "testUpdate"})
 
 
+class TestExecute:
+    def test_execute(self, telegram):
+        result = {"@type": "text", "text": "image/png"}
+
+        with patch("telegram.client.td_execute", return_value=result) as mocked_execute:
+            assert telegram.execute("getFileMimeType", {"file_name": "cat.png"}) == result
+
+        mocked_execute.assert_called_once_with(
+            {"@type": "getFileMimeType", "file_name": "cat.png"}, library_path=LIBRARY_PATH
+        )
+        # no round trip through the listener
+        telegram._tdjson.send.assert_not_called()
+
+    def test_execute_raises_on_error(self, telegram):
+        error = {"@type": "error", "code": 400, "message": "Invalid parameter"}
+
+        with patch("telegram.client.td_execute", return_value=error), pytest.raises(RuntimeError, match="Invalid"):
+            telegram.execute("getFileMimeType", {"file_name": ""})
+
+    @pytest.mark.parametrize(
+        ("method", "args", "request_data", "result", "expected"),
+        [
+            (
+                "get_file_mime_type",
+                ("cat.png",),
+                {"@type": "getFileMimeType", "file_name": "cat.png"},
+                {"@type": "text", "text": "image/png"},
+                "image/png",
+            ),
+            (
+                "get_file_extension",
+                ("image/png",),
+                {"@type": "getFileExtension", "mime_type": "image/png"},
+                {"@type": "text", "text": "png"},
+                "png",
+            ),
+            (
+                "get_json_string",
+                ({"@type": "jsonValueNull"},),
+                {"@type": "getJsonString", "json_value": {"@type": "jsonValueNull"}},
+                {"@type": "text", "text": "null"},
+                "null",
+            ),
+            (
+                "get_text_entities",
+                ("#tag",),
+                {"@type": "getTextEntities", "text": "#tag"},
+                {"@type": "textEntities", "entities": [{"@type": "textEntity", "offset": 0, "length": 4}]},
+                [{"@type": "textEntity", "offset": 0, "length": 4}],
+            ),
+            (
+                "parse_markdown",
+                ({"@type": "formattedText", "text": "**a**", "entities": []},),
+                {"@type": "parseMarkdown", "text": {"@type": "formattedText", "text": "**a**", "entities": []}},
+                {"@type": "formattedText", "text": "a", "entities": []},
+                {"@type": "formattedText", "text": "a", "entities": []},
+            ),
+        ],
+    )
+    def test_wrappers(self, telegram, method, args, request_data, result, expected):
+        with patch("telegram.client.td_execute", return_value=result) as mocked_execute:
+            assert getattr(telegram, method)(*args) == expected
+
+        mocked_execute.assert_called_once_with(request_data, library_path=LIBRARY_PATH)
+
+    def test_execute_does_not_start_a_deferred_client(self):
+        with patch("telegram.client.TDJson") as mocked_tdjson, patch("telegram.client.threading"):
+            telegram = _get_telegram_instance(defer_start=True)
+
+            with patch("telegram.client.td_execute", return_value={"@type": "text", "text": "png"}):
+                assert telegram.get_file_extension("image/png") == "png"
+
+        mocked_tdjson.assert_not_called()
+
+    def test_send_message_parses_elements_synchronously(self, telegram):
+        formatted_text = {"@type": "formattedText", "text": "test", "entities": [{"@type": "textEntity"}]}
+
+        with patch("telegram.client.td_execute", return_value=formatted_text) as mocked_execute:
+            telegram.send_message(chat_id=1, text=Spoiler("test"))
+
+        assert mocked_execute.call_args.args[0]["@type"] == "parseTextEntities"
+        sent = telegram._tdjson.send.call_args.args[0]
+        assert sent["input_message_content"]["text"] == {
+            "@type": "formattedText",
+            "text": "test",
+            "entities": [{"@type": "textEntity"}],
+        }
+
+
 class TestSendMessageElementError:
     def test_raises_on_parse_error(self, telegram):
-        error_result = AsyncResult(client=telegram)
-        error_result.error = True
-        error_result.error_info = {"@type": "error", "message": "Bad HTML"}
-        error_result._ready.set()
+        error = {"@type": "error", "code": 400, "message": "Bad HTML"}
 
-        with patch.object(telegram, "parse_text_entities", return_value=error_result), pytest.raises(RuntimeError):
+        with patch("telegram.client.td_execute", return_value=error), pytest.raises(RuntimeError):
             telegram.send_message(chat_id=1, text=Spoiler("test"))
 
     def test_raises_on_none_update(self, telegram):
-        result = AsyncResult(client=telegram)
-        result.update = None
-        result._ready.set()
-
-        patched_parse = patch.object(telegram, "parse_text_entities", return_value=result)
+        patched_parse = patch.object(telegram, "execute", return_value=None)
         with patched_parse, pytest.raises(RuntimeError, match="Failed to parse text entities"):
             telegram.send_message(chat_id=1, text=Spoiler("test"))
@@ -1,8 +1,9 @@
+import logging
 from unittest.mock import Mock, patch
 
 import pytest
 
-from telegram.utils import AsyncResult
+from telegram.utils import DEBUG_LOG_REFRESH_INTERVAL, AsyncResult, DebugLogSampler, get_message_text, get_retry_after
 
 
 class TestAsyncResult:
@@ -109,3 +110,141 @@ class TestAsyncResult:
         async_result.error_info = "some_error"
         async_result._ready.set()
         async_result.wait(timeout=0.01)
+
+
+class TestAsyncResultEvent:
+    def test_has_no_dict(self):
+        async_result = AsyncResult(client="123")
+
+        assert not hasattr(async_result, "__dict__")
+
+    def test_event_is_created_only_for_waiting(self):
+        async_result = AsyncResult(client="123")
+        async_result.parse_update({"@type": "user"})
+
+        # already done, `wait` returns without an event
+        async_result.wait(timeout=0)
+        assert async_result._event is None
+
+    def test_wait_before_the_update(self):
+        async_result = AsyncResult(client="123")
+
+        with pytest.raises(TimeoutError):
+            async_result.wait(timeout=0.01)
+
+        assert async_result._event is not None
+
+        async_result.parse_update({"@type": "user"})
+        async_result.wait(timeout=0)
+        assert async_result._event.is_set()
+
+
+class TestAsyncResultDelivery:
+    def test_result_that_is_not_a_sent_message_is_delivered_at_once(self):
+        async_result = AsyncResult(client="123")
+        async_result.parse_update({"@type": "user", "id": 1})
+
+        assert async_result.wait_delivered(timeout=0) == {"@type": "user", "id": 1}
+        assert async_result.delivery_future().result(timeout=0) == {"@type": "user", "id": 1}
+
+    def test_error(self):
+        async_result = AsyncResult(client="123")
+        async_result.parse_update({"@type": "error", "code": 400, "message": "Chat not found"})
+
+        with pytest.raises(RuntimeError, match="Chat not found"):
+            async_result.wait_delivered(timeout=0)
+
+    def test_sent_message_waits_for_its_delivery(self):
+        async_result = AsyncResult(client="123")
+        async_result.request = {"@type": "sendMessage"}
+        async_result.parse_update(
+            {"@type": "message", "id": 1, "sending_state": {"@type": "messageSendingStatePending"}}
+        )
+        future = async_result.delivery_future()
+
+        assert async_result._is_ready()
+        assert not future.done()
+        with pytest.raises(TimeoutError):
+            async_result.wait_delivered(timeout=0.01)
+
+        async_result._set_delivered({"@type": "message", "id": 2}, None)
+
+        assert future.result(timeout=0) == {"@type": "message", "id": 2}
+        assert async_result.wait_delivered() == {"@type": "message", "id": 2}
+
+    def test_pending_message_of_another_request_is_delivered_at_once(self):
+        async_result = AsyncResult(client="123")
+        async_result.request = {"@type": "getMessage"}
+        message = {"@type": "message", "id": 1, "sending_state": {"@type": "messageSendingStatePending"}}
+        async_result.parse_update(message)
+
+        assert async_result.wait_delivered(timeout=0) == message
+
+    def test_failed_delivery(self):
+        async_result = AsyncResult(client="123")
+        async_result.parse_update(
+            {"@type": "message", "id": 1, "sending_state": {"@type": "messageSendingStatePending"}}
+        )
+        async_result._set_delivered(None, {"@type": "error", "code": 403, "message": "Forbidden"})
+
+        assert async_result.delivery_error["code"] == 403
+        with pytest.raises(RuntimeError, match="Forbidden"):
+            async_result.delivery_future().result(timeout=0)
+
+
+class TestDebugLogSampler:
+    def test_disabled(self):
+        test_logger = logging.getLogger("tests.sampler.disabled")
+        test_logger.setLevel(logging.INFO)
+        sampler = DebugLogSampler(test_logger)
+
+        assert not any(sampler() for _ in range(10))
+
+    def test_level_is_cached(self):
+        test_logger = logging.getLogger("tests.sampler.cached")
+        test_logger.setLevel(logging.DEBUG)
+        sampler = DebugLogSampler(test_logger)
+
+        with patch.object(test_logger, "isEnabledFor", wraps=test_logger.isEnabledFor) as is_enabled_for:
+            assert all(sampler() for _ in range(DEBUG_LOG_REFRESH_INTERVAL))
+            assert is_enabled_for.call_count == 1
+
+            test_logger.setLevel(logging.INFO)
+            # the new level is picked up on the next refresh
+            assert sampler() is True
+            assert sampler() is False
+            assert is_enabled_for.call_count == 2
+
+    def test_sample_rate(self):
+        test_logger = logging.getLogger("tests.sampler.sampled")
+        test_logger.setLevel(logging.DEBUG)
+        sampler = DebugLogSampler(test_logger, sample_rate=4)
+
+        assert [sampler() for _ in range(8)] == [False, False, False, True] * 2
+
+    def test_sample_rate_must_be_positive(self):
+        with pytest.raises(ValueError):
+            DebugLogSampler(logging.getLogger("tests.sampler"), sample_rate=0)
+
+
+class TestGetRetryAfter:
+    def test_flood_wait(self):
+        assert get_retry_after({"code": 429, "message": "Too Many Requests: retry after 35"}) == 35
+
+    def test_flood_wait_without_delay(self):
+        assert get_retry_after({"code": 429, "message": "Too Many Requests"}) == 1
+
+    def test_other_errors(self):
+        assert get_retry_after({"code": 400, "message": "Bad Request"}) is None
+
+
+class TestGetMessageText:
+    def test_text(self):
+        assert get_message_text({"@type": "messageText", "text": {"@type": "formattedText", "text": "hi"}}) == "hi"
+
+    def test_caption(self):
+        assert get_message_text({"@type": "messagePhoto", "caption": {"@type": "formattedText", "text": "hi"}}) == "hi"
+
+    def test_no_text(self):
+        assert get_message_text({"@type": "messageSticker"}) is None
+        assert get_message_text(None) is None